@@ -0,0 +1,165 @@
+"""
+Benchmark suite of the API.
+
+    python -m benchmarks seed --database-url sqlite:///./bench.db --posts 1000000 --reactions 10000000
+    python -m benchmarks run --database-url sqlite:///./bench.db --concurrency 32 --output before.json
+    python -m benchmarks compare before.json after.json
+    python -m benchmarks serialization --database-url sqlite:///./bench.db
+    python -m benchmarks contention --directory /tmp
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import fields
+
+import httpx
+from sqlalchemy import create_engine, func, select
+
+from .dataset import Dataset
+
+
+def seed_command(args: argparse.Namespace):
+    from .seed import seed
+    dataset = Dataset(**{f.name: getattr(args, f.name) for f in fields(Dataset)})
+    counts = seed(args.database_url, dataset, log=lambda message: print(message, file=sys.stderr))
+    print(json.dumps({"dataset": dataset.to_dict(), "rows": counts}, indent=2))
+
+
+def _dataset_size(database_url: str) -> tuple[int, int]:
+    from fastapi_social_network import models
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            users = connection.execute(select(func.max(models.User.id))).scalar() or 0
+            posts = connection.execute(select(func.max(models.Post.id))).scalar() or 0
+    finally:
+        engine.dispose()
+    return users, posts
+
+
+async def _run(args: argparse.Namespace, users: int, posts: int) -> dict:
+    from .load import run
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        hasher = None
+    else:
+        from fastapi_social_network.app import app
+        from fastapi_social_network.security import password_hasher as hasher
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                   timeout=args.timeout)
+    try:
+        async with client:
+            report = await run(client, users=users, posts=posts, concurrency=args.concurrency,
+                               duration=args.duration, warmup=args.warmup, skew=args.skew, seed=args.seed,
+                               logged_in=args.logged_in)
+    finally:
+        if hasher is not None:
+            hasher.shutdown()
+    report["meta"]["target"] = args.url or "in-process"
+    report["meta"]["dialect"] = args.database_url.split(":", 1)[0]
+    return report
+
+
+def run_command(args: argparse.Namespace):
+    users, posts = _dataset_size(args.database_url)
+    if not users or not posts:
+        raise SystemExit("Database is empty, run the seed command first")
+    report = asyncio.run(_run(args, users, posts))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+def compare_command(args: argparse.Namespace):
+    from .load import compare
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(json.dumps(compare(base, new), indent=2))
+
+
+def serialization_command(args: argparse.Namespace):
+    from sqlalchemy.orm import sessionmaker
+    from .serialization import run
+    engine = create_engine(args.database_url)
+    try:
+        report = run(sessionmaker(bind=engine), limit=args.limit, repeats=args.repeats)
+    finally:
+        engine.dispose()
+    report["meta"]["dialect"] = args.database_url.split(":", 1)[0]
+    print(json.dumps(report, indent=2))
+
+
+def contention_command(args: argparse.Namespace):
+    from .contention import run
+    report = run(args.directory, readers=args.readers, writers=args.writers, duration=args.duration)
+    print(json.dumps(report, indent=2))
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    subparsers = parser.add_subparsers(required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="Create schema and fill an empty database with a dataset")
+    seed_parser.add_argument("--database-url", required=True)
+    for f in fields(Dataset):
+        seed_parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default)
+    seed_parser.set_defaults(func=seed_command)
+
+    run_parser = subparsers.add_parser("run", help="Benchmark the API, printing a JSON report")
+    run_parser.add_argument("--database-url", required=True,
+                            help="Seeded database; served in-process unless --url is given")
+    run_parser.add_argument("--url", help="Base url of a running server using the same database")
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5.0, help="Seconds before measuring")
+    run_parser.add_argument("--skew", type=float, default=Dataset.skew)
+    run_parser.add_argument("--seed", type=int, default=Dataset.seed)
+    run_parser.add_argument("--logged-in", type=int, default=20, help="Number of users sending authorized requests")
+    run_parser.add_argument("--timeout", type=float, default=30.0)
+    run_parser.add_argument("--output", help="File to write the report to")
+    run_parser.set_defaults(func=run_command)
+
+    compare_parser = subparsers.add_parser("compare", help="Changes between two reports, in percents")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare_command)
+
+    serialization_parser = subparsers.add_parser(
+        "serialization", help="CPU time per page of list responses, with and without FAST_RESPONSES"
+    )
+    serialization_parser.add_argument("--database-url", required=True, help="Seeded database")
+    serialization_parser.add_argument("--limit", type=int, default=100, help="Items per page")
+    serialization_parser.add_argument("--repeats", type=int, default=200, help="Pages built by each path")
+    serialization_parser.set_defaults(func=serialization_command)
+
+    contention_parser = subparsers.add_parser(
+        "contention", help="Concurrent reads and writes per second on SQLite, with default and configured pragmas"
+    )
+    contention_parser.add_argument("--directory", default=".", help="Where to create the database files")
+    contention_parser.add_argument("--readers", type=int, default=8, help="Processes reading pages of posts")
+    contention_parser.add_argument("--writers", type=int, default=2, help="Processes creating posts")
+    contention_parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds of each run")
+    contention_parser.set_defaults(func=contention_command)
+
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    if getattr(args, "database_url", None):
+        # Settings are read on import, the application is imported only after this
+        os.environ["SQLALCHEMY_DATABASE_URL"] = args.database_url
+    # A few benchmark users send all the writes, far more than the per-user limit of real users
+    os.environ.setdefault("WRITE_RATE_LIMIT", "0")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
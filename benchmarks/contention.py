@@ -0,0 +1,95 @@
+"""
+Throughput of concurrent reads and writes on a SQLite database file, with SQLite default pragmas (rollback journal,
+synchronous=full) against the pragmas set by the app (SQLITE_* settings).
+"""
+import multiprocessing
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from fastapi_social_network import crud, models, schemas
+from fastapi_social_network.database import Base, get_engine_args, get_sqlite_pragmas, set_sqlite_pragmas
+
+# SQLite defaults, spelled out as the pragmas of a database file may persist (journal_mode=wal does)
+DEFAULT_PRAGMAS = {"journal_mode": "delete", "synchronous": "full", "mmap_size": 0, "cache_size": -2000}
+
+
+def _prepare(url: str, pragmas: dict, users: int, posts: int):
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **get_engine_args(url))
+    set_sqlite_pragmas(engine, pragmas)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(models.User(alias=f"user_{i}", email=f"user_{i}@mail", hashed_password="") for i in range(users))
+        db.commit()
+        db.add_all(models.Post(body=f"Post {i}", owner_id=i % users + 1) for i in range(posts))
+        db.commit()
+    return engine
+
+
+def _read(db):
+    crud.get_posts(db, limit=20)
+    db.rollback()
+
+
+def _write(db):
+    crud.create_user_post(db, schemas.PostCreate(body="Benchmark post"), user_id=1)
+
+
+def _worker(url: str, pragmas: dict, write: bool, start: float, duration: float) -> tuple[int, int]:
+    """
+    Reads or writes in a loop during duration seconds from start
+    :return: numbers of completed operations and of operations failed because the database stayed locked
+    """
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **get_engine_args(url))
+    set_sqlite_pragmas(engine, pragmas)
+    operation = _write if write else _read
+    done = errors = 0
+    try:
+        with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+            time.sleep(max(start - time.time(), 0))
+            while time.time() < start + duration:
+                try:
+                    operation(db)
+                    done += 1
+                except OperationalError:  # database is locked for longer than the busy timeout
+                    db.rollback()
+                    errors += 1
+    finally:
+        engine.dispose()
+    return done, errors
+
+
+def measure(url: str, pragmas: dict, readers: int, writers: int, duration: float, users: int = 100,
+            posts: int = 10000) -> dict:
+    """
+    Runs readers and writers in separate processes, so that they contend for database locks and not for the GIL
+    """
+    _prepare(url, pragmas, users, posts).dispose()
+    # Processes start together, once all of them are up
+    start = time.time() + 1 + (readers + writers) * 0.1
+    with multiprocessing.Pool(readers + writers) as pool:
+        results = pool.starmap(
+            _worker, [(url, pragmas, i >= readers, start, duration) for i in range(readers + writers)]
+        )
+    return {
+        "reads_per_second": round(sum(done for done, _ in results[:readers]) / duration, 1),
+        "writes_per_second": round(sum(done for done, _ in results[readers:]) / duration, 1),
+        "locked_errors": sum(errors for _, errors in results),
+    }
+
+
+def run(directory: Path, readers: int = 8, writers: int = 2, duration: float = 10.0) -> dict:
+    """
+    Measures each configuration on a new database file in directory
+    :return: report with reads and writes per second of each configuration
+    """
+    report = {"meta": {"readers": readers, "writers": writers, "duration": duration}}
+    for name, pragmas in [("default", DEFAULT_PRAGMAS), ("tuned", get_sqlite_pragmas())]:
+        path = Path(directory) / f"contention_{name}.db"
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+        report[name] = {"pragmas": pragmas, **measure(f"sqlite:///{path}", pragmas, readers, writers, duration)}
+    return report
@@ -0,0 +1,36 @@
+"""
+Benchmark dataset parameters. Kept free of application imports: settings of the application are read on import,
+so it has to be imported only after the database url is set.
+"""
+import random
+from dataclasses import dataclass, asdict
+
+BENCH_PASSWORD = "bench-password"
+WORDS = ["fastapi", "python", "sqlalchemy", "database", "index", "cache", "async", "social", "network", "post",
+         "cat", "dog", "coffee", "music", "travel", "weather", "release", "benchmark", "latency", "throughput",
+         "morning", "evening", "weekend", "project", "question", "answer", "photo", "video", "news", "game"]
+
+
+@dataclass
+class Dataset:
+    users: int = 1000
+    posts: int = 10_000
+    reactions: int = 100_000
+    follows: int = 10
+    dislike_ratio: float = 0.2
+    skew: float = 3.0
+    seed: int = 42
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def bench_alias(user_id: int) -> str:
+    return f"bench_user_{user_id}"
+
+
+def skewed_index(rng: random.Random, size: int, skew: float) -> int:
+    """
+    :return: random index in [0, size), small indexes being much more likely for skew > 1
+    """
+    return min(int(size * rng.random() ** skew), size - 1)
@@ -0,0 +1,187 @@
+"""
+Drives the API at a fixed concurrency and collects latencies per endpoint.
+"""
+import asyncio
+import platform
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable
+
+import httpx
+
+from fastapi_social_network import VERSION
+
+from .dataset import BENCH_PASSWORD, WORDS, bench_alias, skewed_index
+
+
+@dataclass
+class Context:
+    users: int
+    posts: int
+    skew: float
+    rng: random.Random
+    tokens: list[dict[str, str]] = field(default_factory=list)
+
+    def hot_post(self) -> int:
+        # Benchmark dataset ids are not shuffled here: what matters is that requests hit a skewed set of rows
+        return skewed_index(self.rng, self.posts, self.skew) + 1
+
+    def hot_user(self) -> int:
+        return skewed_index(self.rng, self.users, self.skew) + 1
+
+    def auth(self) -> dict[str, str]:
+        return self.rng.choice(self.tokens)
+
+
+Request = Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Endpoint:
+    name: str
+    weight: int
+    request: Request
+
+
+ENDPOINTS = [
+    Endpoint("GET /posts", 20, lambda client, ctx: client.get("/posts", params={"limit": 20})),
+    Endpoint("GET /posts/{post_id}", 25, lambda client, ctx: client.get(f"/posts/{ctx.hot_post()}")),
+    Endpoint("GET /users/{user_id}/posts", 10,
+             lambda client, ctx: client.get(f"/users/{ctx.hot_user()}/posts", params={"limit": 20})),
+    Endpoint("GET /posts/{post_id}/likes", 5,
+             lambda client, ctx: client.get(f"/posts/{ctx.hot_post()}/likes", params={"limit": 20})),
+    Endpoint("GET /posts/search", 5,
+             lambda client, ctx: client.get("/posts/search", params={"q": ctx.rng.choice(WORDS), "limit": 20})),
+    Endpoint("GET /users/me/feed", 10,
+             lambda client, ctx: client.get("/users/me/feed", params={"limit": 20}, headers=ctx.auth())),
+    Endpoint("PUT /posts/{post_id}/likes", 10,
+             lambda client, ctx: client.put(f"/posts/{ctx.hot_post()}/likes", headers=ctx.auth())),
+    Endpoint("PUT /posts/{post_id}/dislikes", 5,
+             lambda client, ctx: client.put(f"/posts/{ctx.hot_post()}/dislikes", headers=ctx.auth())),
+    Endpoint("POST /token", 2, lambda client, ctx: client.post("/token", data={
+        "username": bench_alias(ctx.hot_user()), "password": BENCH_PASSWORD
+    })),
+]
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * percent / 100 + 0.5), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.status_codes: dict[str, dict[str, int]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, name: str, latency: float, status_code: int | None):
+        self.latencies.setdefault(name, []).append(latency)
+        codes = self.status_codes.setdefault(name, {})
+        key = str(status_code) if status_code is not None else "exception"
+        codes[key] = codes.get(key, 0) + 1
+        # 4xx are expected, e.g. reactions to own posts
+        if status_code is None or status_code >= 500:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        def stats(latencies: list[float], errors: int, status_codes: dict | None = None) -> dict:
+            latencies = sorted(latencies)
+            result = {
+                "requests": len(latencies),
+                "errors": errors,
+                "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                    **{f"p{p}": round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)},
+                    "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+                },
+            }
+            if status_codes is not None:
+                result["status_codes"] = status_codes
+            return result
+
+        return {
+            "total": stats([latency for values in self.latencies.values() for latency in values],
+                           sum(self.errors.values())),
+            "endpoints": {name: stats(self.latencies[name], self.errors.get(name, 0), self.status_codes[name])
+                          for name in sorted(self.latencies)},
+        }
+
+
+async def _login(client: httpx.AsyncClient, ctx: Context, count: int):
+    for user_id in range(1, min(count, ctx.users) + 1):
+        response = await client.post("/token", data={"username": bench_alias(user_id), "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        ctx.tokens.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+
+async def run(client: httpx.AsyncClient, users: int, posts: int, concurrency: int = 10, duration: float = 30.0,
+              warmup: float = 5.0, skew: float = 3.0, seed: int = 42, logged_in: int = 20,
+              endpoints: list[Endpoint] | None = None) -> dict:
+    """
+    Sends requests to randomly picked endpoints (by weight) from concurrency workers, for warmup and then
+    duration seconds. Only requests sent after the warmup are recorded.
+    :return: report with throughput and latency percentiles per endpoint
+    """
+    endpoints = endpoints or ENDPOINTS
+    ctx = Context(users=users, posts=posts, skew=skew, rng=random.Random(seed))
+    await _login(client, ctx, logged_in)
+    weights = [endpoint.weight for endpoint in endpoints]
+    recorder = Recorder()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        while (now := time.perf_counter()) < deadline:
+            endpoint = ctx.rng.choices(endpoints, weights)[0]
+            status_code = None
+            try:
+                response = await endpoint.request(client, ctx)
+                status_code = response.status_code
+            except httpx.HTTPError:
+                pass
+            if now >= measure_from:
+                recorder.record(endpoint.name, time.perf_counter() - now, status_code)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report = recorder.summary(duration)
+    report["meta"] = {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "concurrency": concurrency,
+        "duration": duration,
+        "warmup": warmup,
+        "seed": seed,
+        "users": users,
+        "posts": posts,
+    }
+    return report
+
+
+def compare(base: dict, new: dict) -> list[dict]:
+    """
+    :return: per endpoint changes of throughput and latency percentiles between two reports, in percents
+    """
+    def change(old: float, value: float) -> float | None:
+        return round((value - old) / old * 100, 1) if old else None
+
+    rows = []
+    for name in sorted(base["endpoints"].keys() & new["endpoints"].keys()) + ["total"]:
+        old_stats = base["total"] if name == "total" else base["endpoints"][name]
+        new_stats = new["total"] if name == "total" else new["endpoints"][name]
+        row = {"endpoint": name,
+               "throughput_rps": change(old_stats["throughput_rps"], new_stats["throughput_rps"])}
+        for p in ("p50", "p95", "p99"):
+            row[p] = change(old_stats["latency_ms"][p], new_stats["latency_ms"][p])
+        rows.append(row)
+    return rows
@@ -0,0 +1,159 @@
+"""
+Seeds a database with a synthetic dataset for benchmarks.
+Popularity of users and posts follows a power law, so that a few of them get most of the posts, followers and
+reactions, as in real social networks.
+"""
+import random
+from datetime import datetime, timedelta
+
+from alembic import command
+from sqlalchemy import create_engine, insert, select, update, func, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from fastapi_social_network import crud, models
+from fastapi_social_network.cli import get_alembic_config
+from fastapi_social_network.config import settings
+from fastapi_social_network.security import hash_password
+
+from .dataset import BENCH_PASSWORD, WORDS, Dataset, bench_alias, skewed_index
+
+
+class _Popularity:
+    """
+    Random permutation of ids 1..size, ids at the start of it being the most popular ones
+    """
+    def __init__(self, rng: random.Random, size: int, skew: float):
+        self.rng = rng
+        self.skew = skew
+        self.ids = list(range(1, size + 1))
+        rng.shuffle(self.ids)
+
+    def pick(self) -> int:
+        return self.ids[skewed_index(self.rng, len(self.ids), self.skew)]
+
+
+def _insert_chunks(connection: Connection, table, rows, chunk_size: int) -> int:
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            connection.execute(insert(table), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def _users(dataset: Dataset):
+    # Hashing is slow by design, all users share the same password
+    hashed_password = hash_password(BENCH_PASSWORD)
+    for user_id in range(1, dataset.users + 1):
+        yield {"id": user_id, "alias": bench_alias(user_id), "email": f"{bench_alias(user_id)}@bench",
+               "hashed_password": hashed_password}
+
+
+def _posts(dataset: Dataset, rng: random.Random, authors: _Popularity, owners: list[int]):
+    start = datetime.now() - timedelta(days=365)
+    step = timedelta(days=365) / dataset.posts
+    for post_id in range(1, dataset.posts + 1):
+        owner_id = authors.pick()
+        owners.append(owner_id)
+        body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+        yield {"id": post_id, "owner_id": owner_id, "body": body, "timestamp": start + step * post_id}
+
+
+def _reactions(dataset: Dataset, rng: random.Random, posts: _Popularity, owners: list[int]):
+    per_user, extra = divmod(dataset.reactions, dataset.users)
+    for user_id in range(1, dataset.users + 1):
+        wanted = per_user + (user_id <= extra)
+        reacted = set()
+        # Users can't react to own posts, give up on a user after too many misses
+        attempts = 0
+        while len(reacted) < wanted and attempts < wanted * 10:
+            attempts += 1
+            post_id = posts.pick()
+            if post_id in reacted or owners[post_id - 1] == user_id:
+                continue
+            reacted.add(post_id)
+            yield {"post_id": post_id, "user_id": user_id, "dislike": rng.random() < dataset.dislike_ratio}
+
+
+def _follows(dataset: Dataset, users: _Popularity):
+    wanted = min(dataset.follows, dataset.users - 1)
+    for follower_id in range(1, dataset.users + 1):
+        followees = set()
+        attempts = 0
+        while len(followees) < wanted and attempts < wanted * 10:
+            attempts += 1
+            followee_id = users.pick()
+            if followee_id == follower_id or followee_id in followees:
+                continue
+            followees.add(followee_id)
+            yield {"follower_id": follower_id, "followee_id": followee_id}
+
+
+def _fill_derived(connection: Connection):
+    """
+    Fills stored counters, timelines and the search index the same way as the API would
+    """
+    followers_count = select(func.count(1))\
+        .filter(models.Follow.followee_id == models.User.id)\
+        .scalar_subquery()
+    connection.execute(update(models.User).values(followers_count=followers_count))
+    crud.rebuild_reaction_counts(Session(bind=connection))
+    crud.rebuild_user_stats(Session(bind=connection))
+
+    timeline_columns = ["user_id", "post_id", "timestamp"]
+    own_posts = select(models.Post.owner_id, models.Post.id, models.Post.timestamp)
+    connection.execute(insert(models.TimelineEntry).from_select(timeline_columns, own_posts))
+    # Posts of popular users are merged into feeds on read
+    followed_posts = select(models.Follow.follower_id, models.Post.id, models.Post.timestamp)\
+        .join(models.Post, models.Post.owner_id == models.Follow.followee_id)\
+        .join(models.User, models.User.id == models.Follow.followee_id)\
+        .filter(models.User.followers_count <= settings.feed_fanout_max_followers)
+    connection.execute(insert(models.TimelineEntry).from_select(timeline_columns, followed_posts))
+
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("INSERT INTO posts_fts (rowid, body) SELECT id, body FROM posts"))
+    elif connection.dialect.name == "postgresql":
+        # Ids were inserted explicitly, move sequences past them
+        for table in ("users", "posts"):
+            connection.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                    f"(SELECT coalesce(max(id), 1) FROM {table}))"))
+
+
+def seed(url: str, dataset: Dataset, chunk_size: int = 10_000, log=print) -> dict[str, int]:
+    """
+    Migrates the database at url and fills it with the dataset. The database must not have any users yet.
+    :return: number of inserted rows by table
+    """
+    cfg = get_alembic_config()
+    cfg.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    command.upgrade(cfg, "head")
+
+    rng = random.Random(dataset.seed)
+    engine = create_engine(url)
+    counts = {}
+    try:
+        with engine.begin() as connection:
+            if connection.execute(select(func.count(1)).select_from(models.User)).scalar():
+                raise RuntimeError("Database already has users, benchmarks need an empty one")
+            owners = []
+            for table, rows in [
+                (models.User.__table__, _users(dataset)),
+                (models.Post.__table__, _posts(dataset, rng, _Popularity(rng, dataset.users, dataset.skew), owners)),
+                (models.PostReaction.__table__,
+                 _reactions(dataset, rng, _Popularity(rng, dataset.posts, dataset.skew), owners)),
+                (models.Follow.__table__, _follows(dataset, _Popularity(rng, dataset.users, dataset.skew))),
+            ]:
+                counts[table.name] = _insert_chunks(connection, table, rows, chunk_size)
+                log(f"Inserted {counts[table.name]} rows into {table.name}")
+            _fill_derived(connection)
+            log("Filled counters, timelines and search index")
+    finally:
+        engine.dispose()
+    return counts
@@ -0,0 +1,179 @@
+"""
+Admission control: caps concurrent requests of each class of routes (password hashing, other writes, reads), so that
+when the database slows down, excess requests are turned away early instead of all of them timing out together.
+Requests over the cap wait briefly in a bounded queue, then get 503 with Retry-After.
+Write requests of each authenticated user are also rate limited with a token bucket (429 with Retry-After).
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, Hashable
+
+from fastapi.responses import JSONResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .cache import TTLCache
+from .config import settings
+from .dependencies import SAFE_METHODS, get_token_user_id
+from .query_budget import route_template
+
+
+class RouteClass(str, Enum):
+    auth = "auth"
+    write = "write"
+    read = "read"
+
+
+# Routes hashing passwords, limited separately as they are CPU bound
+AUTH_ROUTES = {("POST", "/token"), ("POST", "/users")}
+# Long-lived and monitoring routes, never limited
+EXEMPT_ROUTES = {"/events", "/metrics"}
+
+
+def route_class(method: str, route: str) -> RouteClass:
+    if (method, route) in AUTH_ROUTES:
+        return RouteClass.auth
+    return RouteClass.read if method in SAFE_METHODS else RouteClass.write
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most limit requests run at once; others wait in order, at most queue_size of them and for at most
+    timeout seconds each. Used from a single event loop.
+    """
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """
+        :return: True if the request may run, and release() must be called after it; False if it is rejected
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the request was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        # The slot is handed over to the first waiter still waiting, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict[str, int]:
+        return {"in_flight": self.in_flight, "waiting": len(self._waiters), "rejected": self.rejected}
+
+
+class TokenBuckets:
+    """
+    Token bucket of each key, refilled with rate tokens per second up to burst tokens; rate of 0 disables limiting.
+    Buckets unused long enough to be full again are dropped.
+    """
+    def __init__(self, rate: float, burst: int, timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.timer = timer
+        self._buckets = TTLCache(maxsize=100000, ttl=burst / rate if rate > 0 else 0, timer=timer)
+
+    def take(self, key: Hashable) -> float:
+        """
+        :return: 0 if a token was taken, otherwise seconds until the next token
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = self.timer()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+
+limiters = {
+    RouteClass.auth: ConcurrencyLimiter(settings.admission_auth_limit, settings.admission_queue_size,
+                                        settings.admission_queue_timeout),
+    RouteClass.write: ConcurrencyLimiter(settings.admission_write_limit, settings.admission_queue_size,
+                                         settings.admission_queue_timeout),
+    RouteClass.read: ConcurrencyLimiter(settings.admission_read_limit, settings.admission_queue_size,
+                                        settings.admission_queue_timeout),
+}
+write_buckets = TokenBuckets(rate=settings.write_rate_limit, burst=settings.write_burst)
+
+
+def _user_id(scope: Scope) -> int | None:
+    scheme, token = get_authorization_scheme_param(Headers(scope=scope).get("Authorization"))
+    return get_token_user_id(token) if scheme.lower() == "bearer" else None
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the concurrency limit of the route class and the write rate limit of the user
+    """
+    def __init__(self, app: ASGIApp, limits: dict[RouteClass, ConcurrencyLimiter] | None = None,
+                 buckets: TokenBuckets | None = None):
+        self.app = app
+        self.limiters = limiters if limits is None else limits
+        self.write_buckets = write_buckets if buckets is None else buckets
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_template(scope)
+        if route in EXEMPT_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        cls = route_class(method, route)
+        if cls == RouteClass.write:
+            user_id = _user_id(scope)
+            wait = 0.0 if user_id is None else self.write_buckets.take(user_id)
+            if wait:
+                response = JSONResponse({"detail": "Too many write requests"}, status_code=429,
+                                        headers={"Retry-After": str(math.ceil(wait))})
+                await response(scope, receive, send)
+                return
+        limiter = self.limiters.get(cls)
+        if limiter is None or limiter.limit <= 0:
+            await self.app(scope, receive, send)
+            return
+        if not await limiter.acquire():
+            response = JSONResponse({"detail": "Server is overloaded, try again later"}, status_code=503,
+                                    headers={"Retry-After": str(max(math.ceil(limiter.timeout), 1))})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
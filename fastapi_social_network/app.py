@@ -1,7 +1,39 @@
 from fastapi import FastAPI
+from . import events, reaction_buffer
+from .admission import AdmissionMiddleware
+from .compression import CompressionMiddleware
+from .config import settings
+from .query_budget import QueryBudgetMiddleware
 from .routers import main_router
+from .security import password_hasher
 
 
 app = FastAPI()
 
 app.include_router(main_router.router)
+app.include_router(events.router)
+app.add_middleware(QueryBudgetMiddleware, budgets=main_router.QUERY_BUDGETS)
+app.add_middleware(AdmissionMiddleware)
+if settings.compression_enabled:
+    app.add_middleware(CompressionMiddleware)
+
+if settings.metrics_enabled:
+    from . import metrics
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.router)
+
+
+@app.on_event("startup")
+async def start_reaction_buffer():
+    if settings.reaction_buffer_enabled:
+        await reaction_buffer.buffer.start()
+
+
+@app.on_event("shutdown")
+async def stop_reaction_buffer():
+    await reaction_buffer.buffer.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
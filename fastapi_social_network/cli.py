@@ -0,0 +1,104 @@
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+
+from . import crud, export
+from .config import settings
+from .database import SessionLocal
+
+
+def get_alembic_config() -> Config:
+    """
+    Alembic configuration that does not depend on alembic.ini being in the working directory
+    :return: Config pointing to the packaged migrations and the configured database
+    """
+    cfg = Config()
+    cfg.set_main_option("script_location", str(Path(__file__).parent / "migrations"))
+    cfg.set_main_option("sqlalchemy.url", settings.sqlalchemy_database_url.replace("%", "%%"))
+    return cfg
+
+
+def migrate(args: argparse.Namespace):
+    command.upgrade(get_alembic_config(), args.revision)
+
+
+def rebuild_counters(args: argparse.Namespace):
+    db = SessionLocal()
+    try:
+        updated = crud.rebuild_reaction_counts(db)
+    finally:
+        db.close()
+    print(f"Rebuilt reaction counters and trending scores of {updated} posts")
+
+
+def rebuild_user_stats(args: argparse.Namespace):
+    db = SessionLocal()
+    try:
+        updated = crud.rebuild_user_stats(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt stats of {updated} users")
+
+
+EXPORT_FILTERS = ("after_id", "since")
+
+
+def export_table(args: argparse.Namespace):
+    table_export = export.EXPORTS[args.table]
+    for name in EXPORT_FILTERS:
+        if name != table_export.filter and getattr(args, name) is not None:
+            sys.exit(f"--{name.replace('_', '-')} does not apply to {args.table}")
+    statement = table_export.statement(getattr(args, table_export.filter))
+    db = SessionLocal()
+    try:
+        if args.output == "-":
+            export.write_ndjson(db, statement, sys.stdout)
+        else:
+            with open(args.output, "w") as output:
+                export.write_ndjson(db, statement, output)
+    finally:
+        db.close()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="fastapi-social-network")
+    subparsers = parser.add_subparsers(required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Upgrade the database schema")
+    migrate_parser.add_argument("revision", nargs="?", default="head", help="Target revision (default: head)")
+    migrate_parser.set_defaults(func=migrate)
+
+    rebuild_counters_parser = subparsers.add_parser(
+        "rebuild-counters", help="Recompute stored likes/dislikes counters and trending scores of posts"
+    )
+    rebuild_counters_parser.set_defaults(func=rebuild_counters)
+
+    rebuild_user_stats_parser = subparsers.add_parser(
+        "rebuild-user-stats", help="Recompute stored post and reaction counts of users"
+    )
+    rebuild_user_stats_parser.set_defaults(func=rebuild_user_stats)
+
+    export_parser = subparsers.add_parser("export", help="Write all rows of a table as NDJSON")
+    export_parser.add_argument("table", choices=export.EXPORTS.keys())
+    export_parser.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export_parser.add_argument("--after-id", type=int, help="Export only users with greater ids")
+    export_parser.add_argument("--since", type=datetime.fromisoformat,
+                               help="Export only posts created since, or reactions to them (ISO 8601)")
+    export_parser.set_defaults(func=export_table)
+
+    return parser
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
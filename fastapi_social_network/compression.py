@@ -0,0 +1,170 @@
+"""
+Compression of response bodies negotiated with Accept-Encoding: brotli when the optional brotli package is installed
+("brotli" extra) and preferred by the client, gzip otherwise. Bodies smaller than the minimum size are sent as they
+are, as compressing them saves less than it costs. Streamed responses are compressed chunk by chunk, except
+Server-Sent Events which must reach clients as soon as they are sent.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # optional dependency, installed with the "brotli" extra
+    brotli = None
+
+GZIP_LEVEL = 6
+# Higher qualities compress API responses only slightly better, for several times the CPU
+BROTLI_QUALITY = 4
+
+# Content types never compressed: already compressed, or streamed to clients message by message
+SKIPPED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def available_encodings() -> tuple[str, ...]:
+    """
+    :return: supported content codings, in order of preference
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str, encodings: tuple[str, ...] | None = None) -> str | None:
+    """
+    :param accept_encoding: value of the Accept-Encoding request header, e.g. "gzip;q=0.8, br"
+    :param encodings: supported content codings in order of preference, available_encodings() by default
+    :return: the supported coding with the highest quality accepted by the client, None if there is none
+    """
+    if encodings is None:
+        encodings = available_encodings()
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding] = quality
+    default = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = qualities.get(coding, default)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        # Flushed so that each chunk of a streamed response can be decoded as soon as it is received
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+COMPRESSORS = {"gzip": GzipCompressor, "br": BrotliCompressor}
+
+
+class CompressionMiddleware:
+    """
+    Compresses HTTP response bodies of at least minimum_size bytes with the coding negotiated by negotiate_encoding
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = settings.compression_minimum_size):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressingSend(send, encoding, self.minimum_size))
+
+
+class CompressingSend:
+    """
+    send of a single response, holding back its start and first body chunks until the body is known to be large
+    enough to be compressed, or to be complete
+    """
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Message | None = None
+        self.buffer = bytearray()
+        self.compressor: GzipCompressor | BrotliCompressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if message["status"] in (204, 304) or "content-encoding" in headers \
+                    or content_type.startswith(SKIPPED_CONTENT_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.compressor is not None:
+            data = self.compressor.compress(body)
+            if not more_body:
+                data += self.compressor.finish()
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+        self.buffer += body
+        if len(self.buffer) < self.minimum_size:
+            if more_body:
+                return
+            # Complete and too small
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": bytes(self.buffer), "more_body": False})
+            return
+        self.compressor = COMPRESSORS[self.encoding]()
+        data = self.compressor.compress(bytes(self.buffer))
+        if not more_body:
+            data += self.compressor.finish()
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(data))
+        # Compressed bodies differ byte by byte from the tagged ones, their tags are only weak validators
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -6,13 +6,102 @@ from pydantic import BaseSettings
 class Environment(str, Enum):
     prod = "prod"
     dev = "dev"
+    test = "test"
+
+
+class HashingExecutor(str, Enum):
+    thread = "thread"
+    process = "process"
+
+
+class SQLiteJournalMode(str, Enum):
+    delete = "delete"
+    truncate = "truncate"
+    persist = "persist"
+    memory = "memory"
+    wal = "wal"
+    off = "off"
+
+
+class SQLiteSynchronous(str, Enum):
+    off = "off"
+    normal = "normal"
+    full = "full"
+    extra = "extra"
 
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str = "sqlite:///./sql_app.db"
+    # Read replicas of the database used by read-only routes, in turn (a JSON list in the environment)
+    sqlalchemy_replica_urls: list[str] = []
+    # Seconds after a write request of a user during which their read-only requests still use the primary database
+    replica_sticky_seconds: float = 5.0
     sqlalchemy_echo: bool = False
+    # Connection pool of each database engine (except in-memory SQLite); recycle of -1 keeps connections forever
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    # Pragmas set on each SQLite connection. WAL lets readers proceed during a write, and with synchronous=normal
+    # commits are not synced to disk until checkpoints (durable against app crashes, not power loss).
+    sqlite_journal_mode: SQLiteJournalMode = SQLiteJournalMode.wal
+    sqlite_synchronous: SQLiteSynchronous = SQLiteSynchronous.normal
+    # Bytes of the database file memory-mapped for reads, 0 disables it
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # Page cache of each connection: pages if positive, KiB if negative
+    sqlite_cache_size: int = -64 * 1024
     app_env: Environment = Environment.dev
     secret_key: str = f"{'_not_a_secret_':x^64}"
+    password_hash_executor: HashingExecutor = HashingExecutor.thread
+    # Max number of concurrent password hashing operations, number of CPUs by default
+    password_hash_workers: int | None = None
+    # Authenticated users cache; size of 0 disables it
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60.0
+    # Cache of rendered post and user responses; size of 0 disables it
+    response_cache_size: int = 10000
+    response_cache_ttl: float = 10.0
+    # Posts of users with more followers are not written into timelines of each follower, but merged on read
+    feed_fanout_max_followers: int = 10000
+    # Number of latest posts of a user added to the timeline of a new follower
+    feed_backfill_posts: int = 100
+    # Age of a post worth 10 times more net likes in trending posts ranking; run rebuild-counters after changing
+    trending_decay_hours: float = 12.0
+    # Prometheus metrics of requests and database usage, served on /metrics
+    metrics_enabled: bool = True
+    # Default max number of SQL statements per request, and of executions of the same statement (N+1 queries).
+    # Exceeding requests are logged in prod and fail in dev/test.
+    query_budget_statements: int = 12
+    query_budget_repeats: int = 2
+    # Max concurrent requests of routes hashing passwords, of other writes and of reads; 0 disables a limit
+    admission_auth_limit: int = 16
+    admission_write_limit: int = 64
+    admission_read_limit: int = 256
+    # Requests over a limit wait for up to admission_queue_timeout seconds, at most admission_queue_size of them for
+    # each limit; others are rejected with 503
+    admission_queue_size: int = 128
+    admission_queue_timeout: float = 1.0
+    # Write requests per second of each user, in bursts of up to write_burst requests; rate of 0 disables the limit
+    write_rate_limit: float = 5.0
+    write_burst: int = 30
+    # Reactions are buffered in memory and written in batches every reaction_buffer_flush_ms milliseconds or once
+    # reaction_buffer_max_items changes are waiting. Changes not written on shutdown are saved to the fallback file.
+    reaction_buffer_enabled: bool = False
+    reaction_buffer_flush_ms: int = 100
+    reaction_buffer_max_items: int = 1000
+    # Changes over this many waiting, e.g. while the database is down, are written by the requests themselves
+    reaction_buffer_max_pending: int = 100000
+    reaction_buffer_fallback_path: str = "./reaction_buffer.ndjson"
+    # Max number of events waiting to be sent to a client of /events or /ws/events before it is disconnected
+    events_queue_size: int = 1000
+    # Seconds without events after which an SSE comment is sent, so that proxies keep the connection open
+    events_keepalive_seconds: float = 15.0
+    # List routes return rows encoded with orjson instead of ORM objects validated by response_model; needs orjson
+    fast_responses: bool = False
+    # Response bodies of at least compression_minimum_size bytes are compressed with gzip, or brotli if installed
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024
 
 
 settings = Settings()
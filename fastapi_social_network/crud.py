@@ -1,16 +1,115 @@
+import math
+import re
+from collections import Counter, defaultdict
 from datetime import datetime
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, insert, update, delete, func, case, cast, literal, literal_column, or_, and_, \
+    bindparam, exists, extract, true, Boolean, DateTime, Float, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, Query, selectinload
+from sqlalchemy.sql import Select, Update
 
-from . import models, schemas, security
+from . import events, models, schemas, security
+from .config import settings
+from .response_cache import response_cache
 
 
 class NoPermission(Exception):
     pass
 
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+def _invalidate_post_responses(post_id: int | None = None):
+    """
+    Drops cached responses of a Post (if given) and all cached pages of Post lists
+    """
+    if post_id is not None:
+        response_cache.invalidate("post", post_id)
+    response_cache.invalidate("posts")
+
+
+def _typed(value, type_):
+    """
+    Bound parameter with an explicit cast. Needed where the database cannot infer the type of a parameter
+    (SELECT lists, CASE results) when statements are prepared server-side, as asyncpg does.
+    """
+    return cast(literal(value), type_)
+
+
+# Columns of Posts and Users in order of schemas.Post and schemas.User, for reads returning rows
+# instead of ORM objects (rows=True): no identity map and no validation of each attribute on serialization
+POST_COLUMNS = (models.Post.body, models.Post.id, models.Post.timestamp, models.Post.owner_id,
+                models.Post.likes_count.label("likes"), models.Post.dislikes_count.label("dislikes"))
+USER_COLUMNS = (models.User.alias, models.User.id)
+
+
+def _row_columns(columns: tuple, fields: tuple[str, ...] | None, key_columns: tuple) -> tuple:
+    """
+    :param fields: names of the columns to select, all by default
+    :param key_columns: columns of the pagination key, selected as well for cursors of next pages
+    """
+    if fields is not None:
+        columns = tuple(column for column in columns if column.key in fields)
+    selected = {column.key for column in columns}
+    return columns + tuple(column for column in key_columns if column.key not in selected)
+
+
+def _posts_query(db: Session, rows: bool = False, expand_owner: bool = False, fields: tuple[str, ...] | None = None,
+                 key_columns: tuple = (models.Post.timestamp, models.Post.id)) -> Query:
+    """
+    :param expand_owner: load owners of the Posts, with one query for all of them; not with rows
+    :param fields: with rows, names of the schemas.Post fields to select, all by default
+    """
+    if rows:
+        return db.query(*_row_columns(POST_COLUMNS, fields, key_columns))
+    query = db.query(models.Post)
+    return query.options(selectinload(models.Post.owner)) if expand_owner else query
+
+
+def _users_query(db: Session, rows: bool = False, fields: tuple[str, ...] | None = None) -> Query:
+    """
+    :param fields: with rows, names of the schemas.User fields to select, all by default
+    """
+    if rows:
+        return db.query(*_row_columns(USER_COLUMNS, fields, (models.User.id,)))
+    return db.query(models.User)
+
+
+# Pagination
+def _paginate_by_id(query: Query, model, skip: int, limit: int, cursor: tuple | None):
+    """
+    Orders query by id, continuing after cursor (id,) if provided
+    """
+    query = query.order_by(model.id)
+    if cursor is not None:
+        last_id, = cursor
+        query = query.filter(model.id > last_id)
+    return query.offset(skip).limit(limit).all()
+
+
+def _before_cursor(key_column, id_column, cursor: tuple):
+    """
+    :return: condition selecting rows following cursor (key, id) when sorted by key and id descending,
+    e.g. Posts older than the one of cursor (timestamp, id)
+    """
+    last_key, last_id = cursor
+    return or_(
+        key_column < last_key,
+        and_(key_column == last_key, id_column < last_id)
+    )
+
+
+def _paginate_posts(query: Query, skip: int, limit: int, cursor: tuple | None):
+    """
+    Orders query by newest Posts first, continuing after cursor (timestamp, id) if provided
+    """
+    query = query.order_by(models.Post.timestamp.desc(), models.Post.id.desc())
+    if cursor is not None:
+        query = query.filter(_before_cursor(models.Post.timestamp, models.Post.id, cursor))
+    return query.offset(skip).limit(limit).all()
+
+
+def get_user(db: Session, user_id: int, rows: bool = False, fields: tuple[str, ...] | None = None):
+    return _users_query(db, rows, fields).filter(models.User.id == user_id).first()
 
 
 def get_user_by_email(db: Session, email: str):
@@ -21,43 +120,137 @@ def get_user_by_alias(db: Session, alias: str) -> models.User | None:
     return db.query(models.User).filter(models.User.alias == alias).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users_by_ids(db: Session, user_ids: list[int], rows: bool = False, fields: tuple[str, ...] | None = None):
+    """
+    :return: existing Users with given ids, in order of the ids
+    """
+    users = {user.id: user for user in _users_query(db, rows, fields).filter(models.User.id.in_(user_ids))}
+    return [users[user_id] for user_id in dict.fromkeys(user_ids) if user_id in users]
+
+
+def get_users(db: Session, skip: int = 0, limit: int = 100, cursor: tuple | None = None, rows: bool = False,
+              fields: tuple[str, ...] | None = None):
+    return _paginate_by_id(_users_query(db, rows, fields), models.User, skip, limit, cursor)
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.hash_password(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str | None = None):
+    if hashed_password is None:
+        hashed_password = security.hash_password(user.password)
     db_user = models.User(
         email=user.email,
         alias=user.alias,
         hashed_password=hashed_password
     )
     db.add(db_user)
+    db.flush()
+    db.add(models.UserStats(user_id=db_user.id))
     db.commit()
     db.refresh(db_user)
     return db_user
 
 
-def get_posts(db: Session, skip: int = 0, limit: int = 100, user_id: int | None = None):
+def get_posts(db: Session, skip: int = 0, limit: int = 100, user_id: int | None = None,
+              cursor: tuple | None = None, rows: bool = False, expand_owner: bool = False,
+              fields: tuple[str, ...] | None = None):
+    query = _posts_query(db, rows, expand_owner, fields)
     if user_id is not None:
-        return db.query(models.Post).options(joinedload(models.Post.reactions)).filter(models.Post.owner_id == user_id)\
-            .offset(skip).limit(limit).all()
-    return db.query(models.Post).options(joinedload(models.Post.reactions)).offset(skip).limit(limit).all()
+        query = query.filter(models.Post.owner_id == user_id)
+    return _paginate_posts(query, skip, limit, cursor)
 
 
-def get_post(db: Session, post_id: int):
-    return db.query(models.Post).options(joinedload(models.Post.reactions)).filter(models.Post.id == post_id).first()
+def get_post(db: Session, post_id: int, rows: bool = False, expand_owner: bool = False,
+             fields: tuple[str, ...] | None = None):
+    return _posts_query(db, rows, expand_owner, fields, key_columns=(models.Post.id,))\
+        .filter(models.Post.id == post_id)\
+        .first()
+
+
+def get_posts_by_ids(db: Session, post_ids: list[int], rows: bool = False, expand_owner: bool = False,
+                     fields: tuple[str, ...] | None = None):
+    """
+    :return: existing Posts with given ids, in order of the ids
+    """
+    query = _posts_query(db, rows, expand_owner, fields, key_columns=(models.Post.id,))\
+        .filter(models.Post.id.in_(post_ids))
+    posts = {post.id: post for post in query}
+    return [posts[post_id] for post_id in dict.fromkeys(post_ids) if post_id in posts]
+
+
+# Search
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _index_post_body(db: Session, post_id: int, body: str | None):
+    """
+    Writes Post body into the SQLite search table in the current transaction.
+    PostgreSQL search index is an expression index and is kept up to date by the database.
+    """
+    if _is_sqlite(db):
+        _unindex_post_body(db, post_id)
+        db.execute(insert(models.posts_fts).values(rowid=post_id, body=body))
+
+
+def _unindex_post_body(db: Session, post_id: int):
+    if _is_sqlite(db):
+        db.execute(delete(models.posts_fts).where(models.posts_fts.c.rowid == post_id))
+
+
+def _fts5_query(text: str) -> str:
+    """
+    :return: FTS5 query matching documents with all words of text, ignoring FTS5 query syntax
+    """
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+def search_posts(db: Session, text: str, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                 rows: bool = False, fields: tuple[str, ...] | None = None):
+    """
+    Full-text search of Posts by body, best matches first, continuing after cursor (score, id) if provided
+    :return: list of (Post, score) pairs, higher score is a better match; Posts are rows if rows, as in get_posts
+    """
+    columns = _row_columns(POST_COLUMNS, fields, (models.Post.id,)) if rows else (models.Post,)
+    if _is_sqlite(db):
+        fts_query = _fts5_query(text)
+        if not fts_query:
+            return []
+        # bm25 rank of FTS5 is lower for better matches
+        score = (-models.posts_fts.c.rank).label("score")
+        query = db.query(*columns, score) \
+            .select_from(models.posts_fts) \
+            .join(models.Post, models.Post.id == models.posts_fts.c.rowid) \
+            .filter(models.posts_fts.c.body.match(fts_query))
+    else:
+        vector = models.post_search_vector(models.Post.body)
+        ts_query = func.websearch_to_tsquery(literal_column(f"'{models.POST_SEARCH_CONFIG}'"), text)
+        score = func.ts_rank(vector, ts_query).label("score")
+        query = db.query(*columns, score).filter(vector.op("@@")(ts_query))
+    query = query.order_by(score.element.desc(), models.Post.id.desc())
+    if cursor is not None:
+        query = query.filter(_before_cursor(score.element, models.Post.id, cursor))
+    results = query.offset(skip).limit(limit).all()
+    if rows:
+        return [(row, row.score) for row in results]
+    return [(post, post_score) for post, post_score in results]
 
 
 def create_user_post(db: Session, post: schemas.PostCreate, user_id: int):
+    timestamp = datetime.now()
     db_post = models.Post(
         body=post.body,
         owner_id=user_id,
-        timestamp=datetime.now()
+        timestamp=timestamp,
+        trending_score=trending_score(0, 0, timestamp)
     )
     db.add(db_post)
+    db.flush()
+    _fan_out_post(db, db_post)
+    _index_post_body(db, db_post.id, db_post.body)
+    _update_user_stats(db, {user_id: {"posts_count": 1}})
     db.commit()
     db.refresh(db_post)
+    _invalidate_post_responses()
+    events.broker.publish(events.post_created(db_post))
     return db_post
 
 
@@ -69,74 +262,768 @@ def edit_user_post(db: Session, post_id: int, post: schemas.PostBase, user_id: i
         raise NoPermission()
     db_post.body = post.body
     db.add(db_post)
+    _index_post_body(db, post_id, post.body)
     db.commit()
     db.refresh(db_post)
+    _invalidate_post_responses(post_id)
+    events.broker.publish(events.post_updated(db_post))
     return db_post
 
 
 def delete_user_post(db: Session, post_id: int, user_id: int):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+    # Locked on PostgreSQL so that reactions to the Post do not change until commit. SQLite ignores the lock: reactions
+    # subtracted from stats of Users are counted by the UPDATE statements below, which hold the write lock
+    db_post = db.query(models.Post).filter(models.Post.id == post_id).with_for_update().first()
     if not db_post:
         return False
     if db_post.owner_id != user_id:
         raise NoPermission()
+
+    def reactions(dislike: bool):
+        return select(func.count(1))\
+            .filter(models.PostReaction.post_id == post_id)\
+            .filter(models.PostReaction.dislike == dislike)\
+            .scalar_subquery()
+
+    db.query(models.UserStats).filter(models.UserStats.user_id == user_id).update({
+        models.UserStats.posts_count: models.UserStats.posts_count - 1,
+        models.UserStats.likes_received: models.UserStats.likes_received - reactions(False),
+        models.UserStats.dislikes_received: models.UserStats.dislikes_received - reactions(True)
+    }, synchronize_session=False)
+    likers = select(models.PostReaction.user_id)\
+        .filter(models.PostReaction.post_id == post_id)\
+        .filter(models.PostReaction.dislike == False)
+    db.query(models.UserStats).filter(models.UserStats.user_id.in_(likers)).update({
+        models.UserStats.likes_given: models.UserStats.likes_given - 1
+    }, synchronize_session=False)
+    db.query(models.TimelineEntry).filter(models.TimelineEntry.post_id == post_id).delete(synchronize_session=False)
+    _unindex_post_body(db, post_id)
     db.delete(db_post)
     db.commit()
+    _invalidate_post_responses(post_id)
+    events.broker.publish(events.post_deleted(post_id))
     return True
 
 
+# Trending
+TRENDING_EPOCH = datetime(2023, 1, 1)
+
+
+def trending_score(likes: int, dislikes: int, timestamp: datetime | None) -> float:
+    """
+    Time-decayed score of a Post, in log scale: every trending_decay_hours of Post age weigh as much as
+    10 times more (likes - dislikes), roughly. Depends only on stored columns of the Post and not on the current time,
+    so it is kept up to date when reactions change and Posts can be ranked by an index.
+    """
+    net = likes - dislikes
+    order = math.log10(1 + abs(net))
+    sign = (net > 0) - (net < 0)
+    age = ((timestamp or TRENDING_EPOCH) - TRENDING_EPOCH).total_seconds()
+    return sign * order + age / (settings.trending_decay_hours * 3600)
+
+
+def _trending_score_postgresql(likes, dislikes, timestamp):
+    """
+    trending_score() as a PostgreSQL expression, of SQL expressions of the counters and timestamp of a Post
+    """
+    net = cast(likes - dislikes, Float)
+    epoch = _typed(TRENDING_EPOCH, DateTime)
+    age = cast(extract("epoch", func.coalesce(timestamp, epoch) - epoch), Float)
+    # log() of a double precision number is base 10 in PostgreSQL
+    return func.sign(net) * func.log(_typed(1.0, Float) + func.abs(net)) \
+        + age / _typed(settings.trending_decay_hours * 3600, Float)
+
+
+def _update_trending_score(db_post: models.Post):
+    """
+    Sets the trending score of a Post from its current counters, written on flush.
+    Counters are read in the same transaction after being updated, which locks the row until commit.
+    """
+    db_post.trending_score = trending_score(db_post.likes_count, db_post.dislikes_count, db_post.timestamp)
+
+
+def get_trending_posts(db: Session, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                       rows: bool = False, expand_owner: bool = False, fields: tuple[str, ...] | None = None):
+    """
+    :return: Posts with the highest trending score first, continuing after cursor (score, id) if provided
+    """
+    query = _posts_query(db, rows, expand_owner, fields, key_columns=(models.Post.trending_score, models.Post.id))\
+        .order_by(models.Post.trending_score.desc(), models.Post.id.desc())
+    if cursor is not None:
+        query = query.filter(_before_cursor(models.Post.trending_score, models.Post.id, cursor))
+    return query.offset(skip).limit(limit).all()
+
+
+def rebuild_trending_scores(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Recomputes trending scores of all Posts, e.g. after changing trending_decay_hours. Does not commit.
+    :return: number of updated Posts
+    """
+    posts = db.query(models.Post.id, models.Post.likes_count, models.Post.dislikes_count, models.Post.timestamp)\
+        .order_by(models.Post.id)
+    score_update = update(models.Post.__table__)\
+        .where(models.Post.__table__.c.id == bindparam("post_id"))\
+        .values(trending_score=bindparam("score"))
+    updated = 0
+    last_id = 0
+    while chunk := posts.filter(models.Post.id > last_id).limit(chunk_size).all():
+        db.execute(score_update, [
+            {"post_id": post_id, "score": trending_score(likes, dislikes, timestamp)}
+            for post_id, likes, dislikes, timestamp in chunk
+        ])
+        updated += len(chunk)
+        last_id = chunk[-1].id
+    return updated
+
+
+# User stats
+USER_STATS_COUNTERS = ("posts_count", "likes_received", "dislikes_received", "likes_given")
+
+
+def _user_stats_update(changes: Select) -> Update:
+    """
+    :param changes: select of user_id and changes of USER_STATS_COUNTERS, with these labels
+    :return: statement adding changes to stored counters of the Users. Users without a stats row are left without,
+        their stats are computed by get_user_stats: a row holding only the changes would be wrong
+    """
+    changes = changes.cte("stats_changes")
+    stats = models.UserStats.__table__
+
+    def change(counter: str):
+        # Correlated rather than UPDATE ... FROM, which SQLAlchemy does not compile for SQLite
+        return select(changes.c[counter]).filter(changes.c.user_id == stats.c.user_id).scalar_subquery()
+
+    return update(stats)\
+        .where(stats.c.user_id.in_(select(changes.c.user_id)))\
+        .values({counter: stats.c[counter] + change(counter) for counter in USER_STATS_COUNTERS})
+
+
+def _update_user_stats(db: Session, changes: dict[int, dict[str, int]]):
+    """
+    Adjusts stored counters of Users in the current transaction, relative to the stored values
+    :param changes: changes of USER_STATS_COUNTERS by User id, missing counters are not changed
+    """
+    rows = [
+        {"stats_user_id": user_id, **{f"{counter}_change": change.get(counter, 0) for counter in USER_STATS_COUNTERS}}
+        for user_id, change in changes.items() if any(change.values())
+    ]
+    if not rows:
+        return
+    stats = models.UserStats.__table__
+    db.execute(
+        update(stats)
+        .where(stats.c.user_id == bindparam("stats_user_id"))
+        .values({counter: stats.c[counter] + bindparam(f"{counter}_change") for counter in USER_STATS_COUNTERS}),
+        rows
+    )
+
+
+def _reaction_stats_rows(post_id: int, user_id: int, changed, likes_change, dislikes_change) -> Select:
+    """
+    Changes of stats of the owner of a Post and of a User, for changes of (likes, dislikes) counters of the Post by
+    the reaction of the User, given as SQL expressions, in a statement changing the reaction
+    :param changed: condition for the reaction to be changed, otherwise no rows are selected
+    :return: select of stats changes for _user_stats_update
+    """
+    zero = _typed(0, Integer)
+    # Labels of the first select name the columns of the union
+    owner = select(models.Post.owner_id.label("user_id"), zero.label("posts_count"),
+                   likes_change.label("likes_received"), dislikes_change.label("dislikes_received"),
+                   zero.label("likes_given"))\
+        .filter(models.Post.id == post_id)\
+        .filter(changed)
+    user = select(_typed(user_id, Integer), zero, zero, zero, likes_change).filter(changed)
+    rows = owner.union_all(user).subquery()
+    # One row per User, selected by _user_stats_update for each counter
+    return select(rows.c.user_id, *(func.sum(rows.c[counter]).label(counter) for counter in USER_STATS_COUNTERS))\
+        .group_by(rows.c.user_id)
+
+
+def _user_stats_select() -> Select:
+    """
+    :return: select of user_id and USER_STATS_COUNTERS of Users computed from Posts and reactions
+    """
+    posts = select(func.count(1)).filter(models.Post.owner_id == models.User.id).scalar_subquery()
+
+    def received(dislike: bool):
+        return select(func.count(1))\
+            .select_from(models.PostReaction)\
+            .join(models.Post, models.Post.id == models.PostReaction.post_id)\
+            .filter(models.Post.owner_id == models.User.id)\
+            .filter(models.PostReaction.dislike == dislike)\
+            .scalar_subquery()
+
+    likes_given = select(func.count(1))\
+        .filter(models.PostReaction.user_id == models.User.id)\
+        .filter(models.PostReaction.dislike == False)\
+        .scalar_subquery()
+    return select(models.User.id.label("user_id"), posts.label("posts_count"), received(False).label("likes_received"),
+                  received(True).label("dislikes_received"), likes_given.label("likes_given"))
+
+
+def get_user_stats(db: Session, user_id: int) -> models.UserStats | None:
+    """
+    :return: stats of the User, None if there is no such User
+    """
+    stats = db.get(models.UserStats, user_id)
+    if stats is None:
+        # Users inserted without crud.create_user have no stats row until rebuild_user_stats: computed, not stored,
+        # as changes committed meanwhile would be missing from the stored row
+        row = db.execute(_user_stats_select().filter(models.User.id == user_id)).first()
+        if row is not None:
+            return models.UserStats(**row._mapping)
+    return stats
+
+
+def rebuild_user_stats(db: Session) -> int:
+    """
+    Recomputes stats of all Users from Posts and reactions. Does not commit.
+    :return: number of Users
+    """
+    db.execute(delete(models.UserStats))
+    return db.execute(insert(models.UserStats).from_select(["user_id", *USER_STATS_COUNTERS], _user_stats_select()))\
+        .rowcount
+
+
 # Reactions
-def react_user_post(db: Session, post_id: int, user_id: int, dislike: bool = False):
-    db_post = get_post(db, post_id)
-    if not db_post:
-        return None
-    if db_post.owner_id == user_id:
-        raise NoPermission()
-    reaction = db.query(models.PostReaction)\
+def _update_reaction_counts(db: Session, post_id: int, likes: int = 0, dislikes: int = 0):
+    """
+    Adjusts stored reaction counters of a Post in the current transaction.
+    Done as a single UPDATE relative to the stored values, so concurrent reactions do not overwrite each other.
+    """
+    db.query(models.Post).filter(models.Post.id == post_id).update({
+        models.Post.likes_count: models.Post.likes_count + likes,
+        models.Post.dislikes_count: models.Post.dislikes_count + dislikes
+    }, synchronize_session=False)
+
+
+def _get_reaction(db: Session, post_id: int, user_id: int) -> models.PostReaction | None:
+    return db.query(models.PostReaction)\
         .filter(models.PostReaction.post_id == post_id)\
         .filter(models.PostReaction.user_id == user_id).first()
-    if reaction:
-        reaction.dislike = dislike
+
+
+def _dialect_insert(db: Session):
+    """
+    :return: insert() of the dialect of the database, supporting ON CONFLICT clauses
+    """
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def _set_reaction(db: Session, reaction: models.PostReaction | None, post_id: int, user_id: int,
+                  dislike: bool) -> tuple[int, int]:
+    """
+    Creates or changes the reaction of a User to a Post.
+    :param reaction: current reaction, as read earlier in the transaction
+    :return: changes of (likes, dislikes) counters of the Post
+    """
+    if not reaction:
+        reaction_insert = _dialect_insert(db)(models.PostReaction)\
+            .values(post_id=post_id, user_id=user_id, dislike=dislike)\
+            .on_conflict_do_nothing(index_elements=[models.PostReaction.post_id, models.PostReaction.user_id])
+        if db.execute(reaction_insert).rowcount:
+            return (0, 1) if dislike else (1, 0)
+        # Created by a concurrent request since it was read, change it instead
+        reaction = _get_reaction(db, post_id, user_id)
+    if reaction.dislike == dislike:
+        return 0, 0
+    reaction.dislike = dislike
+    return (-1, 1) if dislike else (1, -1)
+
+
+def _remove_reaction(db: Session, reaction: models.PostReaction) -> tuple[int, int]:
+    """
+    :return: changes of (likes, dislikes) counters of the Post
+    """
+    db.delete(reaction)
+    return (0, -1) if reaction.dislike else (-1, 0)
+
+
+def _post_reaction_changes_postgresql(likes_change, dislikes_change) -> dict:
+    """
+    :return: values of an UPDATE of a Post adjusting its counters by given SQL expressions, and its trending score
+    by the new counters, so that no other statement is needed
+    """
+    likes = models.Post.likes_count + likes_change
+    dislikes = models.Post.dislikes_count + dislikes_change
+    return {
+        models.Post.likes_count: likes,
+        models.Post.dislikes_count: dislikes,
+        models.Post.trending_score: _trending_score_postgresql(likes, dislikes, models.Post.timestamp)
+    }
+
+
+def _react_user_post_postgresql_statement(db: Session, post_id: int, user_id: int, dislike: bool) -> Select:
+    """
+    Upserts the reaction and adjusts counters and trending score of the Post in one statement:
+    the INSERT ... ON CONFLICT DO UPDATE in a CTE returns a row only if the reaction was created or changed,
+    telling which way the counters of the Post have to be adjusted by the outer UPDATE.
+    Concurrent upserts of the same reaction wait for each other on the unique key, so counters stay exact.
+    Stats of the owner and of the User are adjusted the same way by another CTE.
+    """
+    likes, dislikes = int(not dislike), int(dislike)
+    reaction_insert = postgresql.insert(models.PostReaction).from_select(
+        ["post_id", "user_id", "dislike"],
+        select(models.Post.id, _typed(user_id, Integer), _typed(dislike, Boolean))
+        .filter(models.Post.id == post_id)
+        .filter(models.Post.owner_id != user_id)
+    )
+    reaction = reaction_insert.on_conflict_do_update(
+        index_elements=[models.PostReaction.post_id, models.PostReaction.user_id],
+        set_={"dislike": reaction_insert.excluded.dislike},
+        where=models.PostReaction.dislike.is_distinct_from(reaction_insert.excluded.dislike)
+    ).returning(literal_column("xmax = 0", Boolean).label("inserted")).cte("reaction")
+    inserted = select(reaction.c.inserted).scalar_subquery()
+    likes_change = case(
+        (inserted.is_(True), _typed(likes, Integer)),
+        (inserted.is_(False), _typed(likes - dislikes, Integer)),
+        else_=_typed(0, Integer)
+    )
+    dislikes_change = case(
+        (inserted.is_(True), _typed(dislikes, Integer)),
+        (inserted.is_(False), _typed(dislikes - likes, Integer)),
+        else_=_typed(0, Integer)
+    )
+    stats = _user_stats_update(
+        _reaction_stats_rows(post_id, user_id, inserted.isnot(None), likes_change, dislikes_change)
+    ).cte("stats")
+    post_update = update(models.Post)\
+        .where(models.Post.id == post_id)\
+        .where(models.Post.owner_id != user_id)\
+        .values(_post_reaction_changes_postgresql(likes_change, dislikes_change))\
+        .returning(*models.Post.__table__.columns)\
+        .add_cte(stats)
+    return select(models.Post).from_statement(post_update).execution_options(populate_existing=True)
+
+
+def _react_user_post_postgresql(db: Session, post_id: int, user_id: int, dislike: bool) -> models.Post | None:
+    return db.execute(_react_user_post_postgresql_statement(db, post_id, user_id, dislike)).scalars().first()
+
+
+def _react_user_post_sqlite(db: Session, post_id: int, user_id: int, dislike: bool) -> models.Post | None:
+    """
+    Adjusts counters of the Post relative to the current reaction first, then upserts the reaction.
+    The UPDATE takes the SQLite write lock, so no other reaction can change until commit.
+    """
+    likes, dislikes = int(not dislike), int(dislike)
+    current = select(models.PostReaction.dislike)\
+        .filter(models.PostReaction.post_id == post_id)\
+        .filter(models.PostReaction.user_id == user_id)\
+        .scalar_subquery()
+    likes_change = case((current.is_(None), likes), (current == dislike, 0), else_=likes - dislikes)
+    dislikes_change = case((current.is_(None), dislikes), (current == dislike, 0), else_=dislikes - likes)
+    updated = db.query(models.Post)\
+        .filter(models.Post.id == post_id)\
+        .filter(models.Post.owner_id != user_id)\
+        .update({
+            models.Post.likes_count: models.Post.likes_count + likes_change,
+            models.Post.dislikes_count: models.Post.dislikes_count + dislikes_change
+        }, synchronize_session=False)
+    if not updated:
+        return None
+    # Still relative to the current reaction, upserted below
+    changed = or_(current.is_(None), current != dislike)
+    db.execute(_user_stats_update(_reaction_stats_rows(post_id, user_id, changed, likes_change, dislikes_change)))
+    reaction_insert = sqlite.insert(models.PostReaction).values(post_id=post_id, user_id=user_id, dislike=dislike)
+    db.execute(reaction_insert.on_conflict_do_update(
+        index_elements=[models.PostReaction.post_id, models.PostReaction.user_id],
+        set_={"dislike": reaction_insert.excluded.dislike}
+    ))
+    db_post = db.query(models.Post).populate_existing().filter(models.Post.id == post_id).first()
+    _update_trending_score(db_post)
+    return db_post
+
+
+def react_user_post(db: Session, post_id: int, user_id: int, dislike: bool = False):
+    if db.get_bind().dialect.name == "postgresql":
+        db_post = _react_user_post_postgresql(db, post_id, user_id, dislike)
     else:
-        reaction = models.PostReaction(
-            post_id=post_id,
-            user_id=user_id,
-            dislike=dislike
-        )
-        db.add(reaction)
-        db.commit()
-    db.refresh(db_post)
+        db_post = _react_user_post_sqlite(db, post_id, user_id, dislike)
+    if not db_post:
+        db.rollback()
+        if not get_post(db, post_id):
+            return None
+        raise NoPermission()
+    # Built before commit, which expires loaded counters of a sync Session
+    event = events.post_reactions(db_post)
+    db.commit()
+    _invalidate_post_responses(post_id)
+    events.broker.publish(event)
     return db_post
 
 
-def delete_reaction_user_post(db: Session, post_id: int, user_id: int):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+def _delete_reaction_user_post_postgresql_statement(db: Session, post_id: int, user_id: int) -> Select:
+    """
+    Deletes the reaction in a CTE and adjusts counters and trending score of the Post by the deleted row, if any,
+    in one statement, along with stats of the owner and of the User
+    """
+    reaction = delete(models.PostReaction)\
+        .where(models.PostReaction.post_id == post_id)\
+        .where(models.PostReaction.user_id == user_id)\
+        .returning(models.PostReaction.dislike)\
+        .cte("reaction")
+    deleted = select(reaction.c.dislike).scalar_subquery()
+    likes_change = -case((deleted.is_(False), _typed(1, Integer)), else_=_typed(0, Integer))
+    dislikes_change = -case((deleted.is_(True), _typed(1, Integer)), else_=_typed(0, Integer))
+    stats = _user_stats_update(
+        _reaction_stats_rows(post_id, user_id, deleted.isnot(None), likes_change, dislikes_change)
+    ).cte("stats")
+    post_update = update(models.Post)\
+        .where(models.Post.id == post_id)\
+        .values(_post_reaction_changes_postgresql(likes_change, dislikes_change))\
+        .returning(*models.Post.__table__.columns)\
+        .add_cte(stats)
+    return select(models.Post).from_statement(post_update).execution_options(populate_existing=True)
+
+
+def _delete_reaction_user_post_postgresql(db: Session, post_id: int, user_id: int) -> models.Post | None:
+    return db.execute(_delete_reaction_user_post_postgresql_statement(db, post_id, user_id)).scalars().first()
+
+
+def _delete_reaction_user_post_sqlite(db: Session, post_id: int, user_id: int) -> models.Post | None:
+    """
+    Adjusts counters of the Post and stats of Users by the current reaction first (taking the SQLite write lock),
+    then deletes it
+    """
+    current = select(models.PostReaction.dislike)\
+        .filter(models.PostReaction.post_id == post_id)\
+        .filter(models.PostReaction.user_id == user_id)\
+        .scalar_subquery()
+    likes_change = -case((current.is_(False), 1), else_=0)
+    dislikes_change = -case((current.is_(True), 1), else_=0)
+    updated = db.query(models.Post).filter(models.Post.id == post_id).update({
+        models.Post.likes_count: models.Post.likes_count + likes_change,
+        models.Post.dislikes_count: models.Post.dislikes_count + dislikes_change
+    }, synchronize_session=False)
+    if not updated:
         return None
-    reaction = db.query(models.PostReaction)\
+    db.execute(_user_stats_update(_reaction_stats_rows(post_id, user_id, current.isnot(None), likes_change,
+                                                       dislikes_change)))
+    db.query(models.PostReaction)\
         .filter(models.PostReaction.post_id == post_id)\
-        .filter(models.PostReaction.user_id == user_id).first()
-    if reaction:
-        db.delete(reaction)
-        db.commit()
-        db.refresh(post)
+        .filter(models.PostReaction.user_id == user_id)\
+        .delete(synchronize_session=False)
+    db_post = db.query(models.Post).populate_existing().filter(models.Post.id == post_id).first()
+    _update_trending_score(db_post)
+    return db_post
+
+
+def delete_reaction_user_post(db: Session, post_id: int, user_id: int):
+    if db.get_bind().dialect.name == "postgresql":
+        post = _delete_reaction_user_post_postgresql(db, post_id, user_id)
+    else:
+        post = _delete_reaction_user_post_sqlite(db, post_id, user_id)
+    if post:
+        event = events.post_reactions(post)
+    db.commit()
+    if post:
+        _invalidate_post_responses(post_id)
+        events.broker.publish(event)
     return post
 
 
-def get_posts_reactions_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, dislike: bool = False):
+def react_user_posts(db: Session, user_id: int, operations: list[schemas.ReactionOperation]):
+    """
+    Applies many reaction changes of a User in a single transaction.
+    Operations set the final state of a reaction, so only the last allowed operation for each Post is applied.
+    :return: for each operation, the Post after all changes, None if there is no such Post,
+    or NoPermission if the Post is owned by the User
+    """
+    post_ids = {operation.post_id for operation in operations}
+    posts = {post.id: post for post in db.query(models.Post).filter(models.Post.id.in_(post_ids))}
+    results = []
+    final_operations = {}
+    for operation in operations:
+        post = posts.get(operation.post_id)
+        if not post:
+            results.append(None)
+        elif post.owner_id == user_id and operation.action != schemas.ReactionAction.clear:
+            results.append(NoPermission())
+        else:
+            results.append(post)
+            final_operations[post.id] = operation
+    reaction_events = []
+    if final_operations:
+        reaction_events = _apply_reactions(
+            db, {(post_id, user_id): operation.action for post_id, operation in final_operations.items()}
+        )
+    db.commit()
+    for event in reaction_events:
+        _invalidate_post_responses(event.post_id)
+        events.broker.publish(event)
+    return results
+
+
+def _apply_reactions(db: Session, changes: dict[tuple[int, int], schemas.ReactionAction]) -> list[events.Event]:
+    """
+    Sets final states of reactions, given by (post_id, user_id), in the current transaction, adjusting counters and
+    trending scores of the Posts once per Post
+    :return: events of new reaction counts, to publish after commit
+    """
+    post_ids = {post_id for post_id, _ in changes}
+    reactions = {
+        (reaction.post_id, reaction.user_id): reaction for reaction in db.query(models.PostReaction)
+        .filter(models.PostReaction.user_id.in_({user_id for _, user_id in changes}))
+        .filter(models.PostReaction.post_id.in_(post_ids))
+    }
+    counts = {}
+    stats_changes = defaultdict(Counter)
+    for (post_id, user_id), action in changes.items():
+        reaction = reactions.get((post_id, user_id))
+        if action == schemas.ReactionAction.clear:
+            if not reaction:
+                continue
+            likes, dislikes = _remove_reaction(db, reaction)
+        else:
+            likes, dislikes = _set_reaction(db, reaction, post_id, user_id, action == schemas.ReactionAction.dislike)
+        post_likes, post_dislikes = counts.get(post_id, (0, 0))
+        counts[post_id] = (post_likes + likes, post_dislikes + dislikes)
+        stats_changes[user_id]["likes_given"] += likes
+    for post_id, (likes, dislikes) in counts.items():
+        if likes or dislikes:
+            _update_reaction_counts(db, post_id, likes=likes, dislikes=dislikes)
+    reaction_events = []
+    for post in db.query(models.Post).filter(models.Post.id.in_(post_ids)).populate_existing():
+        _update_trending_score(post)
+        likes, dislikes = counts.get(post.id, (0, 0))
+        stats_changes[post.owner_id].update(likes_received=likes, dislikes_received=dislikes)
+        reaction_events.append(events.post_reactions(post))
+    _update_user_stats(db, stats_changes)
+    return reaction_events
+
+
+def apply_reactions(db: Session, changes: dict[tuple[int, int], schemas.ReactionAction]) -> int:
+    """
+    Sets final states of reactions of many Users, given by (post_id, user_id), in a single transaction.
+    Changes are expected to be allowed already (not liking own Posts); those of Posts deleted since are skipped.
+    :return: number of applied changes
+    """
+    existing = {
+        post_id for post_id, in db.query(models.Post.id).filter(models.Post.id.in_({post_id for post_id, _ in changes}))
+    }
+    changes = {key: action for key, action in changes.items() if key[0] in existing}
+    reaction_events = _apply_reactions(db, changes) if changes else []
+    db.commit()
+    for event in reaction_events:
+        _invalidate_post_responses(event.post_id)
+        events.broker.publish(event)
+    return len(changes)
+
+
+def rebuild_reaction_counts(db: Session) -> int:
+    """
+    Recomputes stored likes/dislikes counters and trending scores of all Posts from the post_reaction table.
+    :return: number of updated Posts
+    """
+    likes = select(func.count(1))\
+        .filter(models.PostReaction.post_id == models.Post.id)\
+        .filter(models.PostReaction.dislike == False)\
+        .scalar_subquery()
+    dislikes = select(func.count(1))\
+        .filter(models.PostReaction.post_id == models.Post.id)\
+        .filter(models.PostReaction.dislike == True)\
+        .scalar_subquery()
+    updated = db.query(models.Post).update({
+        models.Post.likes_count: likes,
+        models.Post.dislikes_count: dislikes
+    }, synchronize_session=False)
+    rebuild_trending_scores(db)
+    db.commit()
+    response_cache.invalidate("post")
+    response_cache.invalidate("posts")
+    return updated
+
+
+def get_posts_reactions_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100, dislike: bool = False,
+                                cursor: tuple | None = None, rows: bool = False,
+                                fields: tuple[str, ...] | None = None):
     user = get_user(db=db, user_id=user_id)
     if not user:
         return None
-    posts = db.query(models.Post).join(models.PostReaction).filter(models.PostReaction.user_id == user_id)\
-        .filter(models.PostReaction.dislike == dislike).offset(skip).limit(limit).all()
-    return posts
+    query = _posts_query(db, rows, fields=fields).join(models.PostReaction)\
+        .filter(models.PostReaction.user_id == user_id).filter(models.PostReaction.dislike == dislike)
+    return _paginate_posts(query, skip, limit, cursor)
 
 
-def get_users_reactions_by_post(db: Session, post_id: int, skip: int = 0, limit: int = 100, dislike: bool = False):
+def get_users_reactions_by_post(db: Session, post_id: int, skip: int = 0, limit: int = 100, dislike: bool = False,
+                                cursor: tuple | None = None, rows: bool = False,
+                                fields: tuple[str, ...] | None = None):
     post = get_post(db=db, post_id=post_id)
     if not post:
         return None
-    users = db.query(models.User).join(models.PostReaction).filter(models.PostReaction.post_id == post_id)\
-        .filter(models.PostReaction.dislike == dislike).offset(skip).limit(limit).all()
-    return users
+    query = _users_query(db, rows, fields).join(models.PostReaction).filter(models.PostReaction.post_id == post_id)\
+        .filter(models.PostReaction.dislike == dislike)
+    return _paginate_by_id(query, models.User, skip, limit, cursor)
+
+
+# Follows and timelines
+def _is_fanned_out(followers_count: int) -> bool:
+    """
+    :return: whether Posts of a User with given number of followers are written into timelines of the followers
+    """
+    return followers_count <= settings.feed_fanout_max_followers
+
+
+def _fan_out_post(db: Session, post: models.Post):
+    """
+    Writes a new Post into the timeline of its owner and, unless the owner has too many followers, of each follower
+    """
+    db.add(models.TimelineEntry(user_id=post.owner_id, post_id=post.id, timestamp=post.timestamp))
+    followers_count = db.query(models.User.followers_count).filter(models.User.id == post.owner_id).scalar()
+    if _is_fanned_out(followers_count):
+        followers = select(models.Follow.follower_id, models.Post.id, models.Post.timestamp)\
+            .join(models.Post, models.Post.owner_id == models.Follow.followee_id)\
+            .filter(models.Post.id == post.id)
+        db.execute(insert(models.TimelineEntry).from_select(["user_id", "post_id", "timestamp"], followers))
+
+
+def _backfill_timelines(db: Session, user_id: int, follower_ids: Select):
+    """
+    Adds the latest Posts of a User to timelines of its followers, skipping Posts already there
+    :param follower_ids: select of ids of the followers, as follower_id
+    """
+    followers = follower_ids.subquery("followers")
+    latest_posts = select(models.Post.id, models.Post.timestamp)\
+        .filter(models.Post.owner_id == user_id)\
+        .filter(models.Post.timestamp.isnot(None))\
+        .order_by(models.Post.timestamp.desc(), models.Post.id.desc())\
+        .limit(settings.feed_backfill_posts)\
+        .subquery("latest_posts")
+    in_timeline = exists()\
+        .where(models.TimelineEntry.user_id == followers.c.follower_id)\
+        .where(models.TimelineEntry.post_id == latest_posts.c.id)
+    entries = select(followers.c.follower_id, latest_posts.c.id, latest_posts.c.timestamp)\
+        .select_from(followers.join(latest_posts, true()))\
+        .filter(~in_timeline)
+    db.execute(insert(models.TimelineEntry).from_select(["user_id", "post_id", "timestamp"], entries))
+
+
+def follow_user(db: Session, user_id: int, follower_id: int):
+    user = get_user(db, user_id)
+    if not user:
+        return None
+    if user_id == follower_id:
+        raise NoPermission()
+    follow = db.query(models.Follow)\
+        .filter(models.Follow.follower_id == follower_id)\
+        .filter(models.Follow.followee_id == user_id).first()
+    if not follow:
+        db.add(models.Follow(follower_id=follower_id, followee_id=user_id))
+        db.query(models.User).filter(models.User.id == user_id).update({
+            models.User.followers_count: models.User.followers_count + 1
+        }, synchronize_session=False)
+        if _is_fanned_out(user.followers_count + 1):
+            # Backfill the timeline with the latest Posts of the followed User
+            _backfill_timelines(db, user_id, select(_typed(follower_id, Integer).label("follower_id")))
+        db.commit()
+        db.refresh(user)
+    return user
+
+
+def unfollow_user(db: Session, user_id: int, follower_id: int):
+    user = get_user(db, user_id)
+    if not user:
+        return None
+    follow = db.query(models.Follow)\
+        .filter(models.Follow.follower_id == follower_id)\
+        .filter(models.Follow.followee_id == user_id).first()
+    if follow:
+        db.delete(follow)
+        db.query(models.User).filter(models.User.id == user_id).update({
+            models.User.followers_count: models.User.followers_count - 1
+        }, synchronize_session=False)
+        user_posts = select(models.Post.id).filter(models.Post.owner_id == user_id)
+        db.query(models.TimelineEntry)\
+            .filter(models.TimelineEntry.user_id == follower_id)\
+            .filter(models.TimelineEntry.post_id.in_(user_posts))\
+            .delete(synchronize_session=False)
+        if not _is_fanned_out(user.followers_count) and _is_fanned_out(user.followers_count - 1):
+            # Posts created while the User had too many followers are not in timelines of the followers, and are no
+            # longer merged into their feeds on read: backfill them as for a new follow
+            remaining_followers = select(models.Follow.follower_id)\
+                .filter(models.Follow.followee_id == user_id)\
+                .filter(models.Follow.follower_id != follower_id)
+            _backfill_timelines(db, user_id, remaining_followers)
+        db.commit()
+        db.refresh(user)
+    return user
+
+
+def get_followers(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                  rows: bool = False, fields: tuple[str, ...] | None = None):
+    user = get_user(db=db, user_id=user_id)
+    if not user:
+        return None
+    query = _users_query(db, rows, fields).join(models.Follow, models.Follow.follower_id == models.User.id)\
+        .filter(models.Follow.followee_id == user_id)
+    return _paginate_by_id(query, models.User, skip, limit, cursor)
+
+
+def get_following(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                  rows: bool = False, fields: tuple[str, ...] | None = None):
+    user = get_user(db=db, user_id=user_id)
+    if not user:
+        return None
+    query = _users_query(db, rows, fields).join(models.Follow, models.Follow.followee_id == models.User.id)\
+        .filter(models.Follow.follower_id == user_id)
+    return _paginate_by_id(query, models.User, skip, limit, cursor)
+
+
+def get_feed(db: Session, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+             rows: bool = False, expand_owner: bool = False, fields: tuple[str, ...] | None = None):
+    """
+    Newest Posts of the User and of the Users they follow.
+    Reads the materialized timeline, merging in Posts of followed Users with too many followers to be fanned out.
+    """
+    timeline = _posts_query(db, rows, expand_owner, fields)\
+        .join(models.TimelineEntry, models.TimelineEntry.post_id == models.Post.id)\
+        .filter(models.TimelineEntry.user_id == user_id)\
+        .order_by(models.TimelineEntry.timestamp.desc(), models.TimelineEntry.post_id.desc())
+    if cursor is not None:
+        timeline = timeline.filter(_before_cursor(models.TimelineEntry.timestamp, models.TimelineEntry.post_id, cursor))
+    posts = timeline.limit(skip + limit).all()
+
+    not_fanned_out = db.query(models.Follow.followee_id)\
+        .join(models.User, models.User.id == models.Follow.followee_id)\
+        .filter(models.Follow.follower_id == user_id)\
+        .filter(models.User.followers_count > settings.feed_fanout_max_followers)\
+        .all()
+    if not_fanned_out:
+        query = _posts_query(db, rows, expand_owner, fields)\
+            .filter(models.Post.owner_id.in_([followee_id for followee_id, in not_fanned_out]))
+        posts = list({post.id: post for post in posts + _paginate_posts(query, 0, skip + limit, cursor)}.values())
+        posts.sort(key=lambda post: (post.timestamp, post.id), reverse=True)
+    return posts[skip:skip + limit]
+
+
+# Export
+def export_users_statement(after_id: int | None = None) -> Select:
+    """
+    :return: statement selecting public fields of all Users by id, or only of the ones after after_id
+    """
+    statement = select(*USER_COLUMNS).order_by(models.User.id)
+    if after_id is not None:
+        statement = statement.filter(models.User.id > after_id)
+    return statement
+
+
+def export_posts_statement(since: datetime | None = None) -> Select:
+    """
+    :return: statement selecting all Posts by id, or only the ones created since given time
+    """
+    statement = select(*POST_COLUMNS).order_by(models.Post.id)
+    if since is not None:
+        statement = statement.filter(models.Post.timestamp >= since)
+    return statement
+
 
+def export_reactions_statement(since: datetime | None = None) -> Select:
+    """
+    :return: statement selecting all reactions by Post, or only reactions to Posts created since given time
+    """
+    statement = select(models.PostReaction.post_id, models.PostReaction.user_id, models.PostReaction.dislike)\
+        .order_by(models.PostReaction.post_id, models.PostReaction.user_id)
+    if since is not None:
+        created_since = select(models.Post.id).filter(models.Post.timestamp >= since)
+        statement = statement.filter(models.PostReaction.post_id.in_(created_since))
+    return statement
@@ -0,0 +1,147 @@
+"""
+Async counterparts of the functions in crud.
+
+Each one runs the sync implementation on the connection of an AsyncSession with AsyncSession.run_sync, so queries go
+through the asyncio driver without blocking the event loop, while the query logic itself is kept in crud only.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, models, schemas, security
+
+NoPermission = crud.NoPermission
+
+# Export statements are executed by export.stream_ndjson
+export_users_statement = crud.export_users_statement
+export_posts_statement = crud.export_posts_statement
+export_reactions_statement = crud.export_reactions_statement
+
+
+async def get_user(db: AsyncSession, user_id: int, rows: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_user, user_id=user_id, rows=rows, fields=fields)
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> models.UserStats | None:
+    return await db.run_sync(crud.get_user_stats, user_id=user_id)
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.run_sync(crud.get_user_by_email, email=email)
+
+
+async def get_user_by_alias(db: AsyncSession, alias: str) -> models.User | None:
+    return await db.run_sync(crud.get_user_by_alias, alias=alias)
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids: list[int], rows: bool = False,
+                           fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_users_by_ids, user_ids=user_ids, rows=rows, fields=fields)
+
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                    rows: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_users, skip=skip, limit=limit, cursor=cursor, rows=rows, fields=fields)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await security.password_hasher.hash(user.password)
+    return await db.run_sync(crud.create_user, user=user, hashed_password=hashed_password)
+
+
+async def get_posts(db: AsyncSession, skip: int = 0, limit: int = 100, user_id: int | None = None,
+                    cursor: tuple | None = None, rows: bool = False, expand_owner: bool = False,
+                    fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_posts, skip=skip, limit=limit, user_id=user_id, cursor=cursor, rows=rows,
+                             expand_owner=expand_owner, fields=fields)
+
+
+async def get_post(db: AsyncSession, post_id: int, rows: bool = False, expand_owner: bool = False,
+                   fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_post, post_id=post_id, rows=rows, expand_owner=expand_owner, fields=fields)
+
+
+async def get_posts_by_ids(db: AsyncSession, post_ids: list[int], rows: bool = False, expand_owner: bool = False,
+                           fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_posts_by_ids, post_ids=post_ids, rows=rows, expand_owner=expand_owner,
+                             fields=fields)
+
+
+async def search_posts(db: AsyncSession, text: str, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                       rows: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.search_posts, text=text, skip=skip, limit=limit, cursor=cursor, rows=rows,
+                             fields=fields)
+
+
+async def get_trending_posts(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                             rows: bool = False, expand_owner: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_trending_posts, skip=skip, limit=limit, cursor=cursor, rows=rows,
+                             expand_owner=expand_owner, fields=fields)
+
+
+async def create_user_post(db: AsyncSession, post: schemas.PostCreate, user_id: int):
+    return await db.run_sync(crud.create_user_post, post=post, user_id=user_id)
+
+
+async def edit_user_post(db: AsyncSession, post_id: int, post: schemas.PostBase, user_id: int):
+    return await db.run_sync(crud.edit_user_post, post_id=post_id, post=post, user_id=user_id)
+
+
+async def delete_user_post(db: AsyncSession, post_id: int, user_id: int):
+    return await db.run_sync(crud.delete_user_post, post_id=post_id, user_id=user_id)
+
+
+# Reactions
+async def react_user_post(db: AsyncSession, post_id: int, user_id: int, dislike: bool = False):
+    return await db.run_sync(crud.react_user_post, post_id=post_id, user_id=user_id, dislike=dislike)
+
+
+async def delete_reaction_user_post(db: AsyncSession, post_id: int, user_id: int):
+    return await db.run_sync(crud.delete_reaction_user_post, post_id=post_id, user_id=user_id)
+
+
+async def react_user_posts(db: AsyncSession, user_id: int, operations: list[schemas.ReactionOperation]):
+    return await db.run_sync(crud.react_user_posts, user_id=user_id, operations=operations)
+
+
+async def rebuild_reaction_counts(db: AsyncSession) -> int:
+    return await db.run_sync(crud.rebuild_reaction_counts)
+
+
+async def get_posts_reactions_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100,
+                                      dislike: bool = False, cursor: tuple | None = None, rows: bool = False,
+                                      fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_posts_reactions_by_user, user_id=user_id, skip=skip, limit=limit,
+                             dislike=dislike, cursor=cursor, rows=rows, fields=fields)
+
+
+async def get_users_reactions_by_post(db: AsyncSession, post_id: int, skip: int = 0, limit: int = 100,
+                                      dislike: bool = False, cursor: tuple | None = None, rows: bool = False,
+                                      fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_users_reactions_by_post, post_id=post_id, skip=skip, limit=limit,
+                             dislike=dislike, cursor=cursor, rows=rows, fields=fields)
+
+
+# Follows and timelines
+async def follow_user(db: AsyncSession, user_id: int, follower_id: int):
+    return await db.run_sync(crud.follow_user, user_id=user_id, follower_id=follower_id)
+
+
+async def unfollow_user(db: AsyncSession, user_id: int, follower_id: int):
+    return await db.run_sync(crud.unfollow_user, user_id=user_id, follower_id=follower_id)
+
+
+async def get_followers(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                        rows: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_followers, user_id=user_id, skip=skip, limit=limit, cursor=cursor, rows=rows,
+                             fields=fields)
+
+
+async def get_following(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                        rows: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_following, user_id=user_id, skip=skip, limit=limit, cursor=cursor, rows=rows,
+                             fields=fields)
+
+
+async def get_feed(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, cursor: tuple | None = None,
+                   rows: bool = False, expand_owner: bool = False, fields: tuple[str, ...] | None = None):
+    return await db.run_sync(crud.get_feed, user_id=user_id, skip=skip, limit=limit, cursor=cursor, rows=rows,
+                             expand_owner=expand_owner, fields=fields)
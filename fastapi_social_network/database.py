@@ -1,15 +1,116 @@
-from sqlalchemy import create_engine
+import itertools
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
 
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
 connect_args = {}
 
 if settings.sqlalchemy_database_url.startswith("sqlite:///"):
     connect_args["check_same_thread"] = False
 
+
+def get_async_url(url: str) -> URL:
+    """
+    Replaces the driver of a sync database url with the matching asyncio driver
+    """
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)
+    return url.set(drivername=drivername)
+
+
+def get_engine_args(url: str | URL, asyncio: bool = False) -> dict:
+    """
+    :return: create_engine arguments from settings. SQLite database files are pooled as well (by default SQLAlchemy
+    1.4 opens a new connection for each session), so that connections keep their pragmas and page cache.
+    In-memory SQLite databases keep their default pool.
+    """
+    url = make_url(url)
+    args = {"echo": settings.sqlalchemy_echo}
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return args
+        args["poolclass"] = AsyncAdaptedQueuePool if asyncio else QueuePool
+    args.update(
+        pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle, pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    return args
+
+
+def get_sqlite_pragmas() -> dict[str, str | int]:
+    return {
+        "journal_mode": settings.sqlite_journal_mode.value,
+        "synchronous": settings.sqlite_synchronous.value,
+        "mmap_size": settings.sqlite_mmap_size,
+        "cache_size": settings.sqlite_cache_size,
+    }
+
+
+def set_sqlite_pragmas(sync_engine: Engine, pragmas: dict[str, str | int]):
+    """
+    Sets pragmas on each new connection of a SQLite engine; does nothing for other databases
+    """
+    if sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
 engine = create_engine(
-    settings.sqlalchemy_database_url, connect_args=connect_args, echo=settings.sqlalchemy_echo
+    settings.sqlalchemy_database_url, connect_args=connect_args, **get_engine_args(settings.sqlalchemy_database_url)
 )
+set_sqlite_pragmas(engine, get_sqlite_pragmas())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    get_async_url(settings.sqlalchemy_database_url), **get_engine_args(settings.sqlalchemy_database_url, asyncio=True)
+)
+set_sqlite_pragmas(async_engine.sync_engine, get_sqlite_pragmas())
+# Objects returned by crud are serialized after the session commits; expiring them would require lazy IO outside
+# of the greenlet context, so they are kept as loaded (crud refreshes what it changes).
+AsyncSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession
+)
+
+
+class ReplicaSet:
+    """
+    Session factories of read replicas, handing out sessions in turn
+    """
+    def __init__(self, session_makers: list[sessionmaker]):
+        self.session_makers = session_makers
+        self._counter = itertools.count()
+
+    def __bool__(self):
+        return bool(self.session_makers)
+
+    def session(self) -> AsyncSession:
+        return self.session_makers[next(self._counter) % len(self.session_makers)]()
+
+
+replica_engines = [
+    create_async_engine(get_async_url(url), **get_engine_args(url, asyncio=True))
+    for url in settings.sqlalchemy_replica_urls
+]
+for replica_engine in replica_engines:
+    set_sqlite_pragmas(replica_engine.sync_engine, get_sqlite_pragmas())
+replicas = ReplicaSet([
+    sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_engine, class_=AsyncSession)
+    for replica_engine in replica_engines
+])
+
 Base = declarative_base()
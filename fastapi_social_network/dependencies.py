@@ -1,13 +1,18 @@
 import re
+import time
 from datetime import datetime, timedelta
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.security.utils import get_authorization_scheme_param
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from . import crud, models, schemas, security
-from .database import SessionLocal
+from . import crud_async, models, schemas, security
+from .cache import TTLCache
+from .database import SessionLocal, AsyncSessionLocal, replicas
+from .response_cache import response_cache
 from .config import settings
 
 ALGORITHM = "HS256"
@@ -15,9 +20,29 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 SUB_RE = re.compile(r"^user:id:(\d*)$")
 
+SAFE_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Authenticated users cache: validated token -> user id (never outliving token expiration), and user id -> snapshot
+# of the User. Snapshots are dropped when the User is updated or deleted through the ORM in this process;
+# changes made by other processes are picked up after auth_cache_ttl.
+token_cache = TTLCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+user_cache = TTLCache(maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def invalidate_cached_user(mapper, connection, target: models.User):
+    user_cache.pop(target.id)
+    response_cache.invalidate("user", target.id)
+
+
+# Ids of users who sent a write request recently, whose reads are not sent to replicas (read-your-writes).
+# Kept in process: with several app processes, route requests of a user to the same process for this to hold.
+recent_writers = TTLCache(maxsize=100000, ttl=settings.replica_sticky_seconds)
+
 
 def get_db():
     db = SessionLocal()
@@ -27,11 +52,30 @@ def get_db():
         db.close()
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = crud.get_user_by_alias(db=db, alias=username)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Session of a read replica, for read-only routes. Users who sent a write request in the last
+    replica_sticky_seconds read from the primary database, so that replication lag does not hide their own changes.
+    The primary session is not used then, and does not open a connection.
+    """
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if not replicas or (scheme.lower() == "bearer" and recent_writers.get(get_token_user_id(token))):
+        yield db
+        return
+    async with replicas.session() as replica_db:
+        yield replica_db
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await crud_async.get_user_by_alias(db=db, alias=username)
     if not user:
         return None
-    if not security.verify_password(password, user.hashed_password):
+    if not await security.password_hasher.verify(password, user.hashed_password):
         return None
     return user
 
@@ -47,26 +91,47 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User | None:
+def get_token_user_id(token: str) -> int | None:
+    """
+    :return: id of the user the token was issued to, None if the token is not valid
+    """
+    user_id = token_cache.get(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
+            sub: str = payload.get("sub")
+            u_id = SUB_RE.findall(sub)
+            if len(u_id) == 0:
+                return None
+            token_data = schemas.TokenData(id=u_id[0])
+        except JWTError:
+            return None
+        user_id = token_data.id
+        token_cache.set(token, user_id, ttl=payload["exp"] - time.time())
+    return user_id
+
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db),
+                           token: str = Depends(oauth2_scheme)) -> schemas.User | None:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
-        sub: str = payload.get("sub")
-        u_id = SUB_RE.findall(sub)
-        if len(u_id) == 0:
-            raise credentials_exception
-        token_data = schemas.TokenData(id=u_id[0])
-    except JWTError:
+    user_id = get_token_user_id(token)
+    if user_id is None:
         raise credentials_exception
-    user = crud.get_user(db=db, user_id=token_data.id)
+    if request.method not in SAFE_METHODS:
+        recent_writers.set(user_id, True)
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        db_user = await crud_async.get_user(db=db, user_id=user_id)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.from_orm(db_user)
+        user_cache.set(user_id, user)
     return user
 
 
-async def get_current_active_user(current_user: schemas.User = Depends(get_current_user)) -> models.User | None:
+async def get_current_active_user(current_user: schemas.User = Depends(get_current_user)) -> schemas.User | None:
     return current_user
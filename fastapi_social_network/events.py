@@ -0,0 +1,207 @@
+"""
+Real-time events of Posts, pushed to clients over Server-Sent Events (/events) and WebSocket (/ws/events).
+
+crud publishes events to the broker after committing changes. Each connection subscribes with a bounded queue of
+pending events; reaction counts of a Post waiting in the queue are replaced by newer ones, and a connection whose
+queue is full is closed, so that slow clients do not make the process buffer events without limit.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import AsyncIterator, Hashable, Iterator
+
+from fastapi import APIRouter, Query, WebSocket, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from . import models, schemas
+from .config import settings
+
+
+@dataclass
+class Event:
+    type: str
+    post_id: int
+    data: dict
+    # Pending events with the same key are replaced by newer ones; events without a key are all delivered
+    coalesce_key: Hashable | None = field(default=None, compare=False)
+
+    @cached_property
+    def message(self) -> str:
+        """
+        Message sent to clients, encoded once for all subscribers
+        """
+        return json.dumps({"type": self.type, **jsonable_encoder(self.data)}, separators=(",", ":"))
+
+
+def post_created(post: models.Post) -> Event:
+    return Event("post_created", post.id, {"post": schemas.Post.from_orm(post)})
+
+
+def post_updated(post: models.Post) -> Event:
+    return Event("post_updated", post.id, {"post": schemas.Post.from_orm(post)})
+
+
+def post_deleted(post_id: int) -> Event:
+    return Event("post_deleted", post_id, {"post_id": post_id})
+
+
+def post_reactions(post: models.Post) -> Event:
+    return Event("post_reactions", post.id, {"post_id": post.id, "likes": post.likes, "dislikes": post.dislikes},
+                 coalesce_key=("post_reactions", post.id))
+
+
+class SubscriptionOverflow(Exception):
+    pass
+
+
+class Subscription:
+    """
+    Queue of events for one client. Events are put from any thread and read by the event loop the subscription was
+    created in.
+    """
+    def __init__(self, maxsize: int, post_ids: frozenset[int] | None = None):
+        self.maxsize = maxsize
+        self.post_ids = post_ids
+        self.overflowed = False
+        self._pending: OrderedDict[Hashable, Event] = OrderedDict()
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def put(self, event: Event):
+        if self.post_ids is not None and event.post_id not in self.post_ids:
+            return
+        with self._lock:
+            if self.overflowed:
+                return
+            key = next(self._keys) if event.coalesce_key is None else event.coalesce_key
+            if key not in self._pending and len(self._pending) >= self.maxsize:
+                self.overflowed = True
+                self._pending.clear()
+            else:
+                self._pending[key] = event
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self) -> Event:
+        """
+        :return: the oldest pending event, waiting for one if there is none
+        :raises SubscriptionOverflow: if events came faster than the client read them
+        """
+        while True:
+            with self._lock:
+                if self.overflowed:
+                    raise SubscriptionOverflow()
+                if self._pending:
+                    return self._pending.popitem(last=False)[1]
+                self._ready.clear()
+            await self._ready.wait()
+
+
+class Broker:
+    """
+    Delivers published events to subscriptions of this process.
+    For several app processes, subclass it to send published events through a shared channel (e.g. Redis pub/sub)
+    and deliver() events received from it, then replace the broker of this module at startup.
+    """
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event: Event):
+        self.deliver(event)
+
+    def deliver(self, event: Event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    @contextmanager
+    def subscribe(self, post_ids: frozenset[int] | None = None) -> Iterator[Subscription]:
+        """
+        :param post_ids: only events of these Posts are delivered, all events by default
+        """
+        subscription = Subscription(self.queue_size, post_ids)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+
+    def stats(self) -> dict[str, int]:
+        return {"subscriptions": len(self._subscriptions)}
+
+
+broker = Broker(queue_size=settings.events_queue_size)
+
+
+async def _events(subscription: Subscription) -> AsyncIterator[Event | None]:
+    """
+    :return: events of the subscription, and None after events_keepalive_seconds without any
+    """
+    while True:
+        try:
+            yield await asyncio.wait_for(subscription.get(), settings.events_keepalive_seconds)
+        except asyncio.TimeoutError:
+            yield None
+
+
+async def _wait_disconnect(websocket: WebSocket):
+    # Messages from the client are not expected and are ignored
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+router = APIRouter()
+
+
+@router.get("/events", response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def stream_events(post_id: list[int] | None = Query(None)):
+    """
+    Server-Sent Events of Posts: post_created, post_updated, post_deleted and post_reactions (latest counts).
+    With post_id, only events of these Posts are sent. The stream ends with an overflow event if the client does not
+    keep up; it should then reload what it displays and reconnect.
+    """
+    async def body():
+        with broker.subscribe(None if post_id is None else frozenset(post_id)) as subscription:
+            try:
+                # Starlette stops iterating when the client disconnects
+                async for event in _events(subscription):
+                    yield ": keepalive\n\n" if event is None else f"event: {event.type}\ndata: {event.message}\n\n"
+            except SubscriptionOverflow:
+                yield "event: overflow\ndata: {}\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/ws/events")
+async def websocket_events(websocket: WebSocket, post_id: list[int] | None = Query(None)):
+    """
+    Same events as /events, as JSON text messages. The connection is closed with code 1013 (try again later) if the
+    client does not keep up.
+    """
+    await websocket.accept()
+    disconnected = asyncio.ensure_future(_wait_disconnect(websocket))
+    with broker.subscribe(None if post_id is None else frozenset(post_id)) as subscription:
+        try:
+            while True:
+                received = asyncio.ensure_future(subscription.get())
+                await asyncio.wait({received, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    received.cancel()
+                    return
+                await websocket.send_text(received.result().message)
+        except SubscriptionOverflow:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        finally:
+            disconnected.cancel()
@@ -0,0 +1,70 @@
+"""
+NDJSON export of tables, streamed in chunks from a server-side cursor so that memory use does not depend on
+table size.
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Iterator, Mapping, TextIO
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from . import crud
+
+CHUNK_SIZE = 1000
+MEDIA_TYPE = "application/x-ndjson"
+
+
+@dataclass(frozen=True)
+class Export:
+    # Builds the statement, taking the value of the incremental export filter (None for all rows)
+    statement: Callable[..., Select]
+    # Name of the filter: argument of statement, CLI option and query parameter of the route
+    filter: str
+
+
+EXPORTS: dict[str, Export] = {
+    "users": Export(crud.export_users_statement, "after_id"),
+    "posts": Export(crud.export_posts_statement, "since"),
+    "reactions": Export(crud.export_reactions_statement, "since"),
+}
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def to_ndjson(rows: Iterable[Mapping]) -> str:
+    return "".join(json.dumps(dict(row), default=_encode_value, separators=(",", ":")) + "\n" for row in rows)
+
+
+async def stream_ndjson(db: AsyncSession, statement: Select, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    :return: chunks of NDJSON lines of the rows selected by statement
+    """
+    result = await db.stream(statement.execution_options(yield_per=chunk_size))
+    async for rows in result.mappings().partitions(chunk_size):
+        yield to_ndjson(rows)
+
+
+def ndjson_response(db: AsyncSession, statement: Select) -> StreamingResponse:
+    return StreamingResponse(stream_ndjson(db, statement), media_type=MEDIA_TYPE)
+
+
+def iter_ndjson(db: Session, statement: Select, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    :return: chunks of NDJSON lines of the rows selected by statement
+    """
+    result = db.execute(statement.execution_options(yield_per=chunk_size))
+    for rows in result.mappings().partitions(chunk_size):
+        yield to_ndjson(rows)
+
+
+def write_ndjson(db: Session, statement: Select, output: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+    for chunk in iter_ndjson(db, statement, chunk_size):
+        output.write(chunk)
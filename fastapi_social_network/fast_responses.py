@@ -0,0 +1,105 @@
+"""
+Opt-in fast path of list responses (FAST_RESPONSES setting): crud functions return plain rows shaped like the response
+schema (rows=True), which are dumped with orjson as they are, instead of validating every ORM object attribute by
+attribute with response_model and encoding the result with the stdlib json.
+
+Sparse fieldsets (fields query parameter of list and detail routes) use the same path whatever the setting: only the
+columns of requested fields, and of the pagination key, are selected, and only requested fields are rendered.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable
+
+from fastapi import HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+
+from . import schemas
+from .config import settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency, installed with the "fast" extra
+    orjson = None
+
+if settings.fast_responses and orjson is None:
+    raise RuntimeError("FAST_RESPONSES requires orjson, install fastapi-social-network[fast]")
+
+enabled = settings.fast_responses
+
+
+@dataclass(frozen=True)
+class Fields:
+    """
+    Fields of list items to return, all fields of the schema unless sparse
+    """
+    names: tuple[str, ...]
+    sparse: bool = False
+
+    @property
+    def rows(self) -> bool:
+        """
+        Whether items are to be loaded as rows (rows=True in crud) and rendered by list_response
+        """
+        return enabled or self.sparse
+
+
+def fields_params(schema: type[BaseModel]) -> Callable[..., Fields]:
+    """
+    Creates a dependency reading the fields query parameter of lists of schema items
+    """
+    all_fields = tuple(schema.__fields__)
+    field_enum = Enum(f"{schema.__name__}Field", {name: name for name in all_fields}, type=str)
+
+    def dependency(fields: list[field_enum] | None = Query(None, description="Return only these fields of items")):
+        if not fields:
+            return Fields(all_fields)
+        requested = {field.value for field in fields}
+        # In schema order, without duplicates
+        return Fields(tuple(name for name in all_fields if name in requested), sparse=len(requested) < len(all_fields))
+    return dependency
+
+
+post_fields = fields_params(schemas.Post)
+user_fields = fields_params(schemas.User)
+
+
+def check_not_sparse(fields: Fields, detail: str):
+    """
+    :raises HTTPException: 400 if fields are sparse, for options needing whole items
+    """
+    if fields.sparse:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _json_response(content, headers: dict[str, str] | None = None) -> Response:
+    if orjson is None:
+        return JSONResponse(jsonable_encoder(content), headers=headers)
+    return ORJSONResponse(content, headers=headers)
+
+
+def list_response(items: list, response: Response, headers: dict[str, str], fields: Fields | None = None):
+    """
+    :param items: rows if fields.rows (crud called with rows=fields.rows), ORM objects otherwise
+    :param response: response of the route, gets the headers if items are returned for validation
+    :param fields: fields to render, all columns of rows by default
+    :return: items, or a response with items already rendered
+    """
+    if not (enabled if fields is None else fields.rows):
+        response.headers.update(headers)
+        return items
+    if fields is None:
+        content = [row._asdict() for row in items]
+    else:
+        # Rows may hold more columns, of the pagination key
+        content = [{name: row._mapping[name] for name in fields.names} for row in items]
+    return _json_response(content, headers)
+
+
+def item_response(row, fields: Fields) -> Response:
+    """
+    :param row: row loaded by crud with rows=True and fields.names
+    :return: response with the fields of the row rendered
+    """
+    return _json_response({name: row._mapping[name] for name in fields.names})
@@ -0,0 +1,191 @@
+"""
+Prometheus metrics: latency of API routes, SQL statements and database time per request, connection pool wait
+time, and state of in-process caches and of the password hasher.
+"""
+import time
+
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import admission, events, reaction_buffer, security
+from .database import engine, async_engine, replica_engines
+from .dependencies import token_cache, user_cache
+from .query_budget import QueryStats, route_template, track_queries
+from .response_cache import response_cache
+
+registry = CollectorRegistry()
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latency of API requests", ["method", "route", "status"], registry=registry
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "Number of SQL statements executed by an API request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100), registry=registry
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds", "Total time of SQL statements executed by an API request",
+    ["method", "route"], registry=registry
+)
+DB_STATEMENT_TIME = Histogram(
+    "db_statement_duration_seconds", "Time of a single SQL statement", ["engine"], registry=registry
+)
+REACTION_BUFFER_FLUSH_TIME = Histogram(
+    "reaction_buffer_flush_duration_seconds", "Time of writing a batch of buffered reactions", registry=registry
+)
+REACTION_BUFFER_FLUSH_SIZE = Histogram(
+    "reaction_buffer_flush_size", "Number of reactions written in a batch",
+    buckets=(1, 5, 10, 50, 100, 500, 1000, 5000), registry=registry
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent getting a connection from the pool, including opening new connections",
+    ["engine"], registry=registry
+)
+
+
+class _TimedPool:
+    """
+    Mixin of connection pools observing the time of each checkout in pool_wait
+    """
+    pool_wait: Histogram
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.pool_wait.observe(time.perf_counter() - start)
+
+
+def instrument_engine(sync_engine: Engine, name: str):
+    """
+    Records time of SQL statements and connection pool checkouts of an engine
+    """
+    statement_time = DB_STATEMENT_TIME.labels(name)
+    pool_wait = DB_POOL_WAIT.labels(name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statement_time.observe(time.perf_counter() - conn.info["query_start_time"].pop())
+
+    # Pools have no event fired before a checkout starts, so checkouts are timed by a subclass of the pool class.
+    # Pools recreated by engine.dispose() are of the same class, and keep it, as they keep event listeners.
+    pool = sync_engine.pool
+    pool.__class__ = type(f"Timed{type(pool).__name__}", (_TimedPool, type(pool)), {"pool_wait": pool_wait})
+
+
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+for i, replica_engine in enumerate(replica_engines):
+    instrument_engine(replica_engine.sync_engine, f"replica_{i}")
+
+
+class StatsCollector:
+    """
+    Exposes stats() of caches, password hasher, admission limits, reaction buffer and events broker at collection time
+    """
+    def collect(self):
+        cache_size = GaugeMetricFamily("cache_size", "Number of cached entries", labels=["cache"])
+        cache_hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        cache_misses = CounterMetricFamily("cache_misses", "Cache lookups that did not find an entry",
+                                           labels=["cache"])
+        for name, cache in [("token", token_cache), ("user", user_cache), ("response", response_cache)]:
+            stats = cache.stats()
+            cache_size.add_metric([name], stats["size"])
+            cache_hits.add_metric([name], stats["hits"])
+            cache_misses.add_metric([name], stats["misses"])
+        yield from (cache_size, cache_hits, cache_misses)
+
+        stats = security.password_hasher.stats()
+        yield GaugeMetricFamily("password_hasher_workers", "Max concurrent password hashing operations",
+                                value=stats["workers"])
+        yield GaugeMetricFamily("password_hasher_in_flight", "Password hashing operations in progress or waiting",
+                                value=stats["in_flight"])
+        yield GaugeMetricFamily("password_hasher_queued", "Password hashing operations waiting for a worker",
+                                value=stats["queued"])
+        yield CounterMetricFamily("password_hasher_completed", "Completed password hashing operations",
+                                  value=stats["completed"])
+        in_flight = GaugeMetricFamily("admission_in_flight", "Requests running, by route class", labels=["class"])
+        waiting = GaugeMetricFamily("admission_waiting", "Requests waiting for admission, by route class",
+                                    labels=["class"])
+        rejected = CounterMetricFamily("admission_rejected", "Requests rejected with 503, by route class",
+                                       labels=["class"])
+        for route_class, limiter in admission.limiters.items():
+            stats = limiter.stats()
+            in_flight.add_metric([route_class.value], stats["in_flight"])
+            waiting.add_metric([route_class.value], stats["waiting"])
+            rejected.add_metric([route_class.value], stats["rejected"])
+        yield from (in_flight, waiting, rejected)
+
+        stats = reaction_buffer.buffer.stats()
+        yield GaugeMetricFamily("reaction_buffer_pending", "Buffered reactions waiting to be written",
+                                value=stats["pending"])
+        yield CounterMetricFamily("reaction_buffer_written", "Buffered reactions written", value=stats["flushed"])
+        yield CounterMetricFamily("reaction_buffer_failures", "Failed writes of buffered reactions",
+                                  value=stats["failures"])
+        yield CounterMetricFamily("reaction_buffer_dropped", "Buffered reactions dropped after failing repeatedly",
+                                  value=stats["dropped"])
+
+        yield GaugeMetricFamily("events_subscriptions", "Clients connected to /events or /ws/events",
+                                value=events.broker.stats()["subscriptions"])
+
+
+registry.register(StatsCollector())
+
+
+def observe_reaction_buffer_flush(size: int, elapsed: float):
+    REACTION_BUFFER_FLUSH_SIZE.observe(size)
+    REACTION_BUFFER_FLUSH_TIME.observe(elapsed)
+
+
+reaction_buffer.flush_observers.append(observe_reaction_buffer_flush)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and database usage of each HTTP request, labelled by route template
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def record(scope: Scope, status_code: int, elapsed: float, stats: QueryStats):
+        method = scope["method"]
+        route = route_template(scope)
+        REQUEST_LATENCY.labels(method, route, str(status_code)).observe(elapsed)
+        REQUEST_DB_STATEMENTS.labels(method, route).observe(stats.statements)
+        REQUEST_DB_TIME.labels(method, route).observe(stats.db_time)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                self.record(scope, status_code, time.perf_counter() - start, stats)
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
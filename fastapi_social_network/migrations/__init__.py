@@ -0,0 +1,9 @@
+# Search index objects are created with DDL, not described in the metadata (see models)
+UNMANAGED_PREFIXES = ("posts_fts", "ix_posts_body_search")
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    """
+    Autogenerate filter skipping database objects which are intentionally missing from the metadata
+    """
+    return not (reflected and compare_to is None and name.startswith(UNMANAGED_PREFIXES))
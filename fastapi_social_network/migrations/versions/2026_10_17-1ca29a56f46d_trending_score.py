@@ -0,0 +1,44 @@
+"""Stored trending score of posts
+
+Revision ID: 1ca29a56f46d
+Revises: bc5c97b6785e
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from fastapi_social_network.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1ca29a56f46d'
+down_revision: Union[str, None] = 'bc5c97b6785e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.add_column(sa.Column('trending_score', sa.Float(), server_default='0', nullable=False))
+    op.create_index('ix_posts_trending_score_id', 'posts', ['trending_score', 'id'], unique=False)
+    # Same as crud.rebuild_trending_scores, in SQL so that it also works for offline upgrades.
+    # Seconds of Post age since 2023-01-01 (crud.TRENDING_EPOCH), posts without timestamp being that old.
+    if op.get_context().dialect.name == "postgresql":
+        age = "extract(epoch FROM coalesce(timestamp, TIMESTAMP '2023-01-01') - TIMESTAMP '2023-01-01')"
+    else:
+        age = "(julianday(coalesce(timestamp, '2023-01-01 00:00:00')) - julianday('2023-01-01 00:00:00')) * 86400"
+    # log() is base 10 in both PostgreSQL and SQLite (math functions of SQLite 3.35+)
+    net = "CAST(likes_count - dislikes_count AS DOUBLE PRECISION)"
+    op.execute(
+        f"UPDATE posts SET trending_score = sign({net}) * log(1 + abs({net})) "
+        f"+ {age} / {settings.trending_decay_hours * 3600:f}"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_trending_score_id', table_name='posts')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('trending_score')
@@ -0,0 +1,33 @@
+"""Composite indexes for post lists and reaction lookups
+
+Revision ID: 4b6236846ff7
+Revises: 52554660d820
+Create Date: 2026-10-17 10:03:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b6236846ff7'
+down_revision: Union[str, None] = '52554660d820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_posts_timestamp_id', 'posts', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_posts_owner_id_timestamp_id', 'posts', ['owner_id', 'timestamp', 'id'], unique=False)
+    op.create_index('ix_post_reaction_user_id_dislike_post_id', 'post_reaction', ['user_id', 'dislike', 'post_id'],
+                    unique=False)
+    op.create_index('ix_post_reaction_post_id_dislike_user_id', 'post_reaction', ['post_id', 'dislike', 'user_id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_reaction_post_id_dislike_user_id', table_name='post_reaction')
+    op.drop_index('ix_post_reaction_user_id_dislike_post_id', table_name='post_reaction')
+    op.drop_index('ix_posts_owner_id_timestamp_id', table_name='posts')
+    op.drop_index('ix_posts_timestamp_id', table_name='posts')
@@ -0,0 +1,59 @@
+"""Follows and materialized home timelines
+
+Revision ID: 52554660d820
+Revises: a533a92b5f26
+Create Date: 2026-10-17 10:02:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '52554660d820'
+down_revision: Union[str, None] = 'a533a92b5f26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'follows',
+        sa.Column('follower_id', sa.Integer(), nullable=False),
+        sa.Column('followee_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['followee_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['follower_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    op.create_index(op.f('ix_follows_followee_id'), 'follows', ['followee_id'], unique=False)
+    op.create_table(
+        'timeline',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index(op.f('ix_timeline_post_id'), 'timeline', ['post_id'], unique=False)
+    op.create_index('ix_timeline_user_id_timestamp_post_id', 'timeline', ['user_id', 'timestamp', 'post_id'],
+                    unique=False)
+    # Every user sees own posts in the timeline
+    op.execute(
+        "INSERT INTO timeline (user_id, post_id, timestamp) "
+        "SELECT owner_id, id, timestamp FROM posts WHERE owner_id IS NOT NULL AND timestamp IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_timeline_user_id_timestamp_post_id', table_name='timeline')
+    op.drop_index(op.f('ix_timeline_post_id'), table_name='timeline')
+    op.drop_table('timeline')
+    op.drop_index(op.f('ix_follows_followee_id'), table_name='follows')
+    op.drop_table('follows')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('followers_count')
@@ -0,0 +1,37 @@
+"""Stored likes/dislikes counters of posts
+
+Revision ID: a533a92b5f26
+Revises: 59b3baf5913a
+Create Date: 2026-10-17 10:01:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a533a92b5f26'
+down_revision: Union[str, None] = '59b3baf5913a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.add_column(sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('dislikes_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE posts SET "
+        "likes_count = (SELECT count(1) FROM post_reaction "
+        "WHERE post_reaction.post_id = posts.id AND post_reaction.dislike = false), "
+        "dislikes_count = (SELECT count(1) FROM post_reaction "
+        "WHERE post_reaction.post_id = posts.id AND post_reaction.dislike = true)"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('dislikes_count')
+        batch_op.drop_column('likes_count')
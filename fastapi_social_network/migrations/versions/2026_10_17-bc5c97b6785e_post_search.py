@@ -0,0 +1,34 @@
+"""Full-text search index of post bodies
+
+Revision ID: bc5c97b6785e
+Revises: 4b6236846ff7
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bc5c97b6785e'
+down_revision: Union[str, None] = '4b6236846ff7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_context().dialect.name
+    if dialect == "sqlite":
+        op.execute("CREATE VIRTUAL TABLE posts_fts USING fts5(body, tokenize='porter unicode61')")
+        op.execute("INSERT INTO posts_fts (rowid, body) SELECT id, body FROM posts")
+    elif dialect == "postgresql":
+        op.execute("CREATE INDEX ix_posts_body_search ON posts USING gin (to_tsvector('english', coalesce(body, '')))")
+
+
+def downgrade() -> None:
+    dialect = op.get_context().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TABLE posts_fts")
+    elif dialect == "postgresql":
+        op.drop_index('ix_posts_body_search', table_name='posts')
@@ -0,0 +1,47 @@
+"""Stored stats of users
+
+Revision ID: e3f1c9a4b7d2
+Revises: 1ca29a56f46d
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f1c9a4b7d2'
+down_revision: Union[str, None] = '1ca29a56f46d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('posts_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('likes_received', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('dislikes_received', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('likes_given', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    # Same as crud.rebuild_user_stats, in SQL so that it also works for offline upgrades
+    op.execute(
+        "INSERT INTO user_stats (user_id, posts_count, likes_received, dislikes_received, likes_given) "
+        "SELECT users.id, "
+        "(SELECT count(*) FROM posts WHERE posts.owner_id = users.id), "
+        "(SELECT count(*) FROM post_reaction JOIN posts ON posts.id = post_reaction.post_id "
+        "WHERE posts.owner_id = users.id AND NOT post_reaction.dislike), "
+        "(SELECT count(*) FROM post_reaction JOIN posts ON posts.id = post_reaction.post_id "
+        "WHERE posts.owner_id = users.id AND post_reaction.dislike), "
+        "(SELECT count(*) FROM post_reaction WHERE post_reaction.user_id = users.id AND NOT post_reaction.dislike) "
+        "FROM users"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
@@ -1,4 +1,8 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Boolean, select, func
+from datetime import datetime
+
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Boolean, Float, Index, DDL, event, func, \
+    literal_column
+from sqlalchemy.sql import table, column
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 
@@ -12,6 +16,7 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     alias = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     posts = relationship("Post", back_populates="owner")
     reactions = relationship("PostReaction", back_populates="user", cascade="all, delete, delete-orphan")
@@ -21,34 +26,32 @@ class Post(Base):
     __tablename__ = "posts"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime)
+    timestamp = Column(DateTime, default=datetime.now)
     body = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
 
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    dislikes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Maintained by crud from counters and timestamp, see crud.trending_score
+    trending_score = Column(Float, nullable=False, default=0.0, server_default="0")
+
     owner = relationship("User", back_populates="posts")
     reactions = relationship("PostReaction", back_populates="post", cascade="all, delete, delete-orphan")
 
+    __table_args__ = (
+        # Newest Posts first, all and by owner; trending Posts first
+        Index("ix_posts_timestamp_id", "timestamp", "id"),
+        Index("ix_posts_owner_id_timestamp_id", "owner_id", "timestamp", "id"),
+        Index("ix_posts_trending_score_id", "trending_score", "id"),
+    )
+
     @hybrid_property
     def likes(self):
-        return sum(not r.dislike for r in self.reactions)
-
-    @likes.expression
-    def likes(cls):
-        return select(func.count(1)
-                      .filter(PostReaction.dislike == False))\
-            .filter(PostReaction.post_id == cls.id)\
-            .label("likes")
+        return self.likes_count
 
     @hybrid_property
     def dislikes(self):
-        return sum(r.dislike for r in self.reactions)
-
-    @dislikes.expression
-    def dislikes(cls):
-        return select(func.count(1)
-                      .filter(PostReaction.dislike == True))\
-            .filter(PostReaction.post_id == cls.id)\
-            .label("dislikes")
+        return self.dislikes_count
 
 
 class PostReaction(Base):
@@ -59,3 +62,68 @@ class PostReaction(Base):
     user = relationship("User", back_populates="reactions")
     post = relationship("Post", back_populates="reactions")
 
+    __table_args__ = (
+        # Posts liked/disliked by a User, and Users who liked/disliked a Post
+        Index("ix_post_reaction_user_id_dislike_post_id", "user_id", "dislike", "post_id"),
+        Index("ix_post_reaction_post_id_dislike_user_id", "post_id", "dislike", "user_id"),
+    )
+
+
+class UserStats(Base):
+    """
+    Counters of a User, maintained by crud along with the changes they count, see crud.rebuild_user_stats
+    """
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    posts_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Reactions to Posts of the User
+    likes_received = Column(Integer, nullable=False, default=0, server_default="0")
+    dislikes_received = Column(Integer, nullable=False, default=0, server_default="0")
+    # Reactions of the User to Posts of others
+    likes_given = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class Follow(Base):
+    __tablename__ = "follows"
+    follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+
+
+class TimelineEntry(Base):
+    """
+    Post in the home timeline of a User, written when the Post is created (fan-out-on-write).
+    Post timestamp is copied here so that reading a timeline page is a range scan of a single index.
+    """
+    __tablename__ = "timeline"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), primary_key=True, index=True)
+    timestamp = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_timeline_user_id_timestamp_post_id", "user_id", "timestamp", "post_id"),
+    )
+
+
+# Full-text search over Post bodies. SQLite keeps a copy of bodies in a FTS5 table maintained by crud, PostgreSQL
+# uses a GIN index over the body tsvector. Neither can be described by Table/Index, so they are created with DDL
+# and are not part of the metadata.
+POST_SEARCH_CONFIG = "english"
+
+posts_fts = table("posts_fts", column("rowid", Integer), column("body", String), column("rank", Float))
+
+
+def post_search_vector(body_column):
+    """
+    :return: tsvector expression of Post body, same as the one of the PostgreSQL search index
+    """
+    return func.to_tsvector(literal_column(f"'{POST_SEARCH_CONFIG}'"), func.coalesce(body_column, literal_column("''")))
+
+
+event.listen(Post.__table__, "after_create", DDL(
+    "CREATE VIRTUAL TABLE posts_fts USING fts5(body, tokenize='porter unicode61')"
+).execute_if(dialect="sqlite"))
+event.listen(Post.__table__, "before_drop", DDL("DROP TABLE IF EXISTS posts_fts").execute_if(dialect="sqlite"))
+event.listen(Post.__table__, "after_create", DDL(
+    f"CREATE INDEX ix_posts_body_search ON posts USING gin "
+    f"(to_tsvector('{POST_SEARCH_CONFIG}', coalesce(body, '')))"
+).execute_if(dialect="postgresql"))
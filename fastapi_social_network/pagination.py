@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Sequence
+
+from fastapi import HTTPException, Query, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class Pagination:
+    skip: int = 0
+    limit: int = 100
+    cursor: tuple | None = None
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    raise TypeError(f"Cannot encode {type(value).__name__} in cursor")
+
+
+def _decode_object(obj: dict):
+    if obj.keys() == {"dt"}:
+        return datetime.fromisoformat(obj["dt"])
+    return obj
+
+
+def encode_cursor(values: Sequence) -> str:
+    """
+    Encodes sort key of the last item of a page into an opaque url-safe token
+    """
+    raw = json.dumps(list(values), default=_encode_value, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, key_types: Sequence[type]) -> tuple:
+    """
+    Decodes a token made by encode_cursor, checking that it holds a sort key of expected types
+    :raises InvalidCursor: if the token is malformed or holds a key of another shape
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw, object_hook=_decode_object)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor() from e
+    if not isinstance(values, list) or len(values) != len(key_types):
+        raise InvalidCursor()
+    if not all(type(value) is key_type for value, key_type in zip(values, key_types)):
+        raise InvalidCursor()
+    return tuple(values)
+
+
+def pagination_params(*key_types: type) -> Callable[..., Pagination]:
+    """
+    Creates a dependency reading skip/limit/cursor query parameters for lists sorted by key of given types
+    """
+    def dependency(skip: int = 0, limit: int = 100,
+                   cursor: str | None = Query(None, description=f"Value of {NEXT_CURSOR_HEADER} header "
+                                                                 f"from the previous page; cannot be combined with "
+                                                                 f"skip")):
+        if cursor is None:
+            return Pagination(skip=skip, limit=limit)
+        if skip:
+            # Pages continue right after the cursor, skipping more would silently drop items
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="cursor cannot be combined with skip")
+        try:
+            return Pagination(skip=skip, limit=limit, cursor=decode_cursor(cursor, key_types))
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return dependency
+
+
+def post_key(post) -> tuple:
+    return post.timestamp, post.id
+
+
+def id_key(obj) -> tuple:
+    return obj.id,
+
+
+def trending_key(post) -> tuple:
+    return post.trending_score, post.id
+
+
+def search_key(result) -> tuple:
+    post, score = result
+    return score, post.id
+
+
+post_pagination = pagination_params(datetime, int)
+id_pagination = pagination_params(int)
+search_pagination = pagination_params(float, int)
+trending_pagination = pagination_params(float, int)
+
+
+def next_cursor_headers(items: list, page: Pagination, key: Callable[[Any], tuple]) -> dict[str, str]:
+    """
+    :return: headers with the next page cursor if the page is full and there might be more items
+    """
+    if items and len(items) >= page.limit:
+        return {NEXT_CURSOR_HEADER: encode_cursor(key(items[-1]))}
+    return {}
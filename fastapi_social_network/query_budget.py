@@ -0,0 +1,144 @@
+"""
+Request-scoped counting of SQL statements, with per-route budgets catching N+1 query patterns.
+A request exceeds its budget when it executes too many statements, or the same statement too many times
+(typically lazy loads in a loop). In prod this is logged, in dev and test the request fails.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings, Environment
+
+logger = logging.getLogger(__name__)
+
+# Routes are identified by method and path template, requests not matching any route share one path
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    db_time: float = 0.0
+    # Number of executions of each statement text
+    shapes: Counter = field(default_factory=Counter)
+
+    def most_repeated(self) -> tuple[str, int]:
+        return self.shapes.most_common(1)[0] if self.shapes else ("", 0)
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    statements: int = settings.query_budget_statements
+    repeats: int = settings.query_budget_repeats
+
+    def violation(self, stats: QueryStats) -> str | None:
+        """
+        :return: description of how stats exceed the budget, None if they don't
+        """
+        if stats.statements > self.statements:
+            return f"{stats.statements} SQL statements, budget is {self.statements}"
+        statement, count = stats.most_repeated()
+        if count > self.repeats:
+            return f"same SQL statement executed {count} times, budget is {self.repeats}: {statement}"
+        return None
+
+
+# Statistics collectors active in the current context, innermost last
+_active_stats: ContextVar[tuple[QueryStats, ...]] = ContextVar("active_query_stats", default=())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Counts SQL statements executed by any engine within the block, in the current context and its tasks and
+    greenlets (so including AsyncSession work)
+    """
+    stats = QueryStats()
+    token = _active_stats.set(_active_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_stats.get():
+        conn.info.setdefault("query_budget_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    active = _active_stats.get()
+    if not active:
+        return
+    elapsed = time.perf_counter() - conn.info["query_budget_start_time"].pop()
+    for stats in active:
+        stats.statements += 1
+        stats.db_time += elapsed
+        stats.shapes[statement] += 1
+
+
+def route_template(scope: Scope) -> str:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+# Callbacks receiving (method, route, stats) of each finished request, used by tests
+request_observers: list[Callable[[str, str, QueryStats], None]] = []
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware checking SQL statements of each HTTP request against the budget of its route.
+    The check is done when the response starts, so that in strict mode the request fails with 500 instead.
+    """
+    def __init__(self, app: ASGIApp, budgets: dict[tuple[str, str], QueryBudget] | None = None,
+                 strict: bool | None = None):
+        self.app = app
+        self.budgets = budgets or {}
+        self.strict = settings.app_env != Environment.prod if strict is None else strict
+        self.default_budget = QueryBudget()
+
+    def check(self, method: str, route: str, stats: QueryStats):
+        violation = self.budgets.get((method, route), self.default_budget).violation(stats)
+        if violation is None:
+            return
+        message = f"{method} {route} exceeded its query budget: {violation}"
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                self.check(method, route_template(scope), stats)
+            await send(message)
+
+        method = scope["method"]
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                for observer in request_observers:
+                    observer(method, route_template(scope), stats)
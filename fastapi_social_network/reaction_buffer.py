@@ -0,0 +1,261 @@
+"""
+Write-behind buffer of reactions (REACTION_BUFFER_ENABLED): reaction routes check the Post and return at once, and
+changes are kept in memory, the last one for each (post_id, user_id) winning, then applied in a single transaction
+every reaction_buffer_flush_ms or once reaction_buffer_max_items changes are waiting.
+Until then, reaction counters in responses do not include buffered changes.
+Once reaction_buffer_max_pending changes are waiting, e.g. while the database is down, routes write their changes
+themselves, slowing down instead of growing the buffer without bound; changes of reactions being flushed are still
+buffered, so that the last one wins, and at most twice as many changes are kept. After MAX_ATTEMPTS failed flushes
+in a row, changes are written one by one, and those that keep failing while others are written are dropped.
+Changes that cannot be written on shutdown are saved to reaction_buffer_fallback_path and applied on next startup.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, crud_async, models, schemas
+from .config import settings
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+Changes = dict[tuple[int, int], schemas.ReactionAction]
+
+# Callbacks receiving (number of changes, seconds) of each successful flush, used by metrics
+flush_observers: list[Callable[[int, float], None]] = []
+
+# Failed flushes in a row before changes are written one by one, and failures of a change written alone before it is
+# dropped
+MAX_ATTEMPTS = 3
+# Changes failing one after another, none being written, when written one by one: the database is likely down, the
+# other changes are not tried
+OUTAGE_PROBES = 3
+
+
+class ReactionBuffer:
+    def __init__(self, flush_interval: float, max_items: int, fallback_path: str, max_pending: int,
+                 session_factory: Callable[[], AsyncSession] = AsyncSessionLocal):
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.max_pending = max_pending
+        self.fallback_path = fallback_path
+        self.session_factory = session_factory
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+        self._pending: Changes = {}
+        # Keys of the changes being written by flush, put back pending if that fails
+        self._in_flight: set[tuple[int, int]] = set()
+        # Failed flushes in a row, and failures of changes written alone
+        self._failed_flushes = 0
+        self._attempts: dict[tuple[int, int], int] = {}
+        self._task: asyncio.Task | None = None
+        self._full: asyncio.Event | None = None
+        # Set when changes loaded from the fallback file are pending, the file is removed once they are written
+        self._replaying = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, post_id: int, user_id: int, action: schemas.ReactionAction) -> bool:
+        """
+        :return: whether the change is buffered, False if max_pending changes are already waiting. Changes of keys
+            being written are always buffered: if written by the caller instead, a failed flush would put the older
+            change back pending, overwriting this one on the next flush
+        """
+        key = post_id, user_id
+        if key not in self._pending and key not in self._in_flight and len(self._pending) >= self.max_pending:
+            return False
+        self._pending[key] = action
+        # A new change, which may not fail
+        self._attempts.pop(key, None)
+        if len(self._pending) >= self.max_items and self._full is not None:
+            self._full.set()
+        return True
+
+    async def _write(self, changes: Changes) -> int:
+        async with self.session_factory() as db:
+            return await db.run_sync(crud.apply_reactions, changes)
+
+    async def flush(self) -> int:
+        """
+        Writes pending changes; on failure or cancellation they are kept pending, behind changes made meanwhile.
+        Changes are final states, so writing them again if they were committed after all is harmless.
+        After MAX_ATTEMPTS failures in a row, changes are written one by one, see _write_each.
+        :return: number of written changes, without those of Posts deleted meanwhile
+        """
+        if not self._pending:
+            return 0
+        changes, self._pending = self._pending, {}
+        self._in_flight = set(changes)
+        start = time.perf_counter()
+        try:
+            if self._failed_flushes >= MAX_ATTEMPTS and len(changes) > 1:
+                written = await self._write_each(changes)
+            else:
+                try:
+                    written = await self._write(changes)
+                except BaseException:
+                    self.failures += 1
+                    self._failed_flushes += 1
+                    self._pending = {**changes, **self._pending}
+                    raise
+                self._failed_flushes = 0
+                self._attempts.clear()
+        finally:
+            self._in_flight = set()
+        elapsed = time.perf_counter() - start
+        self.flushed += written
+        if self._replaying:
+            self._replaying = False
+            os.remove(self.fallback_path)
+        for observer in flush_observers:
+            observer(written, elapsed)
+        return written
+
+    async def _write_each(self, changes: Changes) -> int:
+        """
+        Writes changes one by one, so that a change failing every time does not keep the others from being written.
+        Failing changes are kept pending behind the others, and dropped after failing MAX_ATTEMPTS times while others
+        were written. If OUTAGE_PROBES changes fail before any is written, the others are kept pending untried.
+        :return: number of written changes
+        :raises Exception: the last failure, if no change was written
+        """
+        written = succeeded = 0
+        failed: Changes = {}
+        untried = dict(changes)
+        error = None
+        try:
+            for key, action in changes.items():
+                if not succeeded and len(failed) >= OUTAGE_PROBES:
+                    break
+                try:
+                    written += await self._write({key: action})
+                except Exception as e:
+                    self.failures += 1
+                    failed[key] = action
+                    error = e
+                else:
+                    succeeded += 1
+                    self._attempts.pop(key, None)
+                del untried[key]
+        finally:
+            # Also on cancellation
+            self._pending = {**untried, **failed, **self._pending}
+        if not succeeded:
+            raise error
+        for key, action in failed.items():
+            if self._pending.get(key) != action:
+                # Changed meanwhile
+                continue
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            if self._attempts[key] >= MAX_ATTEMPTS:
+                logger.error("Dropping reaction %s of user %d to post %d, failed %d times", action.value, key[1],
+                             key[0], self._attempts.pop(key))
+                del self._pending[key]
+                self.dropped += 1
+        if not any(key in self._attempts for key in failed):
+            # No failing change left, back to batches
+            self._failed_flushes = 0
+        return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Writing %d buffered reactions failed, retrying", len(self._pending))
+
+    async def start(self):
+        """
+        Loads changes saved on last shutdown, and starts writing changes periodically
+        """
+        self.load_fallback()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops periodic writes and writes pending changes, saving them to the fallback file if that fails
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Writing buffered reactions failed")
+        # Changes failing when written one by one are kept pending without an exception
+        if self._pending:
+            logger.error("Saving %d buffered reactions to %s", len(self._pending), self.fallback_path)
+            self.save_fallback()
+
+    def save_fallback(self):
+        # Appended: the file may still hold changes of an earlier shutdown, older than these
+        with open(self.fallback_path, "a") as f:
+            for (post_id, user_id), action in self._pending.items():
+                f.write(json.dumps({"post_id": post_id, "user_id": user_id, "action": action.value}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = {}
+
+    def load_fallback(self):
+        if not os.path.exists(self.fallback_path):
+            return
+        with open(self.fallback_path) as f:
+            for line in f:
+                # Later lines are newer and win
+                change = json.loads(line)
+                self._pending[change["post_id"], change["user_id"]] = schemas.ReactionAction(change["action"])
+        self._replaying = True
+        logger.info("Loaded %d buffered reactions from %s", len(self._pending), self.fallback_path)
+
+    def stats(self) -> dict[str, int]:
+        return {"pending": len(self._pending), "flushed": self.flushed, "failures": self.failures,
+                "dropped": self.dropped}
+
+
+buffer = ReactionBuffer(
+    flush_interval=settings.reaction_buffer_flush_ms / 1000, max_items=settings.reaction_buffer_max_items,
+    fallback_path=settings.reaction_buffer_fallback_path, max_pending=settings.reaction_buffer_max_pending
+)
+
+
+async def react(db: AsyncSession, post_id: int, user_id: int, action: schemas.ReactionAction) -> models.Post | None:
+    """
+    Sets the reaction of a User to a Post, through the buffer if it is running
+    :return: the Post, None if there is no such Post
+    :raises crud.NoPermission: if the Post is owned by the User, unless the reaction is cleared
+    """
+    if buffer.running:
+        db_post = await crud_async.get_post(db=db, post_id=post_id)
+        if db_post is None:
+            return None
+        if db_post.owner_id == user_id and action != schemas.ReactionAction.clear:
+            raise crud.NoPermission()
+        if buffer.add(post_id, user_id, action):
+            return db_post
+        # The buffer is full: written by the request itself
+    if action == schemas.ReactionAction.clear:
+        return await crud_async.delete_reaction_user_post(db=db, post_id=post_id, user_id=user_id)
+    return await crud_async.react_user_post(db=db, post_id=post_id, user_id=user_id,
+                                            dislike=action == schemas.ReactionAction.dislike)
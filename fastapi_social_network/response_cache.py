@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from .cache import TTLCache
+from .config import settings
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def render(cls, content: Any, headers: dict[str, str] | None = None) -> "CachedResponse":
+        """
+        Serializes content to JSON the same way JSONResponse does, tagging it with a hash of the body
+        """
+        body = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        return cls(body=body, etag=etag, headers=headers or {})
+
+    def to_response(self, request: Request) -> Response:
+        """
+        :return: 304 Not Modified if the client already has this version, full response otherwise
+        """
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        # Weak comparison: tags of compressed responses are made weak by CompressionMiddleware
+        if self.etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) \
+                or if_none_match.strip() == "*":
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """
+    In-process cache of rendered responses.
+
+    Keys are made with key(namespace, *params), which includes a generation of the namespace, so invalidating a whole
+    namespace (e.g. all cached pages of a list) is a counter increment. Concurrent misses of the same key are
+    coalesced: only the first one calls the loader, the others wait for its result.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: defaultdict[str, int] = defaultdict(int)
+        self._loading: dict[Hashable, asyncio.Future] = {}
+
+    def key(self, namespace: str, *params: Hashable) -> tuple:
+        return namespace, self._generations[namespace], *params
+
+    def invalidate(self, namespace: str, *params: Hashable):
+        """
+        Drops the entry of given namespace and params, or all entries of the namespace if no params given.
+        Responses being loaded at the moment are not stored afterwards.
+        """
+        if params:
+            key = self.key(namespace, *params)
+            self._cache.pop(key)
+            self._loading.pop(key, None)
+        else:
+            self._generations[namespace] += 1
+
+    async def get_or_load(self, key: tuple,
+                          load: Callable[[], Awaitable[CachedResponse | None]]) -> CachedResponse | None:
+        """
+        :param load: coroutine function returning the response to cache, or None if there is nothing to cache
+        """
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            entry = await load()
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters get the exception too; mark it retrieved in case there are none
+            future.exception()
+            raise
+        else:
+            future.set_result(entry)
+            if entry is not None and self._loading.get(key) is future:
+                self._cache.set(key, entry)
+            return entry
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+response_cache = ResponseCache(maxsize=settings.response_cache_size, ttl=settings.response_cache_ttl)
@@ -10,6 +10,7 @@ def gen_errors_responses(codes: Set[int]) -> Dict[int, Dict]:
 
 RESPONSES_400 = gen_errors_responses({400})
 RESPONSES_401 = gen_errors_responses({401})
+RESPONSES_400_401 = gen_errors_responses({400, 401})
 RESPONSES_403 = gen_errors_responses({403})
 RESPONSES_404 = gen_errors_responses({404})
 RESPONSES_401_404 = gen_errors_responses({401, 404})
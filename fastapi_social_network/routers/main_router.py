@@ -1,17 +1,20 @@
 import re
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-from fastapi import Depends, HTTPException, status, APIRouter
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud, models, schemas
+from .. import crud_async, export, fast_responses, reaction_buffer, schemas
 from ..config import settings
-from ..database import engine
-from ..dependencies import authenticate_user, get_current_active_user, create_access_token, get_db
+from ..dependencies import authenticate_user, get_current_active_user, create_access_token, get_async_db, get_read_db
 from .. import responses
-
-models.Base.metadata.create_all(bind=engine)
+from ..query_budget import QueryBudget
+from ..pagination import Pagination, post_pagination, id_pagination, search_pagination, trending_pagination, \
+    post_key, id_key, search_key, trending_key, next_cursor_headers
+from ..response_cache import response_cache, CachedResponse
 
 SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
@@ -19,13 +22,24 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 SUB_RE = re.compile(r"^user:id:(\d*)$")
 
+MAX_BATCH_SIZE = 100
+
+# Routes allowed to execute more SQL statements than the default budget (see query_budget)
+QUERY_BUDGETS = {
+    # Reactions of a batch are upserted and counted one Post at a time
+    ("POST", "/reactions/batch"): QueryBudget(statements=3 * MAX_BATCH_SIZE + 7, repeats=MAX_BATCH_SIZE),
+}
+
+# Read-only routes use get_read_db (replicas), except those filling response_cache: a response loaded from a lagging
+# replica would be cached for everyone, including the user who just made the change.
 
 router = APIRouter()
 
 
 @router.post("/token", response_model=schemas.Token, responses=responses.RESPONSES_401)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,68 +54,212 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 
 @router.post("/users", response_model=schemas.User, responses=responses.RESPONSES_400)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud_async.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    db_user = crud.get_user_by_alias(db, alias=user.alias)
+    db_user = await crud_async.get_user_by_alias(db, alias=user.alias)
     if db_user:
         raise HTTPException(status_code=400, detail="Alias already in use")
-    return crud.create_user(db=db, user=user)
+    return await crud_async.create_user(db=db, user=user)
+
+
+def check_sparse_fields(fields: fast_responses.Fields, expand_owner: bool = False):
+    if expand_owner:
+        fast_responses.check_not_sparse(fields, "fields cannot be combined with expand")
+
+
+def check_batch_size(items: list | None):
+    if items is not None and len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many items in a batch, max is {MAX_BATCH_SIZE}")
+
 
+def owner_expansion(expand: list[schemas.PostExpansion] = Query([], description="Embed owners of Posts")) -> bool:
+    return schemas.PostExpansion.owner in expand
 
-@router.get("/users", response_model=list[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+
+def post_schema(expand_owner: bool) -> type[schemas.Post]:
+    return schemas.PostWithOwner if expand_owner else schemas.Post
+
+
+def expanded_posts_response(db_posts: list, headers: dict[str, str] | None = None) -> JSONResponse:
+    """
+    Posts with owners (loaded by crud with expand_owner), rendered here: response_model validation would take them
+    for schemas.Post, the first schema of the union, and drop the owners
+    """
+    return JSONResponse(jsonable_encoder([schemas.PostWithOwner.from_orm(post) for post in db_posts]), headers=headers)
+
+
+@router.get("/users", response_model=list[schemas.User], responses=responses.RESPONSES_400)
+async def read_users(response: Response, page: Pagination = Depends(id_pagination),
+                     ids: list[int] | None = Query(None, description="Get only Users with these ids, in this order"),
+                     fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                     db: AsyncSession = Depends(get_read_db)):
+    if ids is not None:
+        check_batch_size(ids)
+        users = await crud_async.get_users_by_ids(db, user_ids=ids, rows=fields.rows, fields=fields.names)
+        return fast_responses.list_response(users, response, {}, fields)
+    users = await crud_async.get_users(db, skip=page.skip, limit=page.limit, cursor=page.cursor, rows=fields.rows,
+                                       fields=fields.names)
+    return fast_responses.list_response(users, response, next_cursor_headers(users, page, id_key), fields)
 
 
 @router.get("/users/me", response_model=schemas.User, responses=responses.RESPONSES_401)
-def read_user_self(user: models.User = Depends(get_current_active_user)):
+async def read_user_self(user: schemas.User = Depends(get_current_active_user)):
     return user
 
 
 @router.get("/users/{user_id}", response_model=schemas.User, responses=responses.RESPONSES_404)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
-    if db_user is None:
+async def read_user(user_id: int, request: Request, fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                    db: AsyncSession = Depends(get_async_db)):
+    if fields.sparse:
+        row = await crud_async.get_user(db, user_id=user_id, rows=True, fields=fields.names)
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return fast_responses.item_response(row, fields)
+
+    async def load():
+        db_user = await crud_async.get_user(db, user_id=user_id)
+        return None if db_user is None else CachedResponse.render(schemas.User.from_orm(db_user))
+
+    cached = await response_cache.get_or_load(response_cache.key("user", user_id), load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
-
-
-@router.get("/users/{user_id}/posts", response_model=list[schemas.Post], responses=responses.RESPONSES_404)
-def read_user_posts(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_posts = crud.get_posts(db=db, skip=skip, limit=limit, user_id=user_id)
+    return cached.to_response(request)
+
+
+@router.get("/users/{user_id}/posts", response_model=list[schemas.Post | schemas.PostWithOwner],
+            responses=responses.RESPONSES_404)
+async def read_user_posts(user_id: int, response: Response, page: Pagination = Depends(post_pagination),
+                          expand_owner: bool = Depends(owner_expansion),
+                          fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                          db: AsyncSession = Depends(get_read_db)):
+    check_sparse_fields(fields, expand_owner=expand_owner)
+    db_posts = await crud_async.get_posts(db=db, skip=page.skip, limit=page.limit, user_id=user_id,
+                                          cursor=page.cursor, rows=fields.rows and not expand_owner,
+                                          expand_owner=expand_owner, fields=fields.names)
     if db_posts is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_posts
+    if expand_owner:
+        return expanded_posts_response(db_posts, next_cursor_headers(db_posts, page, post_key))
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
-@router.get("/posts", response_model=list[schemas.Post])
-def read_posts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_posts(db=db, skip=skip, limit=limit)
+@router.get("/users/{user_id}/stats", response_model=schemas.UserStats, responses=responses.RESPONSES_404)
+async def read_user_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Number of Posts of the User, likes and dislikes of their Posts, and likes they gave
+    """
+    db_stats = await crud_async.get_user_stats(db, user_id=user_id)
+    if db_stats is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_stats
+
+
+@router.get("/posts", response_model=list[schemas.Post | schemas.PostWithOwner], responses=responses.RESPONSES_400)
+async def read_posts(request: Request, response: Response, page: Pagination = Depends(post_pagination),
+                     ids: list[int] | None = Query(None, description="Get only Posts with these ids, in this order"),
+                     expand_owner: bool = Depends(owner_expansion),
+                     fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                     db: AsyncSession = Depends(get_async_db)):
+    check_sparse_fields(fields, expand_owner=expand_owner)
+    if ids is not None:
+        check_batch_size(ids)
+        db_posts = await crud_async.get_posts_by_ids(db, post_ids=ids, rows=fields.rows and not expand_owner,
+                                                     expand_owner=expand_owner, fields=fields.names)
+        if expand_owner:
+            return expanded_posts_response(db_posts)
+        return fast_responses.list_response(db_posts, response, {}, fields)
+    if page.skip == 0 and page.cursor is None and not fields.sparse:
+        # First pages are the hottest ones, serve them from cache
+        async def load():
+            db_posts = await crud_async.get_posts(db=db, limit=page.limit, expand_owner=expand_owner)
+            return CachedResponse.render([post_schema(expand_owner).from_orm(post) for post in db_posts],
+                                         headers=next_cursor_headers(db_posts, page, post_key))
+
+        cached = await response_cache.get_or_load(response_cache.key("posts", page.limit, expand_owner), load)
+        return cached.to_response(request)
+    db_posts = await crud_async.get_posts(db=db, skip=page.skip, limit=page.limit, cursor=page.cursor,
+                                          rows=fields.rows and not expand_owner, expand_owner=expand_owner,
+                                          fields=fields.names)
+    if expand_owner:
+        return expanded_posts_response(db_posts, next_cursor_headers(db_posts, page, post_key))
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
 @router.post("/posts", response_model=schemas.Post, responses=responses.RESPONSES_401)
-def create_post(post: schemas.PostCreate, user: models.User = Depends(get_current_active_user),
-                db: Session = Depends(get_db)):
-    return crud.create_user_post(db=db, post=post, user_id=user.id)
+async def create_post(post: schemas.PostCreate, user: schemas.User = Depends(get_current_active_user),
+                      db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.create_user_post(db=db, post=post, user_id=user.id)
+
+
+@router.get("/posts/trending", response_model=list[schemas.Post | schemas.PostWithOwner],
+            responses=responses.RESPONSES_400)
+async def read_trending_posts(request: Request, response: Response, page: Pagination = Depends(trending_pagination),
+                              expand_owner: bool = Depends(owner_expansion),
+                              fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                              db: AsyncSession = Depends(get_async_db)):
+    check_sparse_fields(fields, expand_owner=expand_owner)
+    if page.skip == 0 and page.cursor is None and not fields.sparse:
+        async def load():
+            db_posts = await crud_async.get_trending_posts(db=db, limit=page.limit, expand_owner=expand_owner)
+            return CachedResponse.render([post_schema(expand_owner).from_orm(post) for post in db_posts],
+                                         headers=next_cursor_headers(db_posts, page, trending_key))
+
+        # Cached with other Post lists, so that it is dropped when any Post or reaction changes
+        cached = await response_cache.get_or_load(
+            response_cache.key("posts", "trending", page.limit, expand_owner), load
+        )
+        return cached.to_response(request)
+    db_posts = await crud_async.get_trending_posts(db=db, skip=page.skip, limit=page.limit, cursor=page.cursor,
+                                                   rows=fields.rows and not expand_owner,
+                                                   expand_owner=expand_owner, fields=fields.names)
+    if expand_owner:
+        return expanded_posts_response(db_posts, next_cursor_headers(db_posts, page, trending_key))
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, trending_key),
+                                        fields)
+
+
+@router.get("/posts/search", response_model=list[schemas.Post], responses=responses.RESPONSES_400)
+async def search_posts(response: Response, q: str = Query(min_length=1, max_length=256, description="Words to search"),
+                       page: Pagination = Depends(search_pagination),
+                       fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                       db: AsyncSession = Depends(get_read_db)):
+    results = await crud_async.search_posts(db=db, text=q, skip=page.skip, limit=page.limit, cursor=page.cursor,
+                                            rows=fields.rows, fields=fields.names)
+    return fast_responses.list_response([post for post, _ in results], response,
+                                        next_cursor_headers(results, page, search_key), fields)
+
+
+@router.get("/posts/{post_id}", response_model=schemas.Post | schemas.PostWithOwner, responses=responses.RESPONSES_404)
+async def get_post(post_id: int, request: Request, expand_owner: bool = Depends(owner_expansion),
+                   fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                   db: AsyncSession = Depends(get_async_db)):
+    check_sparse_fields(fields, expand_owner=expand_owner)
+    if fields.sparse:
+        row = await crud_async.get_post(db=db, post_id=post_id, rows=True, fields=fields.names)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return fast_responses.item_response(row, fields)
 
+    async def load():
+        db_post = await crud_async.get_post(db=db, post_id=post_id, expand_owner=expand_owner)
+        return None if db_post is None else CachedResponse.render(post_schema(expand_owner).from_orm(db_post))
 
-@router.get("/posts/{post_id}", response_model=schemas.Post, responses=responses.RESPONSES_404)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    db_post = crud.get_post(db=db, post_id=post_id)
-    if db_post is None:
+    # Changes of a Post drop only its non-expanded response, expanded ones are cached with Post lists instead
+    key = response_cache.key("posts", "post", post_id) if expand_owner else response_cache.key("post", post_id)
+    cached = await response_cache.get_or_load(key, load)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return db_post
+    return cached.to_response(request)
 
 
 @router.put("/posts/{post_id}", response_model=schemas.Post, responses=responses.RESPONSES_401_403_404)
-def update_post(post_id: int, post: schemas.PostBase, db: Session = Depends(get_db),
-                user: models.User = Depends(get_current_active_user)):
+async def update_post(post_id: int, post: schemas.PostBase, db: AsyncSession = Depends(get_async_db),
+                      user: schemas.User = Depends(get_current_active_user)):
     try:
-        edited_db_post = crud.edit_user_post(db=db, post_id=post_id, post=post, user_id=user.id)
-    except crud.NoPermission:
+        edited_db_post = await crud_async.edit_user_post(db=db, post_id=post_id, post=post, user_id=user.id)
+    except crud_async.NoPermission:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Action not allowed"
@@ -116,10 +274,11 @@ def update_post(post_id: int, post: schemas.PostBase, db: Session = Depends(get_
 
 
 @router.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT, responses=responses.RESPONSES_401_403_404)
-def delete_post(post_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_active_user)):
+async def delete_post(post_id: int, db: AsyncSession = Depends(get_async_db),
+                      user: schemas.User = Depends(get_current_active_user)):
     try:
-        result = crud.delete_user_post(db=db, post_id=post_id, user_id=user.id)
-    except crud.NoPermission:
+        result = await crud_async.delete_user_post(db=db, post_id=post_id, user_id=user.id)
+    except crud_async.NoPermission:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Action not allowed"
@@ -136,49 +295,90 @@ def delete_post(post_id: int, db: Session = Depends(get_db), user: models.User =
 @router.delete("/posts/{post_id}/likes", response_model=schemas.Post, responses=responses.RESPONSES_401_404)
 @router.delete("/posts/{post_id}/dislikes", response_model=schemas.Post, responses=responses.RESPONSES_401_404)
 @router.delete("/posts/{post_id}/clear_reaction", response_model=schemas.Post, responses=responses.RESPONSES_401_404)
-def clear_reaction_post(post_id: int, db: Session = Depends(get_db),
-                        user: models.User = Depends(get_current_active_user)):
+async def clear_reaction_post(post_id: int, db: AsyncSession = Depends(get_async_db),
+                              user: schemas.User = Depends(get_current_active_user)):
     """
     Clears the reaction (like, dislike) off a Post, provided Post id.
     Alternative paths provided for convenience; be wary that it will remove both like or dislike!
     """
-    db_post = crud.delete_reaction_user_post(db=db, post_id=post_id, user_id=user.id)
+    db_post = await reaction_buffer.react(db=db, post_id=post_id, user_id=user.id,
+                                          action=schemas.ReactionAction.clear)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     return db_post
 
 
+@router.post("/reactions/batch", response_model=list[schemas.ReactionResult], responses=responses.RESPONSES_400_401)
+async def react_posts(operations: list[schemas.ReactionOperation], db: AsyncSession = Depends(get_async_db),
+                      user: schemas.User = Depends(get_current_active_user)):
+    """
+    Likes, dislikes or clears reactions off many Posts in one transaction.
+    Returns a result for each operation, in the same order; results for the same Post show its final state.
+    """
+    check_batch_size(operations)
+    results = await crud_async.react_user_posts(db=db, user_id=user.id, operations=operations)
+    batch_results = []
+    for operation, result in zip(operations, results):
+        if result is None:
+            batch_results.append(schemas.ReactionResult(
+                post_id=operation.post_id, status_code=status.HTTP_404_NOT_FOUND, detail="Post not found"
+            ))
+        elif isinstance(result, crud_async.NoPermission):
+            batch_results.append(schemas.ReactionResult(
+                post_id=operation.post_id, status_code=status.HTTP_403_FORBIDDEN, detail="Cannot react to own post"
+            ))
+        else:
+            batch_results.append(schemas.ReactionResult(
+                post_id=operation.post_id, status_code=status.HTTP_200_OK, post=schemas.Post.from_orm(result)
+            ))
+    return batch_results
+
+
 # Like
 @router.get("/posts/{post_id}/likes", response_model=list[schemas.User], responses=responses.RESPONSES_404)
-def get_post_likes(post_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_users = crud.get_users_reactions_by_post(db=db, post_id=post_id, skip=skip, limit=limit, dislike=False)
+async def get_post_likes(post_id: int, response: Response, page: Pagination = Depends(id_pagination),
+                         fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                         db: AsyncSession = Depends(get_read_db)):
+    db_users = await crud_async.get_users_reactions_by_post(db=db, post_id=post_id, skip=page.skip,
+                                                            limit=page.limit, dislike=False, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
     if db_users is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return db_users
+    return fast_responses.list_response(db_users, response, next_cursor_headers(db_users, page, id_key), fields)
 
 
 @router.get("/users/me/likes", response_model=list[schemas.Post], responses=responses.RESPONSES_401)
-def get_user_self_likes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                        user: models.User = Depends(get_current_active_user)):
-    db_posts = crud.get_posts_reactions_by_user(db=db, user_id=user.id, skip=skip, limit=limit, dislike=False)
-    return db_posts
+async def get_user_self_likes(response: Response, page: Pagination = Depends(post_pagination),
+                              fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                              db: AsyncSession = Depends(get_read_db),
+                              user: schemas.User = Depends(get_current_active_user)):
+    db_posts = await crud_async.get_posts_reactions_by_user(db=db, user_id=user.id, skip=page.skip,
+                                                            limit=page.limit, dislike=False, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
 @router.get("/users/{user_id}/likes", response_model=list[schemas.Post], responses=responses.RESPONSES_404)
-def get_user_likes(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_posts = crud.get_posts_reactions_by_user(db=db, user_id=user_id, skip=skip, limit=limit, dislike=False)
+async def get_user_likes(user_id: int, response: Response, page: Pagination = Depends(post_pagination),
+                         fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                         db: AsyncSession = Depends(get_read_db)):
+    db_posts = await crud_async.get_posts_reactions_by_user(db=db, user_id=user_id, skip=page.skip,
+                                                            limit=page.limit, dislike=False, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
     if db_posts is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_posts
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
 @router.put("/posts/{post_id}/likes", response_model=schemas.Post, responses=responses.RESPONSES_401_403_404)
-def like_post(post_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_active_user)):
+async def like_post(post_id: int, db: AsyncSession = Depends(get_async_db),
+                    user: schemas.User = Depends(get_current_active_user)):
     try:
-        db_post = crud.react_user_post(db=db, post_id=post_id, user_id=user.id, dislike=False)
+        db_post = await reaction_buffer.react(db=db, post_id=post_id, user_id=user.id,
+                                              action=schemas.ReactionAction.like)
         if db_post is None:
             raise HTTPException(status_code=404, detail="Post not found")
-    except crud.NoPermission:
+    except crud_async.NoPermission:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot like own post"
@@ -189,38 +389,148 @@ def like_post(post_id: int, db: Session = Depends(get_db), user: models.User = D
 
 # Dislike
 @router.get("/posts/{post_id}/dislikes", response_model=list[schemas.User], responses=responses.RESPONSES_404)
-def get_post_dislikes(post_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_users = crud.get_users_reactions_by_post(db=db, post_id=post_id, skip=skip, limit=limit, dislike=True)
+async def get_post_dislikes(post_id: int, response: Response, page: Pagination = Depends(id_pagination),
+                            fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                            db: AsyncSession = Depends(get_read_db)):
+    db_users = await crud_async.get_users_reactions_by_post(db=db, post_id=post_id, skip=page.skip,
+                                                            limit=page.limit, dislike=True, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
     if db_users is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return db_users
+    return fast_responses.list_response(db_users, response, next_cursor_headers(db_users, page, id_key), fields)
 
 
 @router.get("/users/me/dislikes", response_model=list[schemas.Post], responses=responses.RESPONSES_401)
-def get_user_self_dislikes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                           user: models.User = Depends(get_current_active_user)):
-    db_posts = crud.get_posts_reactions_by_user(db=db, user_id=user.id, skip=skip, limit=limit, dislike=True)
-    return db_posts
+async def get_user_self_dislikes(response: Response, page: Pagination = Depends(post_pagination),
+                                 fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                                 db: AsyncSession = Depends(get_read_db),
+                                 user: schemas.User = Depends(get_current_active_user)):
+    db_posts = await crud_async.get_posts_reactions_by_user(db=db, user_id=user.id, skip=page.skip,
+                                                            limit=page.limit, dislike=True, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
 @router.get("/users/{user_id}/dislikes", response_model=list[schemas.Post], responses=responses.RESPONSES_404)
-def get_user_dislikes(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_posts = crud.get_posts_reactions_by_user(db=db, user_id=user_id, skip=skip, limit=limit, dislike=True)
+async def get_user_dislikes(user_id: int, response: Response, page: Pagination = Depends(post_pagination),
+                            fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                            db: AsyncSession = Depends(get_read_db)):
+    db_posts = await crud_async.get_posts_reactions_by_user(db=db, user_id=user_id, skip=page.skip,
+                                                            limit=page.limit, dislike=True, cursor=page.cursor,
+                                                            rows=fields.rows, fields=fields.names)
     if db_posts is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_posts
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
 
 
 @router.put("/posts/{post_id}/dislikes", response_model=schemas.Post, responses=responses.RESPONSES_401_403_404)
-def dislike_post(post_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_active_user)):
+async def dislike_post(post_id: int, db: AsyncSession = Depends(get_async_db),
+                       user: schemas.User = Depends(get_current_active_user)):
     try:
-        db_post = crud.react_user_post(db=db, post_id=post_id, user_id=user.id, dislike=True)
+        db_post = await reaction_buffer.react(db=db, post_id=post_id, user_id=user.id,
+                                              action=schemas.ReactionAction.dislike)
         if db_post is None:
             raise HTTPException(status_code=404, detail="Post not found")
-    except crud.NoPermission:
+    except crud_async.NoPermission:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot dislike own post"
         )
     else:
         return db_post
+
+
+# Follows
+@router.get("/users/me/feed", response_model=list[schemas.Post | schemas.PostWithOwner],
+            responses=responses.RESPONSES_401)
+async def get_user_self_feed(response: Response, page: Pagination = Depends(post_pagination),
+                             expand_owner: bool = Depends(owner_expansion),
+                             fields: fast_responses.Fields = Depends(fast_responses.post_fields),
+                             db: AsyncSession = Depends(get_read_db),
+                             user: schemas.User = Depends(get_current_active_user)):
+    """
+    Newest Posts of the current User and of the Users they follow.
+    """
+    check_sparse_fields(fields, expand_owner=expand_owner)
+    db_posts = await crud_async.get_feed(db=db, user_id=user.id, skip=page.skip, limit=page.limit,
+                                         cursor=page.cursor, rows=fields.rows and not expand_owner,
+                                         expand_owner=expand_owner, fields=fields.names)
+    if expand_owner:
+        return expanded_posts_response(db_posts, next_cursor_headers(db_posts, page, post_key))
+    return fast_responses.list_response(db_posts, response, next_cursor_headers(db_posts, page, post_key), fields)
+
+
+@router.get("/users/{user_id}/followers", response_model=list[schemas.User], responses=responses.RESPONSES_404)
+async def get_user_followers(user_id: int, response: Response, page: Pagination = Depends(id_pagination),
+                             fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                             db: AsyncSession = Depends(get_read_db)):
+    db_users = await crud_async.get_followers(db=db, user_id=user_id, skip=page.skip, limit=page.limit,
+                                              cursor=page.cursor, rows=fields.rows, fields=fields.names)
+    if db_users is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return fast_responses.list_response(db_users, response, next_cursor_headers(db_users, page, id_key), fields)
+
+
+@router.get("/users/{user_id}/following", response_model=list[schemas.User], responses=responses.RESPONSES_404)
+async def get_user_following(user_id: int, response: Response, page: Pagination = Depends(id_pagination),
+                             fields: fast_responses.Fields = Depends(fast_responses.user_fields),
+                             db: AsyncSession = Depends(get_read_db)):
+    db_users = await crud_async.get_following(db=db, user_id=user_id, skip=page.skip, limit=page.limit,
+                                              cursor=page.cursor, rows=fields.rows, fields=fields.names)
+    if db_users is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return fast_responses.list_response(db_users, response, next_cursor_headers(db_users, page, id_key), fields)
+
+
+@router.put("/users/{user_id}/followers", response_model=schemas.User, responses=responses.RESPONSES_401_403_404)
+async def follow_user(user_id: int, db: AsyncSession = Depends(get_async_db),
+                      user: schemas.User = Depends(get_current_active_user)):
+    try:
+        db_user = await crud_async.follow_user(db=db, user_id=user_id, follower_id=user.id)
+        if db_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+    except crud_async.NoPermission:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot follow yourself"
+        )
+    else:
+        return db_user
+
+
+@router.delete("/users/{user_id}/followers", response_model=schemas.User, responses=responses.RESPONSES_401_404)
+async def unfollow_user(user_id: int, db: AsyncSession = Depends(get_async_db),
+                        user: schemas.User = Depends(get_current_active_user)):
+    db_user = await crud_async.unfollow_user(db=db, user_id=user_id, follower_id=user.id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+
+@router.get("/export/users", response_class=StreamingResponse, responses=responses.RESPONSES_401)
+async def export_users(after_id: int | None = Query(None, description="Export only Users with greater ids"),
+                       db: AsyncSession = Depends(get_read_db), _: schemas.User = Depends(get_current_active_user)):
+    """
+    All Users as NDJSON, one schemas.User per line, by id
+    """
+    return export.ndjson_response(db, crud_async.export_users_statement(after_id))
+
+
+@router.get("/export/posts", response_class=StreamingResponse, responses=responses.RESPONSES_401)
+async def export_posts(since: datetime | None = Query(None, description="Export only Posts created since"),
+                       db: AsyncSession = Depends(get_read_db), _: schemas.User = Depends(get_current_active_user)):
+    """
+    All Posts as NDJSON, one schemas.Post per line, by id
+    """
+    return export.ndjson_response(db, crud_async.export_posts_statement(since))
+
+
+@router.get("/export/reactions", response_class=StreamingResponse, responses=responses.RESPONSES_401)
+async def export_reactions(since: datetime | None = Query(None, description="Export only reactions to Posts "
+                                                                            "created since"),
+                           db: AsyncSession = Depends(get_read_db),
+                           _: schemas.User = Depends(get_current_active_user)):
+    """
+    All reactions as NDJSON, one {post_id, user_id, dislike} object per line, by Post
+    """
+    return export.ndjson_response(db, crud_async.export_reactions_statement(since))
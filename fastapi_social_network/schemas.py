@@ -1,4 +1,6 @@
 from datetime import datetime
+from enum import Enum
+
 from pydantic import BaseModel
 
 
@@ -50,6 +52,25 @@ class User(UserBase):
         orm_mode = True
 
 
+class UserStats(BaseModel):
+    user_id: int
+    posts_count: int
+    likes_received: int
+    dislikes_received: int
+    likes_given: int
+
+    class Config:
+        orm_mode = True
+
+
+class PostWithOwner(Post):
+    owner: User | None
+
+
+class PostExpansion(str, Enum):
+    owner = "owner"
+
+
 # Reaction
 class ReactionBase(BaseModel):
     dislike: bool
@@ -59,5 +80,23 @@ class Reaction(ReactionBase):
     pass
 
 
+class ReactionAction(str, Enum):
+    like = "like"
+    dislike = "dislike"
+    clear = "clear"
+
+
+class ReactionOperation(BaseModel):
+    post_id: int
+    action: ReactionAction
+
+
+class ReactionResult(BaseModel):
+    post_id: int
+    status_code: int
+    detail: str | None = None
+    post: Post | None = None
+
+
 class ResponseMessage(BaseModel):
     detail: str
@@ -1,5 +1,12 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
 from passlib.context import CryptContext
 
+from .config import settings, HashingExecutor
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
@@ -10,3 +17,70 @@ def hash_password(password: str):
 def verify_password(password: str, hashed_password: str):
     return pwd_context.verify(password, hashed_password)
 
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification in a bounded pool of workers, so slow bcrypt rounds never run on the
+    event loop and at most max_workers of them run at the same time; the rest wait in the pool queue.
+    """
+    def __init__(self, executor_type: HashingExecutor = HashingExecutor.thread, max_workers: int | None = None):
+        self.executor_type = executor_type
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._max_queued = 0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == HashingExecutor.process:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="password-hasher")
+            return self._executor
+
+    async def _run(self, fn, *args):
+        executor = self._get_executor()
+        with self._lock:
+            self._submitted += 1
+            self._max_queued = max(self._max_queued, self._queued())
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        finally:
+            with self._lock:
+                self._completed += 1
+
+    def _queued(self) -> int:
+        return max(0, self._submitted - self._completed - self.max_workers)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: number of workers, operations in progress or waiting for a worker, peak queue depth and total
+        completed operations
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "in_flight": self._submitted - self._completed,
+                "queued": self._queued(),
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHasher(settings.password_hash_executor, settings.password_hash_workers)
@@ -1,5 +1,5 @@
 import pytest
-from .db import DB_HOLDER
+from .db import DB_HOLDER, api_database
 
 
 @pytest.fixture(scope="class")
@@ -16,3 +16,41 @@ def get_test_db():
         print("Closing the db!")
         db.close()
 
+
+@pytest.fixture(scope="class")
+def api_client(tmp_path_factory):
+    """
+    Fixture that serves the app with a clear test database
+    :return: TestClient of the app
+    """
+    from fastapi.testclient import TestClient
+    from fastapi_social_network.app import app
+    from fastapi_social_network.dependencies import get_async_db
+
+    with api_database(tmp_path_factory.mktemp("api") / "api.db") as get_test_async_db:
+        app.dependency_overrides[get_async_db] = get_test_async_db
+        try:
+            with TestClient(app) as client:
+                yield client
+        finally:
+            app.dependency_overrides.pop(get_async_db)
+
+
+@pytest.fixture
+def query_counts():
+    """
+    Fixture collecting SQL statements executed by requests to the app
+    :return: list of (method, route, QueryStats) of finished requests
+    """
+    from fastapi_social_network import query_budget
+
+    records = []
+
+    def observer(method, route, stats):
+        records.append((method, route, stats))
+
+    query_budget.request_observers.append(observer)
+    try:
+        yield records
+    finally:
+        query_budget.request_observers.remove(observer)
@@ -1,7 +1,12 @@
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
-from fastapi_social_network.database import Base
+from fastapi_social_network.database import Base, get_async_url
+from fastapi_social_network.dependencies import recent_writers, token_cache, user_cache
+from fastapi_social_network.response_cache import response_cache
 
 
 class DbHolder:
@@ -25,3 +30,33 @@ class DbHolder:
 
 
 DB_HOLDER = DbHolder()
+
+
+@contextmanager
+def api_database(path):
+    """
+    Creates a clear SQLite database file for API tests
+    :return: replacement of the get_async_db dependency
+    """
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    async_engine = create_async_engine(get_async_url(url))
+    session_local = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine,
+                                 class_=AsyncSession)
+    # Users and responses cached by previous tests come from other databases
+    token_cache.clear()
+    user_cache.clear()
+    recent_writers.clear()
+    for namespace in ("post", "posts", "user"):
+        response_cache.invalidate(namespace)
+
+    async def get_test_async_db():
+        async with session_local() as db:
+            yield db
+
+    try:
+        yield get_test_async_db
+    finally:
+        async_engine.sync_engine.dispose()
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from fastapi_social_network.admission import AdmissionMiddleware, ConcurrencyLimiter, RouteClass, TokenBuckets
+from fastapi_social_network.dependencies import create_access_token
+
+
+def test_concurrency_limiter():
+    async def run():
+        limiter = ConcurrencyLimiter(limit=1, queue_size=1, timeout=0.05)
+        assert await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # The queue is full
+        assert not await limiter.acquire()
+        limiter.release()
+        assert await waiting
+        # Nobody releases in time
+        assert not await limiter.acquire()
+        limiter.release()
+        assert limiter.stats() == {"in_flight": 0, "waiting": 0, "rejected": 2}
+
+    asyncio.run(run())
+
+
+def test_token_buckets():
+    now = [0.0]
+    buckets = TokenBuckets(rate=2.0, burst=2, timer=lambda: now[0])
+    assert [buckets.take("user"), buckets.take("user"), buckets.take("other")] == [0, 0, 0]
+    assert buckets.take("user") == 0.5
+    now[0] = 0.5
+    assert buckets.take("user") == 0
+    assert TokenBuckets(rate=0, burst=0).take("user") == 0
+
+
+def test_middleware():
+    release = asyncio.Event()
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, limits={RouteClass.read: ConcurrencyLimiter(1, queue_size=0, timeout=1)},
+                       buckets=TokenBuckets(rate=0.5, burst=1))
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+
+    @app.post("/posts")
+    async def create_post():
+        pass
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            running = asyncio.ensure_future(client.get("/slow"))
+            await asyncio.sleep(0.01)
+            rejected = await client.get("/slow")
+            assert (rejected.status_code, rejected.headers["Retry-After"]) == (503, "1")
+            release.set()
+            assert (await running).status_code == 200
+
+            auth = {"Authorization": f"Bearer {create_access_token({'sub': 'user:id:1'})}"}
+            assert (await client.post("/posts", headers=auth)).status_code == 200
+            limited = await client.post("/posts", headers=auth)
+            assert (limited.status_code, limited.headers["Retry-After"]) == (429, "2")
+            # Anonymous writes are not rate limited
+            assert (await client.post("/posts")).status_code == 200
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.dataset import Dataset
+from benchmarks import serialization
+from benchmarks.load import compare, percentile
+from benchmarks.seed import seed
+from fastapi_social_network import models
+
+
+def test_seed(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bench.db'}"
+    dataset = Dataset(users=20, posts=200, reactions=500, follows=3)
+    counts = seed(url, dataset, chunk_size=64, log=lambda message: None)
+    assert counts == {"users": 20, "posts": 200, "post_reaction": 500, "follows": 60}
+
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            likes, dislikes = connection.execute(
+                select(func.sum(models.Post.likes_count), func.sum(models.Post.dislikes_count))
+            ).one()
+            assert likes + dislikes == 500
+            followers = connection.execute(select(func.sum(models.User.followers_count))).scalar()
+            assert followers == 60
+            own_reactions = connection.execute(
+                select(func.count(1)).select_from(models.PostReaction)
+                .join(models.Post, models.Post.id == models.PostReaction.post_id)
+                .filter(models.Post.owner_id == models.PostReaction.user_id)
+            ).scalar()
+            assert own_reactions == 0
+            likes_given, posts_count = connection.execute(
+                select(func.sum(models.UserStats.likes_given), func.sum(models.UserStats.posts_count))
+            ).one()
+            assert (likes_given, posts_count) == (likes, 200)
+        report = serialization.run(sessionmaker(bind=engine), limit=10, repeats=2)
+        assert set(report["pages"]) == {"posts", "users"}
+        assert all(page["default_ms"] > 0 for page in report["pages"].values())
+    finally:
+        engine.dispose()
+
+
+def test_report_helpers():
+    values = [i / 100 for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile([], 50)) == (0.5, 0.99, 0.0)
+
+    def report(rps, p50):
+        stats = {"throughput_rps": rps, "latency_ms": {"p50": p50, "p95": p50 * 2, "p99": p50 * 3}}
+        return {"total": stats, "endpoints": {"GET /posts": stats}}
+
+    rows = compare(report(100, 10), report(120, 5))
+    assert rows[0] == {"endpoint": "GET /posts", "throughput_rps": 20.0, "p50": -50.0, "p95": -50.0, "p99": -50.0}
+    assert rows[1]["endpoint"] == "total"
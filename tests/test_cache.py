@@ -0,0 +1,57 @@
+from fastapi_social_network import models, schemas
+from fastapi_social_network.cache import TTLCache
+from fastapi_social_network.dependencies import user_cache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expiration():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=10, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=1)
+    cache.set("c", 3, ttl=100)
+    timer.now = 5
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    timer.now = 10
+    assert cache.get("c") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 2}
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=10)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+class TestUserCacheInvalidation:
+    def test_update_and_delete(self, get_test_db):
+        db = get_test_db
+        user = models.User(alias="user", email="user@mail", hashed_password="not_a_hash")
+        db.add(user)
+        db.commit()
+        user_cache.set(user.id, schemas.User.from_orm(user))
+        user.alias = "renamed"
+        db.commit()
+        assert user_cache.get(user.id) is None
+        user_cache.set(user.id, schemas.User.from_orm(user))
+        db.delete(user)
+        db.commit()
+        assert user_cache.get(user.id) is None
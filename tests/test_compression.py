@@ -0,0 +1,73 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from fastapi_social_network import compression
+from fastapi_social_network.compression import CompressionMiddleware, negotiate_encoding
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("br", "br"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("GZIP;Q=0.1", "gzip"),
+    ("*", "br"),
+    ("br;q=0, *", "gzip"),
+    ("gzip;q=0, br;q=0", None),
+    ("identity, deflate", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding, ("br", "gzip")) == expected
+
+
+def test_negotiate_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate_encoding("br, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("br") is None
+
+
+def compression_app() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/text")
+    def text(size: int):
+        return PlainTextResponse("x" * size, headers={"ETag": '"tag"'})
+
+    @app.get("/stream")
+    def stream(media_type: str = "text/plain"):
+        return StreamingResponse(iter([b"x" * 60, b"y" * 60, b"z"]), media_type=media_type)
+
+    return TestClient(app)
+
+
+def test_middleware():
+    client = compression_app()
+    # Raw bodies are read from the stream, not decoded by the client
+    with client.stream("GET", "/text?size=1000", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == 'W/"tag"'
+        body = b"".join(response.iter_raw())
+        assert int(response.headers["content-length"]) == len(body) < 1000
+        assert gzip.decompress(body) == b"x" * 1000
+
+    response = client.get("/text?size=99", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"tag"'
+    assert "content-encoding" not in client.get("/text?size=1000", headers={"Accept-Encoding": "identity"}).headers
+
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert gzip.decompress(b"".join(response.iter_raw())) == b"x" * 60 + b"y" * 60 + b"z"
+
+    # Events are sent as they are
+    response = client.get("/stream?media_type=text/event-stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.content == b"x" * 60 + b"y" * 60 + b"z"
@@ -0,0 +1,467 @@
+import io
+import json
+from datetime import timedelta
+
+import pytest
+
+from fastapi_social_network import crud, export, models, schemas
+from fastapi_social_network.config import settings
+
+from .db import DB_HOLDER
+
+
+def populate(db):
+    """
+    Adds two users with one post each
+    :param db:
+    :return: list of users
+    """
+    users = []
+    for i in range(1, 3):
+        user = models.User(
+            alias=f"test_user_{i}",
+            email=f"test_user_{i}@mail",
+            hashed_password=f"not_a_hash_{i}"
+        )
+        user.posts.append(models.Post(body=f"Test Post by {user.alias}"))
+        db.add(user)
+        users.append(user)
+    db.commit()
+    return users
+
+
+class TestReactionCounters:
+    def test_react(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        post_id = author.posts[0].id
+        post = crud.react_user_post(db, post_id=post_id, user_id=reader.id)
+        assert (post.likes, post.dislikes) == (1, 0)
+        post = crud.react_user_post(db, post_id=post_id, user_id=reader.id)
+        assert (post.likes, post.dislikes) == (1, 0)
+        post = crud.react_user_post(db, post_id=post_id, user_id=reader.id, dislike=True)
+        assert (post.likes, post.dislikes) == (0, 1)
+
+    def test_react_missing_or_own_post(self, get_test_db):
+        db = get_test_db
+        post = db.query(models.Post).filter(models.Post.likes_count + models.Post.dislikes_count > 0).one()
+        assert crud.react_user_post(db, post_id=999, user_id=post.owner_id) is None
+        with pytest.raises(crud.NoPermission):
+            crud.react_user_post(db, post_id=post.id, user_id=post.owner_id)
+        assert crud.delete_reaction_user_post(db, post_id=999, user_id=post.owner_id) is None
+        db.refresh(post)
+        assert (post.likes, post.dislikes) == (0, 1)
+
+    def test_delete_reaction(self, get_test_db):
+        db = get_test_db
+        post = db.query(models.Post).filter(models.Post.likes_count + models.Post.dislikes_count > 0).one()
+        reader = db.query(models.User).filter(models.User.id != post.owner_id).one()
+        post = crud.delete_reaction_user_post(db, post_id=post.id, user_id=reader.id)
+        assert (post.likes, post.dislikes) == (0, 0)
+        post = crud.delete_reaction_user_post(db, post_id=post.id, user_id=reader.id)
+        assert (post.likes, post.dislikes) == (0, 0)
+
+    def test_delete_post_counts_reactions(self, get_test_db):
+        db = get_test_db
+        owner, liker = (
+            crud.create_user(db, schemas.UserCreate(alias=f"deleting_{i}", email=f"deleting_{i}@mail", password="pass"),
+                             hashed_password="not_a_hash")
+            for i in range(2)
+        )
+        post = crud.create_user_post(db, post=schemas.PostCreate(body="Deleted"), user_id=owner.id)
+        crud.react_user_post(db, post_id=post.id, user_id=liker.id)
+        # As if the reaction was committed after the Post was read: its stored counters do not include it
+        db.query(models.Post).filter(models.Post.id == post.id).update({models.Post.likes_count: 0})
+        db.commit()
+        assert crud.delete_user_post(db, post_id=post.id, user_id=owner.id)
+        assert user_stats(db, owner.id) == (0, 0, 0, 0)
+        assert user_stats(db, liker.id) == (0, 0, 0, 0)
+
+    def test_rebuild(self, get_test_db):
+        db = get_test_db
+        DB_HOLDER.reset()
+        author, reader = populate(db)
+        post = author.posts[0]
+        db.add(models.PostReaction(post_id=post.id, user_id=reader.id, dislike=True))
+        db.commit()
+        assert (post.likes, post.dislikes) == (0, 0)
+        assert crud.rebuild_reaction_counts(db) == 2
+        db.refresh(post)
+        assert (post.likes, post.dislikes) == (0, 1)
+
+
+def test_postgresql_reaction_statements():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    # Never connects, statements are only compiled
+    db = Session(bind=create_engine("postgresql+asyncpg://user@localhost/app"))
+    for statement in [crud._react_user_post_postgresql_statement(db, post_id=1, user_id=2, dislike=True),
+                      crud._delete_reaction_user_post_postgresql_statement(db, post_id=1, user_id=2)]:
+        sql = str(statement.compile(dialect=db.get_bind().dialect))
+        # Reaction, stats and counters with trending score are all changed by a single statement
+        assert sql.startswith("WITH reaction AS")
+        assert "stats AS \n(UPDATE user_stats SET" in sql
+        update_posts = sql[sql.index("UPDATE posts SET"):]
+        assert "trending_score=(sign(" in update_posts
+        assert "RETURNING posts.id" in update_posts
+
+
+class TestFeed:
+    def test_fan_out_on_write(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        old_post = author.posts[0]
+        crud.follow_user(db, user_id=author.id, follower_id=reader.id)
+        new_post = crud.create_user_post(db, post=schemas.PostCreate(body="New"), user_id=author.id)
+        assert db.query(models.TimelineEntry).filter(models.TimelineEntry.user_id == reader.id).count() == 2
+        feed = crud.get_feed(db, user_id=reader.id)
+        assert [post.id for post in feed] == [new_post.id, old_post.id]
+        own_feed = crud.get_feed(db, user_id=author.id)
+        assert [post.id for post in own_feed] == [new_post.id]
+
+    def test_fan_out_on_read(self, get_test_db, monkeypatch):
+        db = get_test_db
+        monkeypatch.setattr(settings, "feed_fanout_max_followers", 0)
+        author, reader = db.query(models.User).order_by(models.User.id).all()
+        reader_post = crud.create_user_post(db, post=schemas.PostCreate(body="Reader post"), user_id=reader.id)
+        celebrity_post = crud.create_user_post(db, post=schemas.PostCreate(body="Not fanned out"), user_id=author.id)
+        assert db.query(models.TimelineEntry).filter(models.TimelineEntry.post_id == celebrity_post.id).count() == 1
+        feed = crud.get_feed(db, user_id=reader.id)
+        assert [post.id for post in feed][:2] == [celebrity_post.id, reader_post.id]
+        assert len(feed) == len({post.id for post in feed}) == 4
+        page = crud.get_feed(db, user_id=reader.id, skip=1, limit=2)
+        assert [post.id for post in page] == [post.id for post in feed[1:3]]
+
+    def test_unfollow(self, get_test_db):
+        db = get_test_db
+        author, reader = db.query(models.User).order_by(models.User.id).all()
+        user = crud.unfollow_user(db, user_id=author.id, follower_id=reader.id)
+        assert user.followers_count == 0
+        feed = crud.get_feed(db, user_id=reader.id)
+        assert {post.owner_id for post in feed} == {reader.id}
+
+    def test_drop_below_fan_out_limit(self, get_test_db, monkeypatch):
+        db = get_test_db
+        monkeypatch.setattr(settings, "feed_fanout_max_followers", 1)
+        author, reader = db.query(models.User).order_by(models.User.id).all()
+        other = models.User(alias="other", email="other@mail", hashed_password="not_a_hash")
+        db.add(other)
+        db.commit()
+        for follower in (reader, other):
+            crud.follow_user(db, user_id=author.id, follower_id=follower.id)
+        # Written while the author has too many followers to fan out
+        post = crud.create_user_post(db, post=schemas.PostCreate(body="Not fanned out"), user_id=author.id)
+        assert db.query(models.TimelineEntry).filter(models.TimelineEntry.post_id == post.id).count() == 1
+        crud.unfollow_user(db, user_id=author.id, follower_id=other.id)
+        assert db.query(models.TimelineEntry).filter(models.TimelineEntry.post_id == post.id).count() == 2
+        feed = crud.get_feed(db, user_id=reader.id)
+        assert post.id in [feed_post.id for feed_post in feed]
+        assert len(feed) == len({feed_post.id for feed_post in feed})
+
+
+class TestBatch:
+    def test_get_by_ids(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        post_id = author.posts[0].id
+        assert [post.id for post in crud.get_posts_by_ids(db, [post_id, 999, post_id])] == [post_id]
+        assert [user.id for user in crud.get_users_by_ids(db, [reader.id, author.id])] == [reader.id, author.id]
+
+    def test_react_user_posts(self, get_test_db):
+        db = get_test_db
+        author, reader = db.query(models.User).order_by(models.User.id).all()
+        author_post, reader_post = author.posts[0], reader.posts[0]
+        operations = [
+            schemas.ReactionOperation(post_id=author_post.id, action=schemas.ReactionAction.like),
+            schemas.ReactionOperation(post_id=999, action=schemas.ReactionAction.like),
+            schemas.ReactionOperation(post_id=reader_post.id, action=schemas.ReactionAction.like),
+            schemas.ReactionOperation(post_id=author_post.id, action=schemas.ReactionAction.dislike),
+        ]
+        results = crud.react_user_posts(db, user_id=reader.id, operations=operations)
+        assert results[0] is results[3] is author_post
+        assert results[1] is None
+        assert isinstance(results[2], crud.NoPermission)
+        assert (author_post.likes, author_post.dislikes) == (0, 1)
+        assert db.query(models.PostReaction).count() == 1
+
+        operations = [schemas.ReactionOperation(post_id=author_post.id, action=schemas.ReactionAction.clear)]
+        crud.react_user_posts(db, user_id=reader.id, operations=operations)
+        assert (author_post.likes, author_post.dislikes) == (0, 0)
+        assert db.query(models.PostReaction).count() == 0
+
+    def test_concurrent_reaction(self, get_test_db, monkeypatch):
+        db = get_test_db
+        author, reader = db.query(models.User).order_by(models.User.id).all()
+        post_id = author.posts[0].id
+        dialect_insert = crud._dialect_insert
+        concurrent = []
+
+        def insert_after_concurrent_like(session):
+            if not concurrent:
+                concurrent.append(post_id)
+                # Another request likes the Post after reactions of the batch were read
+                crud.react_user_post(session, post_id=post_id, user_id=reader.id)
+            return dialect_insert(session)
+
+        monkeypatch.setattr(crud, "_dialect_insert", insert_after_concurrent_like)
+        operations = [schemas.ReactionOperation(post_id=post_id, action=schemas.ReactionAction.dislike)]
+        post, = crud.react_user_posts(db, user_id=reader.id, operations=operations)
+        assert concurrent
+        assert (post.likes, post.dislikes) == (0, 1)
+        assert db.query(models.PostReaction).one().dislike
+
+
+def user_stats(db, user_id: int) -> tuple:
+    stats = crud.get_user_stats(db, user_id)
+    return stats.posts_count, stats.likes_received, stats.dislikes_received, stats.likes_given
+
+
+class TestUserStats:
+    def test_maintained(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        # Users inserted without crud.create_user have no stats row, their stats are computed
+        assert user_stats(db, author.id) == (1, 0, 0, 0)
+        crud.react_user_post(db, post_id=author.posts[0].id, user_id=reader.id)
+        assert user_stats(db, author.id) == (1, 1, 0, 0)
+        assert user_stats(db, reader.id) == (1, 0, 0, 1)
+        # Changes do not create rows holding only the changes
+        assert db.query(models.UserStats).count() == 0
+        crud.delete_reaction_user_post(db, post_id=author.posts[0].id, user_id=reader.id)
+        assert crud.rebuild_user_stats(db) == 2
+        assert user_stats(db, author.id) == (1, 0, 0, 0)
+        new_user = crud.create_user(db, schemas.UserCreate(alias="new", email="new@mail", password="pass"),
+                                    hashed_password="not_a_hash")
+        assert user_stats(db, new_user.id) == (0, 0, 0, 0)
+        assert crud.get_user_stats(db, 999) is None
+
+        post = crud.create_user_post(db, post=schemas.PostCreate(body="New"), user_id=author.id)
+        crud.react_user_post(db, post_id=post.id, user_id=reader.id)
+        crud.react_user_post(db, post_id=post.id, user_id=reader.id)
+        crud.react_user_post(db, post_id=post.id, user_id=new_user.id)
+        assert user_stats(db, author.id) == (2, 2, 0, 0)
+        assert user_stats(db, reader.id) == (1, 0, 0, 1)
+        crud.react_user_post(db, post_id=post.id, user_id=reader.id, dislike=True)
+        assert user_stats(db, author.id) == (2, 1, 1, 0)
+        assert user_stats(db, reader.id) == (1, 0, 0, 0)
+        crud.delete_reaction_user_post(db, post_id=post.id, user_id=reader.id)
+        crud.delete_reaction_user_post(db, post_id=post.id, user_id=reader.id)
+        assert user_stats(db, author.id) == (2, 1, 0, 0)
+
+        operations = [
+            schemas.ReactionOperation(post_id=author.posts[0].id, action=schemas.ReactionAction.like),
+            schemas.ReactionOperation(post_id=post.id, action=schemas.ReactionAction.dislike),
+        ]
+        crud.react_user_posts(db, user_id=reader.id, operations=operations)
+        assert user_stats(db, author.id) == (2, 2, 1, 0)
+        assert user_stats(db, reader.id) == (1, 0, 0, 1)
+        crud.apply_reactions(db, {(reader.posts[0].id, author.id): schemas.ReactionAction.like,
+                                  (post.id, new_user.id): schemas.ReactionAction.clear})
+        assert user_stats(db, author.id) == (2, 1, 1, 1)
+        assert user_stats(db, reader.id) == (1, 1, 0, 1)
+        assert user_stats(db, new_user.id) == (0, 0, 0, 0)
+
+        crud.react_user_post(db, post_id=post.id, user_id=new_user.id)
+        assert crud.delete_user_post(db, post_id=post.id, user_id=author.id)
+        assert user_stats(db, author.id) == (1, 1, 0, 1)
+        assert user_stats(db, new_user.id) == (0, 0, 0, 0)
+
+    def test_delete_post_counts_reactions(self, get_test_db):
+        db = get_test_db
+        owner, liker = (
+            crud.create_user(db, schemas.UserCreate(alias=f"deleting_{i}", email=f"deleting_{i}@mail", password="pass"),
+                             hashed_password="not_a_hash")
+            for i in range(2)
+        )
+        post = crud.create_user_post(db, post=schemas.PostCreate(body="Deleted"), user_id=owner.id)
+        crud.react_user_post(db, post_id=post.id, user_id=liker.id)
+        # As if the reaction was committed after the Post was read: its stored counters do not include it
+        db.query(models.Post).filter(models.Post.id == post.id).update({models.Post.likes_count: 0})
+        db.commit()
+        assert crud.delete_user_post(db, post_id=post.id, user_id=owner.id)
+        assert user_stats(db, owner.id) == (0, 0, 0, 0)
+        assert user_stats(db, liker.id) == (0, 0, 0, 0)
+
+    def test_rebuild(self, get_test_db):
+        db = get_test_db
+        users = db.query(models.User).order_by(models.User.id).all()
+        maintained = [user_stats(db, user.id) for user in users]
+        db.query(models.UserStats).delete()
+        db.commit()
+        assert crud.rebuild_user_stats(db) == len(users)
+        db.commit()
+        db.expire_all()
+        assert [user_stats(db, user.id) for user in users] == maintained
+
+
+class TestSearch:
+    def test_search_posts(self, get_test_db):
+        db = get_test_db
+        author, _ = populate(db)
+        bodies = ["Cats and dogs", "Cats chasing cats", "Only dogs here", "Nothing relevant"]
+        post_ids = [crud.create_user_post(db, schemas.PostCreate(body=body), author.id).id for body in bodies]
+
+        results = crud.search_posts(db, "cat")
+        assert [post.id for post, _ in results] == [post_ids[1], post_ids[0]]
+        assert crud.search_posts(db, "dogs cats")[0][0].id == post_ids[0]
+        assert crud.search_posts(db, "\"unbalanced OR") == []
+        assert crud.search_posts(db, "!!!") == []
+
+        first_page = crud.search_posts(db, "dogs", limit=1)
+        post, score = first_page[0]
+        second_page = crud.search_posts(db, "dogs", limit=1, cursor=(score, post.id))
+        assert {post.id for post, _ in first_page + second_page} == {post_ids[0], post_ids[2]}
+
+    def test_search_index_sync(self, get_test_db):
+        db = get_test_db
+        author = crud.get_user_by_alias(db, "test_user_1")
+        post = crud.create_user_post(db, schemas.PostCreate(body="first words"), author.id)
+        crud.edit_user_post(db, post.id, schemas.PostBase(body="second words"), author.id)
+        assert crud.search_posts(db, "first") == []
+        assert [post.id for post, _ in crud.search_posts(db, "second")] == [post.id]
+        crud.delete_user_post(db, post.id, author.id)
+        assert crud.search_posts(db, "words") == []
+
+
+class TestTrending:
+    def test_trending_posts(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        old_post = author.posts[0]
+        new_post = crud.create_user_post(db, schemas.PostCreate(body="New post"), author.id)
+        assert crud.get_trending_posts(db)[0].id == new_post.id
+
+        old_post.timestamp = new_post.timestamp - timedelta(hours=settings.trending_decay_hours / 2)
+        db.commit()
+        crud.rebuild_trending_scores(db)
+        db.commit()
+        # Half of the decay period is worth sqrt(10) times more net likes
+        other_reader = crud.create_user(db, schemas.UserCreate(alias="reader", email="reader@mail", password="pass"))
+        for user in (reader, other_reader):
+            crud.react_user_post(db, post_id=old_post.id, user_id=user.id)
+        assert crud.get_trending_posts(db)[0].id == new_post.id
+        for user in (reader, other_reader):
+            crud.react_user_post(db, post_id=new_post.id, user_id=user.id, dislike=True)
+        ranking = [post.id for post in crud.get_trending_posts(db)]
+        assert ranking.index(old_post.id) < ranking.index(new_post.id)
+
+        crud.delete_reaction_user_post(db, post_id=new_post.id, user_id=reader.id)
+        crud.delete_reaction_user_post(db, post_id=new_post.id, user_id=other_reader.id)
+        first, second = crud.get_trending_posts(db, limit=2)
+        assert first.id == new_post.id
+        assert crud.get_trending_posts(db, cursor=(first.trending_score, first.id))[0].id == second.id
+        assert first.trending_score == crud.trending_score(first.likes, first.dislikes, first.timestamp)
+
+
+class TestExport:
+    def test_export(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        post = crud.create_user_post(db, schemas.PostCreate(body="Exported post"), author.id)
+        crud.react_user_post(db, post_id=post.id, user_id=reader.id)
+
+        output = io.StringIO()
+        export.write_ndjson(db, crud.export_users_statement(), output, chunk_size=1)
+        assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+            {"id": author.id, "alias": author.alias}, {"id": reader.id, "alias": reader.alias}
+        ]
+        assert list(export.iter_ndjson(db, crud.export_users_statement(after_id=reader.id))) == []
+
+        lines = "".join(export.iter_ndjson(db, crud.export_posts_statement(since=post.timestamp))).splitlines()
+        assert [schemas.Post.parse_raw(line) for line in lines] == [schemas.Post.from_orm(post)]
+        lines = "".join(export.iter_ndjson(db, crud.export_reactions_statement(since=post.timestamp))).splitlines()
+        assert [json.loads(line) for line in lines] == [{"post_id": post.id, "user_id": reader.id, "dislike": False}]
+
+    def test_cli_filters(self):
+        from fastapi_social_network import cli
+
+        parser = cli.get_parser()
+        for table, table_export in export.EXPORTS.items():
+            assert table_export.filter in vars(parser.parse_args(["export", table]))
+        args = parser.parse_args(["export", "users", "--since", "2023-06-01T00:00:00"])
+        with pytest.raises(SystemExit, match="--since does not apply to users"):
+            args.func(args)
+
+
+class TestFastResponses:
+    def test_rows(self, get_test_db):
+        db = get_test_db
+        author, reader = populate(db)
+        crud.react_user_post(db, post_id=author.posts[0].id, user_id=reader.id)
+
+        posts = crud.get_posts(db)
+        assert [schemas.Post(**row._asdict()) for row in crud.get_posts(db, rows=True)] == \
+            [schemas.Post.from_orm(post) for post in posts]
+        assert [schemas.User(**row._asdict()) for row in crud.get_users(db, rows=True)] == \
+            [schemas.User.from_orm(user) for user in crud.get_users(db)]
+        # Indexed for search and added to the timeline of the author
+        crud.create_user_post(db, post=schemas.PostCreate(body="Test post"), user_id=author.id)
+        assert crud.search_posts(db, "test") and crud.get_feed(db, user_id=author.id)
+        assert [schemas.Post(**row._asdict()) for row, _ in crud.search_posts(db, "test", rows=True)] == \
+            [schemas.Post.from_orm(post) for post, _ in crud.search_posts(db, "test")]
+        assert [row.id for row in crud.get_feed(db, user_id=author.id, rows=True)] == \
+            [post.id for post in crud.get_feed(db, user_id=author.id)]
+        assert [row.id for row in crud.get_posts_reactions_by_user(db, user_id=reader.id, rows=True)] == \
+            [author.posts[0].id]
+        assert [row.id for row in crud.get_users_reactions_by_post(db, post_id=author.posts[0].id, rows=True)] == \
+            [reader.id]
+
+    def test_list_response(self, get_test_db, monkeypatch):
+        from fastapi import Response
+        from fastapi.encoders import jsonable_encoder
+        from fastapi_social_network import fast_responses
+
+        db = get_test_db
+        expected = json.dumps(jsonable_encoder([schemas.Post.from_orm(post) for post in crud.get_posts(db)]))
+        headers = {"Link": '</posts?cursor=1>; rel="next"'}
+        monkeypatch.setattr(fast_responses, "enabled", True)
+        response = fast_responses.list_response(crud.get_posts(db, rows=True), Response(), headers)
+        assert json.loads(response.body) == json.loads(expected)
+        assert response.headers["link"] == headers["Link"]
+
+    def test_sparse_fields(self, get_test_db):
+        from fastapi import Response
+        from fastapi_social_network import fast_responses
+
+        db = get_test_db
+        # Columns of the pagination key are selected too, for cursors of next pages
+        rows = crud.get_trending_posts(db, rows=True, fields=("likes",))
+        assert rows and all(row._fields == ("likes", "trending_score", "id") for row in rows)
+        assert crud.get_users(db, rows=True, fields=("alias",))[0]._fields == ("alias", "id")
+        post_id = rows[0].id
+        assert [row._fields for row in crud.get_posts_by_ids(db, [post_id], rows=True, fields=("likes",))] == \
+            [("likes", "id")]
+        assert crud.get_post(db, post_id, rows=True, fields=("likes",))._fields == ("likes", "id")
+
+        fields = fast_responses.Fields(("id", "likes"), sparse=True)
+        response = fast_responses.list_response(crud.get_posts(db, rows=True, fields=fields.names), Response(), {},
+                                                fields)
+        assert json.loads(response.body) == [{"id": post.id, "likes": post.likes_count} for post in crud.get_posts(db)]
+
+    def test_routes(self, api_client, monkeypatch):
+        from fastapi_social_network import fast_responses
+        from fastapi_social_network.pagination import NEXT_CURSOR_HEADER
+
+        client = api_client
+        for i in range(1, 3):
+            client.post("/users", json={"alias": f"user_{i}", "email": f"user_{i}@mail", "password": "pass"})
+        token = client.post("/token", data={"username": "user_1", "password": "pass"}).json()["access_token"]
+        for i in range(3):
+            client.post("/posts", json={"body": f"Post {i}"}, headers={"Authorization": f"Bearer {token}"})
+        expected = {url: client.get(url).json() for url in ["/posts", "/posts/trending", "/users"]}
+
+        monkeypatch.setattr(fast_responses, "enabled", True)
+        for url, items in expected.items():
+            # Pages past the first are not cached, and continue from the cursor of the previous one
+            assert client.get(url, params={"skip": 1}).json() == items[1:]
+            pages = []
+            params = {"limit": 1, "skip": 1}
+            while True:
+                page = client.get(url, params=params)
+                assert page.status_code == 200, page.text
+                pages.extend(page.json())
+                if NEXT_CURSOR_HEADER not in page.headers:
+                    break
+                params = {"limit": 1, "cursor": page.headers[NEXT_CURSOR_HEADER]}
+            assert pages == items[1:]
@@ -0,0 +1,28 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from fastapi_social_network.config import settings
+from fastapi_social_network.database import get_engine_args, get_sqlite_pragmas, set_sqlite_pragmas
+
+
+def test_engine_args():
+    assert get_engine_args("sqlite://") == {"echo": settings.sqlalchemy_echo}
+    assert get_engine_args("sqlite:///./app.db")["poolclass"] is QueuePool
+    assert get_engine_args("sqlite:///./app.db", asyncio=True)["poolclass"] is AsyncAdaptedQueuePool
+    args = get_engine_args("postgresql://user@localhost/app")
+    assert "poolclass" not in args
+    assert (args["pool_size"], args["max_overflow"]) == (settings.db_pool_size, settings.db_max_overflow)
+
+
+def test_sqlite_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    engine = create_engine(url, **get_engine_args(url))
+    set_sqlite_pragmas(engine, get_sqlite_pragmas())
+    try:
+        with engine.connect() as connection:
+            pragmas = {name: connection.execute(text(f"PRAGMA {name}")).scalar() for name in get_sqlite_pragmas()}
+        # synchronous is read back as a number, 1 is normal
+        assert pragmas == {"journal_mode": "wal", "synchronous": 1, "mmap_size": settings.sqlite_mmap_size,
+                           "cache_size": settings.sqlite_cache_size}
+    finally:
+        engine.dispose()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from fastapi_social_network import events
+
+from .test_query_budget import login
+
+
+def event(post_id: int, likes: int | None = None) -> events.Event:
+    if likes is None:
+        return events.Event("post_deleted", post_id, {"post_id": post_id})
+    return events.Event("post_reactions", post_id, {"post_id": post_id, "likes": likes, "dislikes": 0},
+                        coalesce_key=("post_reactions", post_id))
+
+
+def test_subscription_queue():
+    async def run():
+        broker = events.Broker(queue_size=3)
+        with broker.subscribe() as subscription, broker.subscribe(post_ids=frozenset([2])) as filtered:
+            for published in [event(1, likes=1), event(2), event(1, likes=2), event(1, likes=3)]:
+                broker.publish(published)
+            # Reaction counts of Post 1 are coalesced into the latest ones, in place of the first
+            assert [await subscription.get() for _ in range(2)] == [event(1, likes=3), event(2)]
+            assert await filtered.get() == event(2)
+
+            for post_id in range(3, 7):
+                broker.publish(event(post_id))
+            with pytest.raises(events.SubscriptionOverflow):
+                await subscription.get()
+            assert broker.stats() == {"subscriptions": 2}
+        assert broker.stats() == {"subscriptions": 0}
+
+    asyncio.run(run())
+
+
+def test_server_sent_events():
+    async def run():
+        response = await events.stream_events(post_id=None)
+        body = response.body_iterator
+        received = asyncio.ensure_future(body.__anext__())
+        while not events.broker.stats()["subscriptions"]:
+            await asyncio.sleep(0)
+        events.broker.publish(event(1))
+        assert await received == 'event: post_deleted\ndata: {"type":"post_deleted","post_id":1}\n\n'
+        await body.aclose()
+
+    asyncio.run(run())
+
+
+def test_websocket(api_client):
+    client = api_client
+    client.post("/users", json={"alias": "author", "email": "author@mail", "password": "pass"})
+    client.post("/users", json={"alias": "reader", "email": "reader@mail", "password": "pass"})
+    author, reader = login(client, "author"), login(client, "reader")
+    with client.websocket_connect("/ws/events") as websocket:
+        deadline = time.monotonic() + 5
+        while not events.broker.stats()["subscriptions"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        post = client.post("/posts", json={"body": "Live"}, headers=author).json()
+        client.put(f"/posts/{post['id']}/likes", headers=reader)
+        client.delete(f"/posts/{post['id']}", headers=author)
+        assert websocket.receive_json() == {"type": "post_created", "post": post}
+        assert websocket.receive_json() == {"type": "post_reactions", "post_id": post["id"], "likes": 1,
+                                            "dislikes": 0}
+        assert websocket.receive_json() == {"type": "post_deleted", "post_id": post["id"]}
@@ -0,0 +1,37 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from fastapi_social_network import metrics
+
+
+def test_metrics_middleware():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "test")
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.router)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as connection:
+            for _ in range(item_id):
+                connection.execute(text("SELECT 1"))
+        return {}
+
+    client = TestClient(app)
+    for item_id in (1, 3):
+        assert client.get(f"/items/{item_id}").status_code == 200
+    assert client.get("/missing").status_code == 404
+    # Checkouts from the pool recreated by dispose() are timed too
+    engine.dispose()
+    assert client.get("/items/0").status_code == 200
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 3.0' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="<unmatched>",status="404"} 1.0' in body
+    assert 'http_request_db_statements_sum{method="GET",route="/items/{item_id}"} 4.0' in body
+    assert 'db_statement_duration_seconds_count{engine="test"} 4.0' in body
+    assert 'db_pool_wait_seconds_count{engine="test"} 3.0' in body
+    assert 'cache_size{cache="response"}' in body
+    assert "password_hasher_workers" in body
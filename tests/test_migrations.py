@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+from fastapi_social_network import crud, models
+from fastapi_social_network.cli import get_alembic_config
+from fastapi_social_network.migrations import include_object
+
+
+def test_migrations_match_models(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrations.db'}"
+    cfg = get_alembic_config()
+    cfg.set_main_option("sqlalchemy.url", url)
+    command.upgrade(cfg, "head")
+
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            assert compare_metadata(MigrationContext.configure(connection, opts={"include_object": include_object}),
+                                    models.Base.metadata) == []
+        command.downgrade(cfg, "base")
+        with engine.connect() as connection:
+            assert engine.dialect.get_table_names(connection) == ["alembic_version"]
+    finally:
+        engine.dispose()
+
+
+def test_trending_score_backfill(tmp_path, capsys):
+    url = f"sqlite:///{tmp_path / 'trending.db'}"
+    cfg = get_alembic_config()
+    cfg.set_main_option("sqlalchemy.url", url)
+    command.upgrade(cfg, "bc5c97b6785e")
+    posts = [(1, datetime(2023, 6, 1, 12, 30, 15, 250000), 10, 2), (2, None, 0, 3), (3, datetime(2022, 1, 1), 0, 0)]
+    engine = create_engine(url)
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO users (id, email, alias, hashed_password) VALUES (1, 'a', 'a', 'x')"))
+            post_insert = text("INSERT INTO posts (id, timestamp, body, owner_id, likes_count, dislikes_count) "
+                               "VALUES (:id, :timestamp, 'post', 1, :likes, :dislikes)")
+            for post_id, timestamp, likes, dislikes in posts:
+                connection.execute(post_insert, {"id": post_id, "timestamp": timestamp, "likes": likes,
+                                                 "dislikes": dislikes})
+        command.upgrade(cfg, "1ca29a56f46d")
+        with engine.connect() as connection:
+            scores = dict(connection.execute(text("SELECT id, trending_score FROM posts")).all())
+    finally:
+        engine.dispose()
+    for post_id, timestamp, likes, dislikes in posts:
+        assert scores[post_id] == pytest.approx(crud.trending_score(likes, dislikes, timestamp))
+
+    # The backfill is plain SQL, also for offline PostgreSQL upgrades
+    cfg.set_main_option("sqlalchemy.url", "postgresql://user@localhost/app")
+    command.upgrade(cfg, "bc5c97b6785e:1ca29a56f46d", sql=True)
+    assert "UPDATE posts SET trending_score = sign(" in capsys.readouterr().out
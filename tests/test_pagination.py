@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from fastapi_social_network import crud, models, schemas
+from fastapi_social_network.pagination import encode_cursor, decode_cursor, post_key, InvalidCursor, Pagination, \
+    id_pagination
+
+
+def test_cursor_roundtrip():
+    key = (datetime(2023, 7, 1, 12, 30, 15, 123456), 42)
+    assert decode_cursor(encode_cursor(key), (datetime, int)) == key
+
+
+@pytest.mark.parametrize("token", ["", "not a cursor", encode_cursor((1,)), encode_cursor(("1", 2))])
+def test_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, (datetime, int))
+
+
+def test_pagination_params():
+    cursor = encode_cursor((5,))
+    assert id_pagination(skip=0, limit=10, cursor=cursor) == Pagination(limit=10, cursor=(5,))
+    assert id_pagination(skip=3, limit=10, cursor=None) == Pagination(skip=3, limit=10)
+    for skip, token in [(3, cursor), (0, "not a cursor")]:
+        with pytest.raises(HTTPException) as e:
+            id_pagination(skip=skip, limit=10, cursor=token)
+        assert e.value.status_code == 400
+
+
+class TestKeysetPagination:
+    def test_posts_pages(self, get_test_db):
+        db = get_test_db
+        user = models.User(alias="user", email="user@mail", hashed_password="not_a_hash")
+        timestamp = datetime(2023, 7, 1)
+        for i in range(5):
+            # Two posts share each timestamp to check the id tiebreaker
+            user.posts.append(models.Post(body=f"Post {i}", timestamp=timestamp.replace(hour=i // 2)))
+        db.add(user)
+        db.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            page = crud.get_posts(db, limit=2, cursor=cursor)
+            seen.extend(post.id for post in page)
+            if len(page) < 2:
+                break
+            cursor = decode_cursor(encode_cursor(post_key(page[-1])), (datetime, int))
+        assert seen == [post.id for post in crud.get_posts(db)]
+        assert len(seen) == 5
+
+    def test_new_post_does_not_shift_pages(self, get_test_db):
+        db = get_test_db
+        first_page = crud.get_posts(db, limit=2)
+        user = db.query(models.User).one()
+        crud.create_user_post(db, post=schemas.PostCreate(body="Newest"), user_id=user.id)
+        second_page = crud.get_posts(db, limit=2, cursor=post_key(first_page[-1]))
+        assert second_page[0].id not in {post.id for post in first_page}
+        assert second_page[0].body != "Newest"
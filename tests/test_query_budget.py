@@ -0,0 +1,210 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from fastapi_social_network.query_budget import QueryBudget, QueryBudgetExceeded, QueryBudgetMiddleware
+
+# Max number of SQL statements of each route, for the requests made by TestRouteQueryCounts
+ROUTE_QUERY_COUNTS = {
+    ("POST", "/users"): 5,
+    ("POST", "/token"): 1,
+    ("GET", "/users"): 1,
+    ("GET", "/users/me"): 1,
+    ("GET", "/users/{user_id}"): 1,
+    ("GET", "/users/{user_id}/posts"): 1,
+    ("GET", "/users/{user_id}/stats"): 1,
+    ("GET", "/posts"): 1,
+    ("POST", "/posts"): 8,
+    ("GET", "/posts/search"): 1,
+    ("GET", "/posts/trending"): 1,
+    ("GET", "/posts/{post_id}"): 1,
+    ("PUT", "/posts/{post_id}"): 4,
+    ("DELETE", "/posts/{post_id}"): 8,
+    ("PUT", "/posts/{post_id}/likes"): 5,
+    ("PUT", "/posts/{post_id}/dislikes"): 5,
+    ("DELETE", "/posts/{post_id}/likes"): 5,
+    ("POST", "/reactions/batch"): 5,
+    ("GET", "/posts/{post_id}/likes"): 2,
+    ("GET", "/posts/{post_id}/dislikes"): 2,
+    ("GET", "/users/me/likes"): 2,
+    ("GET", "/users/me/dislikes"): 2,
+    ("GET", "/users/{user_id}/likes"): 2,
+    ("GET", "/users/{user_id}/dislikes"): 2,
+    ("GET", "/users/me/feed"): 2,
+    ("GET", "/users/{user_id}/followers"): 2,
+    ("GET", "/users/{user_id}/following"): 2,
+    ("PUT", "/users/{user_id}/followers"): 7,
+    ("DELETE", "/users/{user_id}/followers"): 6,
+    ("GET", "/export/users"): 2,
+    ("GET", "/export/posts"): 2,
+    ("GET", "/export/reactions"): 2,
+}
+
+
+def login(client, alias):
+    token = client.post("/token", data={"username": alias, "password": "pass"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestRouteQueryCounts:
+    def test_routes(self, api_client, query_counts):
+        client = api_client
+        for i in range(1, 4):
+            assert client.post("/users", json={"alias": f"user_{i}", "email": f"user_{i}@mail",
+                                               "password": "pass"}).status_code == 200
+        author, reader = login(client, "user_1"), login(client, "user_2")
+        requests = [
+            ("GET", "/users", {}),
+            ("GET", "/users?ids=1&ids=2", {}),
+            ("GET", "/users/me", author),
+            ("GET", "/users/1", {}),
+            ("PUT", "/users/1/followers", reader),
+            ("POST", "/posts", author),
+            ("POST", "/posts", author),
+            ("GET", "/posts", {}),
+            ("GET", "/posts?skip=1", {}),
+            ("GET", "/posts?ids=1&ids=2", {}),
+            ("GET", "/posts/1", {}),
+            ("GET", "/posts/search?q=post", {}),
+            ("GET", "/posts/trending", {}),
+            ("PUT", "/posts/1", author),
+            ("GET", "/users/1/posts", {}),
+            ("GET", "/users/1/stats", {}),
+            ("PUT", "/posts/1/likes", reader),
+            ("PUT", "/posts/2/dislikes", reader),
+            ("GET", "/posts/1/likes", {}),
+            ("GET", "/posts/2/dislikes", {}),
+            ("GET", "/users/me/likes", reader),
+            ("GET", "/users/me/dislikes", reader),
+            ("GET", "/users/2/likes", {}),
+            ("GET", "/users/2/dislikes", {}),
+            ("DELETE", "/posts/1/likes", reader),
+            ("POST", "/reactions/batch", reader),
+            ("GET", "/users/me/feed", reader),
+            ("GET", "/users/1/followers", {}),
+            ("GET", "/users/2/following", {}),
+            ("DELETE", "/users/1/followers", reader),
+            ("GET", "/export/users", reader),
+            ("GET", "/export/posts?since=2000-01-01T00:00:00", reader),
+            ("GET", "/export/reactions", reader),
+            ("DELETE", "/posts/2", author),
+        ]
+        for method, url, headers in requests:
+            body = {"body": "Test post"} if method in ("POST", "PUT") and url.startswith("/posts") else None
+            if url == "/reactions/batch":
+                body = [{"post_id": 1, "action": "like"}, {"post_id": 2, "action": "dislike"},
+                        {"post_id": 1, "action": "clear"}]
+            response = client.request(method, url, json=body, headers=headers)
+            assert response.status_code < 400, (method, url, response.text)
+        for method, route, stats in query_counts:
+            assert stats.statements <= ROUTE_QUERY_COUNTS[method, route], (method, route, stats.shapes)
+        assert {(method, route) for method, route, _ in query_counts} == ROUTE_QUERY_COUNTS.keys()
+
+
+class TestOwnerExpansion:
+    def test_expand_owner(self, api_client, query_counts):
+        client = api_client
+        for i in range(1, 5):
+            assert client.post("/users", json={"alias": f"user_{i}", "email": f"user_{i}@mail",
+                                               "password": "pass"}).status_code == 200
+            headers = login(client, f"user_{i}")
+            for _ in range(2):
+                assert client.post("/posts", json={"body": "Test post"}, headers=headers).status_code == 200
+        client.put("/users/1/followers", headers=headers)
+        query_counts.clear()
+        for url in ["/posts?skip=1", "/posts?limit=5", "/posts?ids=1&ids=3", "/posts/trending?limit=5",
+                    "/users/2/posts", "/users/me/feed"]:
+            plain = client.get(url, headers=headers).json()
+            expanded = client.get(url, params={"expand": "owner"}, headers=headers).json()
+            assert [post["id"] for post in expanded] == [post["id"] for post in plain]
+            assert "owner" not in plain[0]
+            assert all(post["owner"] == {"alias": f"user_{post['owner_id']}", "id": post["owner_id"]}
+                       for post in expanded)
+        assert client.get("/posts/1").json().get("owner") is None
+        assert client.get("/posts/1?expand=owner").json()["owner"]["alias"] == "user_1"
+        # Owners of a page are loaded with one more query, however many there are
+        for method, route, stats in query_counts:
+            assert stats.statements <= ROUTE_QUERY_COUNTS[method, route] + 1, (method, route, stats.shapes)
+
+
+class TestSparseFields:
+    def test_fields(self, api_client, query_counts):
+        client = api_client
+        for i in range(1, 4):
+            assert client.post("/users", json={"alias": f"user_{i}", "email": f"user_{i}@mail",
+                                               "password": "pass"}).status_code == 200
+            headers = login(client, f"user_{i}")
+            for _ in range(2):
+                assert client.post("/posts", json={"body": "Test post"}, headers=headers).status_code == 200
+        assert client.put("/posts/1/likes", headers=headers).status_code == 200
+        query_counts.clear()
+        for url in ["/posts", "/posts?skip=1", "/posts/trending", "/posts/trending?skip=1", "/users/1/posts",
+                    "/users/me/likes", "/users/me/feed", "/posts/search?q=test"]:
+            plain = client.get(url, headers=headers).json()
+            assert plain, url
+            sparse = client.get(url, params={"fields": ["likes", "id", "likes"]}, headers=headers).json()
+            assert sparse == [{"id": post["id"], "likes": post["likes"]} for post in plain], url
+        for url in ["/users", "/posts/1/likes", "/users/3/following"]:
+            plain = client.get(url, headers=headers).json()
+            assert client.get(url, params={"fields": "alias"}).json() == [{"alias": user["alias"]} for user in plain]
+        # All fields are the same as none
+        assert client.get("/users", params={"fields": ["id", "alias"]}).json() == client.get("/users").json()
+        # Cursors of sparse pages point after their last item
+        first = client.get("/posts/trending", params={"fields": "body", "limit": 2})
+        second = client.get("/posts/trending", params={"fields": "id", "limit": 2,
+                                                       "cursor": first.headers["x-next-cursor"]})
+        all_ids = [post["id"] for post in client.get("/posts/trending").json()]
+        assert [post["id"] for post in second.json()] == all_ids[2:4]
+
+        # Refreshing counters of known Posts, and single items
+        posts = {post["id"]: post for post in client.get("/posts").json()}
+        assert client.get("/posts", params={"ids": [2, 1, 99], "fields": ["id", "likes"]}).json() == \
+            [{"id": 2, "likes": posts[2]["likes"]}, {"id": 1, "likes": 1}]
+        assert client.get("/users", params={"ids": [3, 1], "fields": "alias"}).json() == \
+            [{"alias": "user_3"}, {"alias": "user_1"}]
+        assert client.get("/posts/1", params={"fields": ["likes", "id"]}).json() == {"id": 1, "likes": 1}
+        assert client.get("/users/2", params={"fields": "alias"}).json() == {"alias": "user_2"}
+        assert client.get("/posts/99?fields=id").status_code == 404
+        assert client.get("/users/99?fields=alias").status_code == 404
+
+        assert client.get("/posts?fields=id&expand=owner").status_code == 400
+        assert client.get("/posts/1?fields=id&expand=owner").status_code == 400
+        assert client.get("/users/me/feed?fields=id&expand=owner", headers=headers).status_code == 400
+        assert client.get("/posts?fields=owner").status_code == 422
+        for method, route, stats in query_counts:
+            assert stats.statements <= ROUTE_QUERY_COUNTS[method, route], (method, route, stats.shapes)
+
+
+def budget_app(strict: bool) -> TestClient:
+    engine = create_engine("sqlite://")
+    app = FastAPI()
+    app.add_middleware(QueryBudgetMiddleware, budgets={("GET", "/many"): QueryBudget(statements=5, repeats=5)},
+                       strict=strict)
+
+    @app.get("/repeated")
+    def repeated():
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text("SELECT 1"))
+
+    @app.get("/many")
+    def many():
+        with engine.connect() as connection:
+            for i in range(3):
+                connection.execute(text(f"SELECT {i}"))
+
+    return TestClient(app)
+
+
+def test_query_budget_strict():
+    client = budget_app(strict=True)
+    assert client.get("/many").status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match="same SQL statement executed 3 times"):
+        client.get("/repeated")
+
+
+def test_query_budget_logged(caplog):
+    client = budget_app(strict=False)
+    assert client.get("/repeated").status_code == 200
+    assert "GET /repeated exceeded its query budget" in caplog.text
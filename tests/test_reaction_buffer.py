@@ -0,0 +1,191 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from fastapi_social_network import crud, crud_async, reaction_buffer, schemas
+from fastapi_social_network.database import Base, get_async_url
+from fastapi_social_network.reaction_buffer import ReactionBuffer
+
+LIKE, DISLIKE, CLEAR = schemas.ReactionAction.like, schemas.ReactionAction.dislike, schemas.ReactionAction.clear
+
+
+def failing_session():
+    raise ConnectionError("database is down")
+
+
+async def setup_database(tmp_path):
+    engine = create_async_engine(get_async_url(f"sqlite:///{tmp_path / 'test.db'}"))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_local() as db:
+        users = [
+            await crud_async.create_user(db, schemas.UserCreate(alias=f"user_{i}", email=f"{i}@mail", password="p"))
+            for i in range(3)
+        ]
+        posts = [
+            await crud_async.create_user_post(db, schemas.PostCreate(body=body), user_id=users[0].id)
+            for body in ("Post", "Deleted")
+        ]
+    return engine, session_local, [user.id for user in users], posts
+
+
+def test_reaction_buffer(tmp_path, monkeypatch):
+    async def run():
+        engine, session_local, (author, reader, other), (post, deleted) = await setup_database(tmp_path)
+
+        buffer = ReactionBuffer(flush_interval=60, max_items=100, fallback_path=str(tmp_path / "fallback.ndjson"),
+                                max_pending=100, session_factory=session_local)
+        monkeypatch.setattr(reaction_buffer, "buffer", buffer)
+        await buffer.start()
+        async with session_local() as db:
+            assert (await reaction_buffer.react(db, post.id, reader, LIKE)).likes == 0
+            await reaction_buffer.react(db, post.id, reader, DISLIKE)
+            await reaction_buffer.react(db, post.id, other, LIKE)
+            await reaction_buffer.react(db, deleted.id, reader, LIKE)
+            with pytest.raises(crud.NoPermission):
+                await reaction_buffer.react(db, post.id, author, LIKE)
+            assert await reaction_buffer.react(db, 0, reader, LIKE) is None
+            await crud_async.delete_user_post(db, post_id=deleted.id, user_id=author)
+        # Last change of each (post_id, user_id) wins, changes of deleted Posts are dropped
+        assert len(buffer) == 3
+        assert await buffer.flush() == 2
+        async with session_local() as db:
+            post = await crud_async.get_post(db, post_id=post.id)
+            assert (post.likes, post.dislikes) == (1, 1)
+
+        # Changes that cannot be written on shutdown are saved, and written on next startup
+        buffer.add(post.id, other, CLEAR)
+        buffer.session_factory = failing_session
+        with pytest.raises(ConnectionError):
+            await buffer.flush()
+        assert buffer.stats() == {"pending": 1, "flushed": 2, "failures": 1, "dropped": 0}
+        await buffer.stop()
+        assert (tmp_path / "fallback.ndjson").exists() and not buffer.running
+
+        buffer = ReactionBuffer(flush_interval=0.01, max_items=100, fallback_path=str(tmp_path / "fallback.ndjson"),
+                                max_pending=100, session_factory=session_local)
+        await buffer.start()
+        assert len(buffer) == 1
+        await asyncio.sleep(0.1)
+        await buffer.stop()
+        assert not (tmp_path / "fallback.ndjson").exists()
+        async with session_local() as db:
+            post = await crud_async.get_post(db, post_id=post.id)
+            assert (post.likes, post.dislikes) == (0, 1)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_backpressure(tmp_path, monkeypatch):
+    async def run():
+        engine, session_local, (author, reader, other), (post, _) = await setup_database(tmp_path)
+        buffer = ReactionBuffer(flush_interval=60, max_items=100, fallback_path=str(tmp_path / "fallback.ndjson"),
+                                max_pending=1, session_factory=session_local)
+        monkeypatch.setattr(reaction_buffer, "buffer", buffer)
+        await buffer.start()
+        async with session_local() as db:
+            assert (await reaction_buffer.react(db, post.id, reader, LIKE)).likes == 0
+            # Changing a buffered reaction does not grow the buffer
+            assert (await reaction_buffer.react(db, post.id, reader, DISLIKE)).dislikes == 0
+            # The buffer is full, the reaction is written at once
+            assert (await reaction_buffer.react(db, post.id, other, LIKE)).likes == 1
+        assert len(buffer) == 1
+        await buffer.stop()
+        async with session_local() as db:
+            post = await crud_async.get_post(db, post_id=post.id)
+            assert (post.likes, post.dislikes) == (1, 1)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_backpressure_during_flush(tmp_path, monkeypatch):
+    async def run():
+        engine, session_local, (author, reader, other), (post, _) = await setup_database(tmp_path)
+        buffer = ReactionBuffer(flush_interval=60, max_items=100, fallback_path=str(tmp_path / "fallback.ndjson"),
+                                max_pending=1, session_factory=session_local)
+        monkeypatch.setattr(reaction_buffer, "buffer", buffer)
+        await buffer.start()
+        released = asyncio.Event()
+
+        @asynccontextmanager
+        async def failing_later_session():
+            await released.wait()
+            raise ConnectionError("database is down")
+            yield
+
+        buffer.add(post.id, reader, LIKE)
+        buffer.session_factory = failing_later_session
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0)
+        async with session_local() as db:
+            # The buffer is full, with the change of other
+            await reaction_buffer.react(db, post.id, other, LIKE)
+            assert len(buffer) == 1
+            # Being flushed, the reaction of reader is buffered rather than written before the flush fails
+            await reaction_buffer.react(db, post.id, reader, DISLIKE)
+            assert len(buffer) == 2
+            # Not being flushed, written at once
+            assert (await reaction_buffer.react(db, post.id, author, CLEAR)) is not None
+        released.set()
+        with pytest.raises(ConnectionError):
+            await flush
+        # The failed change is put back behind the newer one, which wins
+        buffer.session_factory = session_local
+        await buffer.stop()
+        async with session_local() as db:
+            post = await crud_async.get_post(db, post_id=post.id)
+            assert (post.likes, post.dislikes) == (1, 1)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_poison_changes(tmp_path, monkeypatch):
+    async def run():
+        engine, session_local, (author, reader, other), (post, deleted) = await setup_database(tmp_path)
+        poison = (deleted.id, reader)
+        apply_reactions = crud.apply_reactions
+
+        def failing_apply_reactions(db, changes):
+            if poison in changes:
+                raise ValueError("poison")
+            return apply_reactions(db, changes)
+
+        monkeypatch.setattr(crud, "apply_reactions", failing_apply_reactions)
+        buffer = ReactionBuffer(flush_interval=60, max_items=100, fallback_path=str(tmp_path / "fallback.ndjson"),
+                                max_pending=100, session_factory=session_local)
+        buffer.add(*poison, LIKE)
+        buffer.add(post.id, reader, LIKE)
+        for _ in range(reaction_buffer.MAX_ATTEMPTS):
+            with pytest.raises(ValueError):
+                await buffer.flush()
+        # Written one by one, the failing change is kept pending behind the others until it failed MAX_ATTEMPTS times
+        buffer.add(post.id, other, DISLIKE)
+        for _ in range(reaction_buffer.MAX_ATTEMPTS - 1):
+            await buffer.flush()
+            assert len(buffer) == 1
+            buffer.add(post.id, other, DISLIKE)
+        assert await buffer.flush() == 1
+        assert buffer.stats() == {"pending": 0, "flushed": 4, "failures": 6, "dropped": 1}
+        async with session_local() as db:
+            post = await crud_async.get_post(db, post_id=post.id)
+            assert (post.likes, post.dislikes) == (1, 1)
+
+        # When the database is down, only OUTAGE_PROBES changes are tried, and none is dropped
+        for user_id in range(10, 20):
+            buffer.add(post.id, user_id, LIKE)
+        buffer.session_factory = failing_session
+        for _ in range(reaction_buffer.MAX_ATTEMPTS * 2):
+            with pytest.raises(ConnectionError):
+                await buffer.flush()
+        assert buffer.stats() == {"pending": 10, "flushed": 4, "failures": 6 + reaction_buffer.MAX_ATTEMPTS * 4,
+                                  "dropped": 1}
+        await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from fastapi_social_network import dependencies
+from fastapi_social_network.database import Base, ReplicaSet, get_async_url
+
+
+def test_replica_set_round_robin():
+    replicas = ReplicaSet([lambda: "first", lambda: "second"])
+    assert [replicas.session() for _ in range(3)] == ["first", "second", "first"]
+    assert not ReplicaSet([])
+
+
+def test_read_your_writes(api_client, tmp_path, monkeypatch):
+    client = api_client
+    # The replica lags behind: it has the schema, but none of the rows written to the primary
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    replica_engine = create_async_engine(get_async_url(url))
+    session_local = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=replica_engine,
+                                 class_=AsyncSession)
+    monkeypatch.setattr(dependencies, "replicas", ReplicaSet([session_local]))
+    try:
+        user_id = client.post("/users", json={"alias": "writer", "email": "writer@mail",
+                                              "password": "pass"}).json()["id"]
+        token = client.post("/token", data={"username": "writer", "password": "pass"}).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        assert client.post("/posts", json={"body": "Just written"}, headers=auth).status_code == 200
+
+        # The writer reads from the primary, others from the replica
+        assert [post["body"] for post in client.get(f"/users/{user_id}/posts", headers=auth).json()] == \
+            ["Just written"]
+        assert client.get(f"/users/{user_id}/posts").json() == []
+        # Once the window is over, reads do not start a new one
+        dependencies.recent_writers.clear()
+        assert client.get("/users", headers=auth).status_code == 200
+        assert client.get(f"/users/{user_id}/posts", headers=auth).json() == []
+    finally:
+        replica_engine.sync_engine.dispose()
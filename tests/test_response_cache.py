@@ -0,0 +1,68 @@
+import asyncio
+
+from starlette.requests import Request
+
+from fastapi_social_network.response_cache import ResponseCache, CachedResponse
+
+
+def make_request(if_none_match: str | None = None) -> Request:
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+def test_etag_not_modified():
+    cached = CachedResponse.render({"id": 1}, headers={"X-Extra": "1"})
+    response = cached.to_response(make_request())
+    assert response.status_code == 200
+    assert response.body == b'{"id":1}'
+    assert response.headers["etag"] == cached.etag
+    assert response.headers["x-extra"] == "1"
+    response = cached.to_response(make_request(f'"other", {cached.etag}'))
+    assert response.status_code == 304
+    assert response.body == b""
+    assert cached.to_response(make_request('"other"')).status_code == 200
+    # Tag of the compressed response
+    assert cached.to_response(make_request(f"W/{cached.etag}")).status_code == 304
+
+
+def test_coalesce_concurrent_misses():
+    cache = ResponseCache(maxsize=10, ttl=10)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return CachedResponse.render(len(calls))
+
+    async def run():
+        key = cache.key("post", 1)
+        results = await asyncio.gather(*(cache.get_or_load(key, load) for _ in range(5)))
+        assert {result.body for result in results} == {b"1"}
+        assert (await cache.get_or_load(key, load)).body == b"1"
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_invalidate():
+    cache = ResponseCache(maxsize=10, ttl=10)
+    counter = iter(range(100))
+
+    async def load():
+        return CachedResponse.render(next(counter))
+
+    async def load_invalidated():
+        # Write that happened while the response was being loaded
+        cache.invalidate("post", 1)
+        return await load()
+
+    async def run():
+        assert (await cache.get_or_load(cache.key("post", 1), load)).body == b"0"
+        cache.invalidate("post", 1)
+        assert (await cache.get_or_load(cache.key("post", 1), load_invalidated)).body == b"1"
+        assert (await cache.get_or_load(cache.key("post", 1), load)).body == b"2"
+        assert (await cache.get_or_load(cache.key("posts", 10), load)).body == b"3"
+        cache.invalidate("posts")
+        assert (await cache.get_or_load(cache.key("posts", 10), load)).body == b"4"
+
+    asyncio.run(run())
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from fastapi_social_network.config import HashingExecutor
+from fastapi_social_network.security import PasswordHasher
+
+
+@pytest.mark.parametrize("executor_type", [HashingExecutor.thread, HashingExecutor.process])
+def test_password_hasher(executor_type):
+    hasher = PasswordHasher(executor_type, max_workers=2)
+
+    async def run():
+        hashed = await hasher.hash("pass")
+        results = await asyncio.gather(*(hasher.verify(password, hashed) for password in ["pass", "wrong"] * 3))
+        assert results == [True, False] * 3
+
+    try:
+        asyncio.run(run())
+        stats = hasher.stats()
+        assert stats["completed"] == 7
+        assert stats["in_flight"] == stats["queued"] == 0
+        assert stats["max_queued"] == 4
+    finally:
+        hasher.shutdown()